@@ -1,5 +1,53 @@
-from .request import CityAirRequest, Period, CAR
-from .exceptions import (
-    EmptyDataException, CityAirException, ServerException, NoAccessException,
-)
-from .utils import to_date
+"""
+Names are imported from their modules on first access, so that
+`import cityair_api` doesn't import pandas and the other heavy dependencies
+"""
+import importlib
+from typing import TYPE_CHECKING
+
+# public name: module it's imported from
+_EXPORTS = {
+        'CityAirRequest': 'request', 'Period': 'request', 'CAR': 'request',
+        'AsyncCityAirRequest': 'async_request', 'ACAR': 'async_request',
+        'PacketsCache': 'cache',
+        'ArrowExporter': 'export',
+        'MetricsAggregator': 'metrics', 'OpenTelemetryHook': 'metrics',
+        'ThroughputMeter': 'metrics',
+        'FeedWatcher': 'watch',
+        'EmptyDataException': 'exceptions', 'CityAirException': 'exceptions',
+        'ServerException': 'exceptions', 'NoAccessException': 'exceptions',
+        'to_date': 'utils',
+        }
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .request import CityAirRequest, Period, CAR
+    from .async_request import AsyncCityAirRequest, ACAR
+    from .cache import PacketsCache
+    from .export import ArrowExporter
+    from .metrics import (
+        MetricsAggregator, OpenTelemetryHook, ThroughputMeter,
+    )
+    from .watch import FeedWatcher
+    from .exceptions import (
+        EmptyDataException, CityAirException, ServerException,
+        NoAccessException,
+    )
+    from .utils import to_date
+
+
+def __getattr__(name: str):
+    try:
+        module_name = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute "
+                             f"{name!r}") from None
+    value = getattr(importlib.import_module(f".{module_name}", __name__),
+                    name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,717 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import random
+import time
+from pprint import pformat
+from functools import partial
+from itertools import chain
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .exceptions import CityAirException, EmptyDataException, \
+    TimeoutException, anonymize_request
+from .geo import Coordinate
+from .lazy import lazy_import
+from .request import (
+    CityAirRequest, Period, _check_checkinfos_format, _clip_logs,
+    _concat_checkinfos, _format_checkinfos, _format_resampled,
+    _logs_windows, _with_resume_info,
+    )
+from .settings import (
+    DEFAULT_BACKOFF_FACTOR, DEFAULT_HOST, DEFAULT_LOGS_TAKE_COUNT,
+    DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES, DEFAULT_METADATA_TTL,
+    DEFAULT_POOL_SIZE, DEVICES_PACKETS_URL, DEVICES_URL, FULL_LOGS_URL,
+    LOGS_URL, PAGE_WINDOWS_PER_WORKER, RETRY_STATUS_CODES,
+    STATIONS_PACKETS_URL, STATIONS_URL,
+    )
+from .utils import (
+    Pager, Resampler, compact_df, progress_updater, split_dates, to_date,
+    to_timedelta,
+    )
+
+aiohttp = lazy_import('aiohttp', optional=True)
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow', optional=True)
+
+
+class AsyncCityAirRequest(CityAirRequest):
+    """
+    Asyncio client for accessing data of CityAir.io project, coroutines
+    mirror the methods of CityAirRequest and return the same results
+
+    Usage::
+
+        async with AsyncCityAirRequest(token) as R:
+            dfs = await asyncio.gather(*[R.get_device_data(serial)
+                                         for serial in await R.get_devices()])
+    """
+
+    def __init__(self, token=None, host_url=DEFAULT_HOST, timeout=100,
+                 verify_ssl=True, silent=False,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 metadata_cache_dir=None, metadata_ttl=DEFAULT_METADATA_TTL,
+                 hooks=None):
+        """
+        Parameters
+        ----------
+        token, host_url, timeout, verify_ssl, silent, max_retries,
+        backoff_factor, metadata_cache_dir, metadata_ttl, hooks:
+            see CityAirRequest
+        max_concurrency: int, default {DEFAULT_MAX_CONCURRENCY}
+            max number of requests running at the same time, all the other
+            coroutines are waiting for their turn
+        """
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for AsyncCityAirRequest, "
+                              "install it with `pip install aiohttp`")
+        super().__init__(token=token, host_url=host_url, timeout=timeout,
+                         verify_ssl=verify_ssl, silent=silent,
+                         max_retries=max_retries,
+                         backoff_factor=backoff_factor,
+                         metadata_cache_dir=metadata_cache_dir,
+                         metadata_ttl=metadata_ttl, hooks=hooks)
+        self.max_concurrency = max_concurrency
+        self._client = None
+        self._loop = None
+        self._semaphore = None
+        self._metadata_lock = None
+        self._is_metadata_loaded = False
+
+    async def _aget_client(self) -> 'aiohttp.ClientSession':
+        # aiohttp objects should be created inside of the running loop, i.e.
+        # again for every asyncio.run
+        loop = asyncio.get_running_loop()
+        if (self._client is None or self._client.closed
+                or self._loop is not loop):
+            stale_client = self._client
+            self._loop = loop
+            connector_kwargs = {} if self.verify_ssl else {'ssl': False}
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             **connector_kwargs)
+            self._client = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                    headers={'Accept-Encoding': 'gzip, deflate'})
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._metadata_lock = asyncio.Lock()
+            if stale_client is not None and not stale_client.closed:
+                # the session of the previous loop
+                await stale_client.close()
+        return self._client
+
+    async def aclose(self):
+        """
+        Closes pooled connections to the server
+        """
+        if self._client is not None:
+            await self._client.close()
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def _apost(self, url: str, body: dict, record: dict = None
+                     ) -> requests.models.Response:
+        """
+        Async counterpart of CityAirRequest._post, the server response is
+        wrapped into requests.models.Response to share response parsing and
+        exceptions with CityAirRequest
+        """
+        record = {} if record is None else record
+        client = await self._aget_client()
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            record.update(attempts=attempt + 1, retries=attempt)
+            try:
+                async with self._semaphore:
+                    async with client.post(url, json=body) as client_response:
+                        content = await client_response.read()
+            except asyncio.TimeoutError as e:
+                # goes first: aiohttp.ServerTimeoutError is ClientError too
+                if is_last_attempt:
+                    raise TimeoutException(url, self.timeout) from e
+                reason = "timeout"
+            except aiohttp.ClientError as e:
+                if is_last_attempt:
+                    raise CityAirException(f"Got connection error: {e}") \
+                        from e
+                reason = str(e)
+            else:
+                if (client_response.status not in RETRY_STATUS_CODES
+                        or is_last_attempt):
+                    break
+                reason = f"response code {client_response.status}"
+            delay = random.uniform(0, self.backoff_factor * 2 ** attempt)
+            self.logger.info("retrying request to %s in %.2f seconds (%s)",
+                             url, delay, reason)
+            await asyncio.sleep(delay)
+        record.update(status=client_response.status, size=len(content))
+        response = requests.models.Response()
+        response.status_code = client_response.status
+        response.reason = client_response.reason
+        response.headers = CaseInsensitiveDict(client_response.headers)
+        response.url = url
+        response._content = content
+        response.request = requests.Request('POST', url, json=body).prepare()
+        return response
+
+    async def _amake_request(self, method_url: str, *keys: str,
+                             silent: bool = True, **kwargs: object):
+        """
+        Async counterpart of CityAirRequest._make_request
+        """
+        body = {"Token": getattr(self, 'token'), **kwargs}
+        url = f"{self.host_url}/{method_url}"
+        with self._request_span(method_url, url, body) as record:
+            response = await self._apost(url, body, record)
+            self.logger.debug("post request to url: %s\n"
+                              "body:%s", url,
+                              pformat(anonymize_request(body)))
+            return self._parse_response(response, body, keys, silent,
+                                        record)
+
+    async def _aget_metadata(self, name: str, method_url: str,
+                             *keys: str) -> dict:
+        """
+        Async counterpart of CityAirRequest._get_metadata
+        """
+        cache_key = f"{self._metadata_key}_{name}"
+        data = self._metadata_cache.load(cache_key)
+        if data is None:
+            data = dict(zip(keys, await self._amake_request(method_url,
+                                                            *keys)))
+            self._metadata_cache.store(cache_key, data)
+        self._track_metadata_expiration(cache_key)
+        return data
+
+    async def _load_metadata(self):
+        """
+        Fetches devices and stations metadata if it's not loaded or
+        expired, so that cached lookups of CityAirRequest never make
+        blocking requests
+        """
+        await self._aget_client()
+        async with self._metadata_lock:
+            self._check_metadata()
+            if self._is_metadata_loaded:
+                return
+            self._devices_metadata, self._stations_metadata = \
+                await asyncio.gather(
+                    self._aget_metadata('devices', DEVICES_URL, "Devices",
+                                        "PacketsValueTypes"),
+                    self._aget_metadata('stations', STATIONS_URL,
+                                        "Locations", "MoItems", "Devices",
+                                        "PacketValueTypes"))
+            self._is_metadata_loaded = True
+
+    def _drop_metadata(self):
+        super()._drop_metadata()
+        self._is_metadata_loaded = False
+
+    async def _aiter_pages(self, fetch, pager: Pager, on_progress=None
+                           ) -> AsyncIterator[List[dict]]:
+        """
+        Async counterpart of utils.iter_pages, `fetch` is a coroutine
+        function
+        """
+        while not pager.is_finished:
+            started = time.perf_counter()
+            try:
+                packets = await fetch(**pager.kwargs)
+            except EmptyDataException:
+                packets = []
+            except TimeoutException:
+                if pager.shrink():
+                    self.logger.info("page timed out, retrying with "
+                                     "take_count %d", pager.take_count)
+                    continue
+                raise
+            progress = pager.update(packets, time.perf_counter() - started)
+            if on_progress:
+                on_progress(progress)
+            packets = pager.clip(packets)
+            if packets:
+                yield packets
+
+    @staticmethod
+    async def _aiter_pages_by_id(fetch, last_packet_id: int = 0,
+                                 take_count: int = 500
+                                 ) -> AsyncIterator[List[dict]]:
+        """
+        Async counterpart of utils.iter_pages_by_id, `fetch` is a coroutine
+        function
+        """
+        while True:
+            try:
+                packets = await fetch(last_packet_id=last_packet_id,
+                                      take_count=take_count)
+            except EmptyDataException:
+                return
+            if not packets:
+                return
+            yield packets
+            last_packet_id = max(packet['PacketId'] for packet in packets)
+
+    async def _afetch_pages(self, fetch, start_date, finish_date=None,
+                            take_count: int = 500, workers: int = 1,
+                            verbose: bool = True, label: str = '',
+                            on_page=None, first_date=None
+                            ) -> Optional[List[dict]]:
+        """
+        Async counterpart of utils.fetch_pages, windows of the range are
+        requested by `workers` concurrent coroutines
+        """
+        start_date = max(filter(None, [to_date(start_date),
+                                       to_date(first_date)]))
+        finish_date = to_date(finish_date or datetime.datetime.utcnow())
+        update_bar = progress_updater(start_date, finish_date, verbose,
+                                      label)
+        windows_semaphore = asyncio.Semaphore(max(workers, 1))
+
+        async def fetch_window(window):
+            pager = Pager(*window, take_count=take_count,
+                          closed=window[1] >= finish_date)
+            packets = []
+            count = 0
+            async with windows_semaphore:
+                async for page in self._aiter_pages(fetch, pager,
+                                                    update_bar):
+                    if on_page is None:
+                        packets += page
+                    else:
+                        on_page(page)
+                    count += len(page)
+            return packets if on_page is None else count
+
+        if workers > 1:
+            windows = split_dates(start_date, finish_date,
+                                  workers * PAGE_WINDOWS_PER_WORKER)
+        else:
+            windows = [(start_date, finish_date)]
+        results = await asyncio.gather(*map(fetch_window, windows))
+        if on_page is None:
+            packets = list(chain.from_iterable(results))
+            count = len(packets)
+        else:
+            packets = None
+            count = sum(results)
+        self.logger.info(f'finished acquiring {label} data of size {count}')
+        if not count:
+            raise EmptyDataException(item=label)
+        return packets
+
+    async def get_devices(self, format: str = 'list',
+                          include_offline: bool = True,
+                          include_children: bool = False,
+                          refresh: bool = False) \
+            -> Union[List[str], pd.DataFrame, List[dict]]:
+        """
+        see CityAirRequest.get_devices
+        """
+        if refresh:
+            self.invalidate_metadata()
+        await self._load_metadata()
+        return self._prep_devices(format=format,
+                                  include_offline=include_offline,
+                                  include_children=include_children)
+
+    async def get_device_data(self, serial_number: str, start_date=None,
+                              finish_date=None, last_packet_id=None,
+                              skip_count: int = 0, take_count: int = 500,
+                              all_cols=False, format: str = 'df',
+                              verbose: bool = True, workers: int = 1,
+                              compact: Union[bool, str] = False,
+                              period: Union[datetime.timedelta, str,
+                                            None] = None,
+                              agg: Union[str, List[str]] = 'mean'
+                              ) -> Union[pd.DataFrame,
+                                         Dict[str, pd.DataFrame]]:
+        """
+        see CityAirRequest.get_device_data, windows of `workers` are requested
+        by concurrent coroutines instead of threads
+        """
+        await self._load_metadata()
+        fetch = partial(self._aget_device_packets, serial_number)
+        resampler = None
+        on_page = None
+        if period is not None and format != 'json':
+            resampler = Resampler(to_timedelta(period), agg)
+            on_page = partial(self._update_device_resampler, resampler)
+        if start_date and last_packet_id is None:
+            packets = await self._afetch_pages(
+                    fetch, start_date, finish_date, take_count=take_count,
+                    workers=workers, verbose=verbose, label=serial_number,
+                    on_page=on_page,
+                    **self._device_packets_dates.get(serial_number, {}))
+        else:
+            packets = await fetch(start_date=start_date,
+                                  finish_date=finish_date,
+                                  last_packet_id=last_packet_id,
+                                  skip_count=skip_count,
+                                  take_count=take_count)
+            if on_page is not None:
+                on_page(packets)
+        if format == 'json':
+            return list(packets)
+        if resampler is not None:
+            return self._format_resampled_device_data(
+                    resampler, serial_number, all_cols=all_cols,
+                    format=format, compact=compact)
+        return self._prep_device_data(packets, serial_number,
+                                      all_cols=all_cols, format=format,
+                                      compact=compact)
+
+    async def _aget_device_packets(self, serial_number: str,
+                                   **kwargs) -> List[dict]:
+        """
+        Async counterpart of CityAirRequest._get_device_packets
+        """
+        filter_ = self._device_packets_filter(serial_number, **kwargs)
+        return await self._amake_request(DEVICES_PACKETS_URL, 'Packets',
+                                         Filter=filter_, silent=False)
+
+    async def iter_device_data(self, serial_number: str, start_date=None,
+                               finish_date=None, last_packet_id=None,
+                               take_count: int = 500, all_cols=False,
+                               format: str = 'df',
+                               compact: Union[bool, str] = False
+                               ) -> AsyncIterator[Union[
+                                       pd.DataFrame, Dict[str, pd.DataFrame],
+                                       'pa.RecordBatch']]:
+        """
+        see CityAirRequest.iter_device_data, pages are iterated with
+        `async for`
+        """
+        await self._load_metadata()
+        fetch = partial(self._aget_device_packets, serial_number)
+        if last_packet_id is not None:
+            pages = self._aiter_pages_by_id(fetch, last_packet_id,
+                                            take_count=take_count)
+        elif start_date:
+            pages = self._aiter_pages(fetch, Pager(
+                    start_date, finish_date, take_count=take_count,
+                    **self._device_packets_dates.get(serial_number, {})))
+        else:
+            raise ValueError("either start_date or last_packet_id should be "
+                             "passed")
+        async for packets in pages:
+            data = self._prep_device_data(
+                    packets, serial_number, all_cols=all_cols,
+                    format='df' if format == 'arrow' else format,
+                    compact=compact)
+            yield _with_resume_info(data, packets, format)
+
+    async def get_devices_data(self, serial_numbers: List[str] = None,
+                               start_date=None, finish_date=None,
+                               format: str = 'df',
+                               workers: int = DEFAULT_POOL_SIZE,
+                               **kwargs) -> Union[pd.DataFrame,
+                                                  Dict[str, pd.DataFrame]]:
+        """
+        see CityAirRequest.get_devices_data, `workers` devices are requested
+        by concurrent coroutines instead of threads
+        """
+        serial_numbers = serial_numbers or await self.get_devices()
+        data = await self._afetch_many(self.get_device_data, serial_numbers,
+                                       workers, start_date=start_date,
+                                       finish_date=finish_date,
+                                       format='dict', **kwargs)
+        res = {serial: df for device_data in data.values()
+               for serial, df in device_data.items()}
+        return self._format_many(res, format, 'serial_number')
+
+    async def _afetch_many(self, method, items: list, workers: int,
+                           **kwargs) -> dict:
+        """
+        Async counterpart of CityAirRequest._fetch_many, `method` is a
+        coroutine function called by `workers` concurrent coroutines
+        """
+        semaphore = asyncio.Semaphore(max(workers, 1))
+
+        async def fetch(item):
+            async with semaphore:
+                try:
+                    return await method(item, verbose=False, **kwargs)
+                except EmptyDataException:
+                    self.logger.warning("There are no data for %s", item)
+
+        res = dict(zip(items, await asyncio.gather(*map(fetch, items))))
+        res = {item: data for item, data in res.items() if data is not None}
+        if not res:
+            raise EmptyDataException(item=', '.join(map(str, items)))
+        return res
+
+    async def get_stations(self, format: str = 'list',
+                           include_offline: bool = True,
+                           include_3rd_party=False, refresh: bool = False,
+                           ) -> Union[List[str], pd.DataFrame, List[dict]]:
+        """
+        see CityAirRequest.get_stations
+        """
+        if refresh:
+            self.invalidate_metadata()
+        await self._load_metadata()
+        return self._prep_stations(format=format,
+                                   include_offline=include_offline,
+                                   include_3rd_party=include_3rd_party)
+
+    async def get_station_data(self, station_id: int,
+                               start_date: Union[str, datetime.datetime,
+                                                 None] = None,
+                               finish_date: Union[str, datetime.datetime,
+                                                  None] = None,
+                               take_count: int = 1000,
+                               period: Union[Period, datetime.timedelta,
+                                             str] = Period.TWENTY_MINS,
+                               verbose: bool = True, workers: int = 1,
+                               compact: Union[bool, str] = False,
+                               agg: Union[str, List[str]] = 'mean',
+                               format: str = 'df'
+                               ) -> Union[pd.DataFrame, List[dict]]:
+        """
+        see CityAirRequest.get_station_data, windows of `workers` are requested
+        by concurrent coroutines instead of threads
+        """
+        await self._load_metadata()
+        period, resampler = self._station_resampler(period, agg)
+        if format == 'json':
+            resampler = None
+        on_page = None
+        if resampler is not None:
+            on_page = partial(self._update_station_resampler, resampler)
+        fetch = partial(self._aget_station_packets, station_id,
+                        period=period)
+        if start_date:
+            packets = await self._afetch_pages(
+                    fetch, start_date, finish_date, take_count=take_count,
+                    workers=workers, verbose=verbose, label=str(station_id),
+                    on_page=on_page)
+        else:
+            packets = await fetch(finish_date=finish_date,
+                                  take_count=take_count)
+            if on_page is not None:
+                on_page(packets)
+        if format == 'json':
+            return list(packets)
+        if resampler is not None:
+            return _format_resampled(resampler,
+                                     partial(compact_df, compact=compact))
+        return self._prep_station_data(packets, compact=compact)
+
+    async def _aget_station_packets(self, station_id: int,
+                                    **kwargs) -> List[dict]:
+        """
+        Async counterpart of CityAirRequest._get_station_packets
+        """
+        filter_ = self._station_packets_filter(station_id, **kwargs)
+        return await self._amake_request(STATIONS_PACKETS_URL, 'Packets',
+                                         Filter=filter_, silent=False)
+
+    async def iter_station_data(self, station_id: int,
+                                start_date: Union[str, datetime.datetime,
+                                                  None] = None,
+                                finish_date: Union[str, datetime.datetime,
+                                                   None] = None,
+                                take_count: int = 1000,
+                                period: Period = Period.TWENTY_MINS,
+                                format: str = 'df',
+                                compact: Union[bool, str] = False
+                                ) -> AsyncIterator[Union[pd.DataFrame,
+                                                         'pa.RecordBatch']]:
+        """
+        see CityAirRequest.iter_station_data, pages are iterated with
+        `async for`
+        """
+        await self._load_metadata()
+        start_date = start_date or (datetime.datetime.now()
+                                    - datetime.timedelta(weeks=1))
+        fetch = partial(self._aget_station_packets, station_id,
+                        period=period)
+        async for packets in self._aiter_pages(fetch, Pager(
+                start_date, finish_date, take_count=take_count)):
+            yield _with_resume_info(
+                    self._prep_station_data(packets, compact=compact),
+                    packets, format)
+
+    async def get_stations_data(self, station_ids: List[int] = None,
+                                start_date: Union[str, datetime.datetime,
+                                                  None] = None,
+                                finish_date: Union[str, datetime.datetime,
+                                                   None] = None,
+                                format: str = 'df',
+                                workers: int = DEFAULT_POOL_SIZE,
+                                **kwargs) -> Union[pd.DataFrame,
+                                                   Dict[int, pd.DataFrame]]:
+        """
+        see CityAirRequest.get_stations_data, `workers` stations are
+        requested by concurrent coroutines instead of threads
+        """
+        station_ids = station_ids or await self.get_stations()
+        res = await self._afetch_many(self.get_station_data, station_ids,
+                                      workers, start_date=start_date,
+                                      finish_date=finish_date, **kwargs)
+        return self._format_many(res, format, 'station_id')
+
+    async def get_device_logs(self, serial_number: str, start_date=None,
+                              finish_date=None, kind: str = None,
+                              full: bool = False,
+                              take_count: int = DEFAULT_LOGS_TAKE_COUNT,
+                              workers: int = 1) -> pd.DataFrame:
+        """
+        see CityAirRequest.get_device_logs, windows of `workers` are
+        requested by concurrent coroutines instead of threads
+        """
+        frames = await self._afetch_logs(serial_number, start_date,
+                                         finish_date, kind=kind, full=full,
+                                         take_count=take_count,
+                                         workers=workers,
+                                         on_page=partial(self._prep_logs,
+                                                         kind=kind))
+        if not frames:
+            raise EmptyDataException(item=serial_number)
+        return pd.concat(frames).sort_index()
+
+    async def _afetch_logs(self, serial_number: str, start_date,
+                           finish_date, on_page, kind: str = None,
+                           full: bool = False,
+                           take_count: int = DEFAULT_LOGS_TAKE_COUNT,
+                           workers: int = 1) -> list:
+        """
+        Async counterpart of CityAirRequest._fetch_logs, windows are
+        requested by concurrent coroutines
+        """
+        await self._load_metadata()
+        url = FULL_LOGS_URL if full else LOGS_URL
+        finish_date, windows = _logs_windows(start_date, finish_date, kind,
+                                             workers)
+
+        async def fetch_window(window):
+            res, skip = [], 0
+            while True:
+                filter_ = self._logs_filter(serial_number, *window,
+                                            kind=kind, skip=skip,
+                                            take_count=take_count)
+                try:
+                    items = await self._amake_request(url, 'LogItems',
+                                                      Filter=filter_,
+                                                      silent=False)
+                except EmptyDataException:
+                    break
+                page_size = len(items)
+                items = _clip_logs(items, window, finish_date)
+                if items:
+                    res.append(on_page(items))
+                if page_size < take_count:
+                    break
+                skip += take_count
+            return res
+
+        results = await asyncio.gather(*map(fetch_window, windows))
+        return [res for window_res in results for res in window_res]
+
+    async def get_checkinfos(self, serial_numbers: List[str] = None,
+                             start_date=None, finish_date=None,
+                             format: str = 'df', errors_only: bool = False,
+                             workers: int = DEFAULT_POOL_SIZE,
+                             take_count: int = DEFAULT_LOGS_TAKE_COUNT
+                             ) -> pd.DataFrame:
+        """
+        see CityAirRequest.get_checkinfos, `workers` devices are requested
+        by concurrent coroutines instead of threads
+        """
+        _check_checkinfos_format(format)
+        serial_numbers = serial_numbers or await self.get_devices()
+        res = await self._afetch_many(self._adevice_checkinfos,
+                                      serial_numbers, workers,
+                                      start_date=start_date,
+                                      finish_date=finish_date,
+                                      errors_only=errors_only,
+                                      take_count=take_count)
+        return _format_checkinfos(res, format)
+
+    async def _adevice_checkinfos(self, serial_number: str, start_date=None,
+                                  finish_date=None, errors_only: bool = False,
+                                  take_count: int = DEFAULT_LOGS_TAKE_COUNT,
+                                  verbose: bool = False) -> pd.DataFrame:
+        """
+        Async counterpart of CityAirRequest._device_checkinfos
+        """
+        frames = await self._afetch_logs(
+                serial_number, start_date, finish_date,
+                on_page=partial(self._prep_checkinfos,
+                                errors_only=errors_only),
+                kind='checkinfo', full=True, take_count=take_count)
+        return _concat_checkinfos(frames, serial_number)
+
+    async def get_locations(self, refresh: bool = False) -> List[dict]:
+        """
+        see CityAirRequest.get_locations
+        """
+        if refresh:
+            self.invalidate_metadata()
+        await self._load_metadata()
+        return self._prep_locations()
+
+    async def nearest_stations(self, latitude: Coordinate,
+                               longitude: Coordinate, k: int = 1,
+                               refresh: bool = False) -> pd.DataFrame:
+        """
+        see CityAirRequest.nearest_stations
+        """
+        if refresh:
+            self.invalidate_metadata()
+        await self._load_metadata()
+        return super().nearest_stations(latitude, longitude, k)
+
+    async def stations_in_bbox(self, min_latitude: Coordinate,
+                               min_longitude: Coordinate,
+                               max_latitude: Coordinate,
+                               max_longitude: Coordinate,
+                               refresh: bool = False
+                               ) -> Union[List[int], List[List[int]]]:
+        """
+        see CityAirRequest.stations_in_bbox
+        """
+        if refresh:
+            self.invalidate_metadata()
+        await self._load_metadata()
+        return super().stations_in_bbox(min_latitude, min_longitude,
+                                        max_latitude, max_longitude)
+
+    async def nearest_devices(self, latitude: Coordinate,
+                              longitude: Coordinate, k: int = 1,
+                              refresh: bool = False) -> pd.DataFrame:
+        """
+        see CityAirRequest.nearest_devices
+        """
+        if refresh:
+            self.invalidate_metadata()
+        await self._load_metadata()
+        return super().nearest_devices(latitude, longitude, k)
+
+    async def devices_in_bbox(self, min_latitude: Coordinate,
+                              min_longitude: Coordinate,
+                              max_latitude: Coordinate,
+                              max_longitude: Coordinate,
+                              refresh: bool = False
+                              ) -> Union[List[str], List[List[str]]]:
+        """
+        see CityAirRequest.devices_in_bbox
+        """
+        if refresh:
+            self.invalidate_metadata()
+        await self._load_metadata()
+        return super().devices_in_bbox(min_latitude, min_longitude,
+                                       max_latitude, max_longitude)
+
+
+ACAR = AsyncCityAirRequest
@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Dict, List, Optional, Tuple, Union
+
+from .exceptions import EmptyDataException
+from .lazy import lazy_import
+from .request import CityAirRequest, Period
+from .settings import (
+    DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_PACKETS, DEFAULT_CACHE_TTL,
+    )
+from .utils import fetch_pages, iter_pages_by_id, loads_json, to_date
+
+pd = lazy_import('pandas')
+
+DEVICE = 'device'
+STATION = 'station'
+EPOCH = datetime(1970, 1, 1)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packets (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    packet_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    packet TEXT NOT NULL,
+    PRIMARY KEY (source, key, packet_id)
+);
+CREATE INDEX IF NOT EXISTS packets_date ON packets (source, key, date);
+CREATE TABLE IF NOT EXISTS series (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    synced_at REAL,
+    accessed_at REAL,
+    PRIMARY KEY (source, key)
+);
+"""
+
+
+class PacketsCache:
+    """
+    Persistent local storage of raw device and station packets
+
+    Packets are kept in sqlite database under `cache_dir`, so that
+    sync_device/sync_station/sync request only the packets newer than the
+    stored ones (by LastPacketId for devices, by date for stations) and
+    get_device_data/get_station_data are served from the local data.
+
+    Series (device or station with a period) which were not accessed for
+    `ttl` are evicted, as well as the least recently accessed series if
+    there are more than `max_packets` packets stored. Eviction runs after
+    sync and after every read of get_device_data/get_station_data.
+
+    Usage::
+
+        cache = PacketsCache(CityAirRequest(token))
+        cache.sync_device('CA01PM000123', start_date='2020.01.01')
+        ...
+        df = cache.get_device_data('CA01PM000123', start_date='2020.03.01')
+    """
+
+    def __init__(self, request: CityAirRequest, cache_dir: str = None,
+                 ttl: timedelta = DEFAULT_CACHE_TTL,
+                 max_packets: int = DEFAULT_CACHE_MAX_PACKETS):
+        """
+        Parameters
+        ----------
+        request: CityAirRequest
+            used to request packets from the server
+        cache_dir: str, default {DEFAULT_CACHE_DIR}
+            directory for the database, every host and token have their own
+            database
+        ttl: datetime.timedelta, default {DEFAULT_CACHE_TTL}
+            series not accessed longer than ttl are evicted
+        max_packets: int, default {DEFAULT_CACHE_MAX_PACKETS}
+            max number of packets stored
+        """
+        self.request = request
+        self.ttl = ttl
+        self.max_packets = max_packets
+        cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        os.makedirs(cache_dir, exist_ok=True)
+        # packets depend on the access rights, see
+        # CityAirRequest._metadata_key
+        self.path = os.path.join(cache_dir,
+                                 f"packets_{request._metadata_key}.sqlite")
+        self.logger = logging.getLogger(__name__)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def _bounds(self, source: str, key: str) -> Tuple[Optional[int],
+                                                      Optional[str]]:
+        """
+        Returns max packet_id and min date of the stored series
+        """
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT MAX(packet_id), MIN(date) "
+                                "FROM packets WHERE source = ? AND key = ?",
+                                (source, key)).fetchone()
+
+    def _store(self, source: str, key: str,
+               rows: List[Tuple[int, str, dict]]) -> int:
+        """
+        Stores (packet_id, date, packet) rows of the series, returns number
+        of the packets which were not stored before
+        """
+        with closing(self._connect()) as conn, conn:
+            count = conn.executemany(
+                    "INSERT OR IGNORE INTO packets VALUES (?, ?, ?, ?, ?)",
+                    [(source, key, packet_id, date, json.dumps(packet))
+                     for packet_id, date, packet in rows]).rowcount
+            conn.execute("INSERT OR IGNORE INTO series VALUES (?, ?, ?, ?)",
+                         (source, key, None, time.time()))
+            conn.execute("UPDATE series SET synced_at = ? "
+                         "WHERE source = ? AND key = ?",
+                         (time.time(), source, key))
+        return count
+
+    def _load(self, source: str, key: str, start_date=None,
+              finish_date=None) -> List[dict]:
+        query = ("SELECT packet FROM packets WHERE source = ? AND key = ?")
+        params = [source, key]
+        if start_date:
+            query += " AND date >= ?"
+            params.append(to_date(start_date, format='str'))
+        if finish_date:
+            query += " AND date <= ?"
+            params.append(to_date(finish_date, format='str'))
+        query += " ORDER BY date"
+        with closing(self._connect()) as conn, conn:
+            packets = [loads_json(packet) for packet,
+                       in conn.execute(query, params)]
+            conn.execute("UPDATE series SET accessed_at = ? "
+                         "WHERE source = ? AND key = ?",
+                         (time.time(), source, key))
+        return packets
+
+    def sync_device(self, serial_number: str, start_date=None,
+                    take_count: int = 500) -> int:
+        """
+        Requests packets of the device newer than the stored ones
+
+        Parameters
+        ----------
+        serial_number: str
+            serial_number of the device
+        start_date: str or datetime.datetime, default None
+            date to start from if there are no packets of the device
+            stored yet (the whole history of the device is requested if
+            not passed) or date to backfill the stored packets from
+        take_count: int, default 500
+            count of packets requested at once
+        Returns
+        -------
+            number of new packets
+        """
+        self.request._check_metadata()
+        last_packet_id, first_date = self._bounds(DEVICE, serial_number)
+        fetch = partial(self.request._get_device_packets, serial_number)
+        count = 0
+        if start_date and (first_date is None
+                           or to_date(start_date) < to_date(first_date)):
+            # backfilling history before the stored packets
+            try:
+                packets = fetch_pages(
+                        fetch, start_date, first_date, take_count=take_count,
+                        verbose=False, label=serial_number,
+                        first_date=self.request._device_packets_dates.get(
+                                serial_number, {}).get('first_date'))
+            except EmptyDataException:
+                packets = []
+            count += self._store(DEVICE, serial_number, [
+                    (packet['PacketId'], packet['SendDate'], packet)
+                    for packet in packets])
+            if last_packet_id is None and packets:
+                last_packet_id = max(packet['PacketId']
+                                     for packet in packets)
+        for packets in iter_pages_by_id(fetch, last_packet_id or 0,
+                                        take_count=take_count):
+            count += self._store(DEVICE, serial_number, [
+                    (packet['PacketId'], packet['SendDate'], packet)
+                    for packet in packets])
+        self.logger.info("synced %d new packets of %s", count, serial_number)
+        return count
+
+    def sync_station(self, station_id: int,
+                     period: Period = Period.TWENTY_MINS, start_date=None,
+                     take_count: int = 1000) -> int:
+        """
+        Requests packets of the station newer than the stored ones
+
+        Parameters
+        ----------
+        station_id: int
+            id of the station
+        period: Period (enum), default cityair_api.Period.TWENTY_MINS
+            every period is stored separately
+        start_date: str or datetime.datetime, default None
+            date to start from if there are no packets of the station
+            stored yet (a week ago if not passed) or date to backfill the
+            stored packets from
+        take_count: int, default 1000
+            count of packets requested at once
+        Returns
+        -------
+            number of new packets
+        """
+        key = _station_key(station_id, period)
+        last_timestamp, first_date = self._bounds(STATION, key)
+        fetch = partial(self.request._get_station_packets, station_id,
+                        period=period)
+        ranges = []
+        if last_timestamp is None:
+            ranges.append((start_date or datetime.now() - timedelta(weeks=1),
+                           None))
+        else:
+            if start_date and to_date(start_date) < to_date(first_date):
+                ranges.append((start_date, first_date))
+            ranges.append((EPOCH + timedelta(seconds=last_timestamp + 1),
+                           None))
+        packets = []
+        for range_start_date, range_finish_date in ranges:
+            try:
+                packets += fetch_pages(fetch, range_start_date,
+                                       range_finish_date,
+                                       take_count=take_count, verbose=False,
+                                       label=str(station_id))
+            except EmptyDataException:
+                pass
+        count = self._store(STATION, key, [
+                (_timestamp(packet['SendDate']), packet['SendDate'], packet)
+                for packet in packets])
+        self.logger.info("synced %d new packets of station %s", count,
+                         station_id)
+        return count
+
+    def sync(self, serial_numbers: List[str] = None,
+             station_ids: List[int] = None,
+             period: Period = Period.TWENTY_MINS) -> Dict[str, int]:
+        """
+        Syncs passed devices and stations and all the series stored before,
+        then evicts expired series
+
+        Returns
+        -------
+            dictionary of new packets count by serial_number or station key
+        """
+        with closing(self._connect()) as conn, conn:
+            series = conn.execute("SELECT source, key FROM series").fetchall()
+        devices = set(serial_numbers or []) | {key for source, key in series
+                                               if source == DEVICE}
+        stations = {_station_key(station_id, period)
+                    for station_id in station_ids or []}
+        stations |= {key for source, key in series if source == STATION}
+        res = {}
+        for serial_number in sorted(devices):
+            res[serial_number] = self.sync_device(serial_number)
+        for key in sorted(stations):
+            station_id, period_name = key.split(':')
+            res[key] = self.sync_station(int(station_id),
+                                         period=Period[period_name])
+        self.evict()
+        return res
+
+    def get_device_data(self, serial_number: str, start_date=None,
+                        finish_date=None, all_cols=False,
+                        format: str = 'df', sync: bool = True,
+                        compact: Union[bool, str] = False
+                        ) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+        """
+        Provides data of the device from the local storage, see
+        CityAirRequest.get_device_data for the args description
+
+        Parameters
+        ----------
+        sync: bool, default True
+            whether to sync the device before reading local data
+        -------"""
+        if sync:
+            self.sync_device(serial_number, start_date=start_date)
+        packets = self._load(DEVICE, serial_number, start_date, finish_date)
+        self.evict()
+        if not packets:
+            raise EmptyDataException(item=serial_number)
+        return self.request._prep_device_data(packets, serial_number,
+                                              all_cols=all_cols,
+                                              format=format,
+                                              compact=compact)
+
+    def get_station_data(self, station_id: int, start_date=None,
+                         finish_date=None,
+                         period: Period = Period.TWENTY_MINS,
+                         sync: bool = True,
+                         compact: Union[bool, str] = False) -> pd.DataFrame:
+        """
+        Provides data of the station from the local storage, see
+        CityAirRequest.get_station_data for the args description
+
+        Parameters
+        ----------
+        sync: bool, default True
+            whether to sync the station before reading local data
+        -------"""
+        if sync:
+            self.sync_station(station_id, period=period,
+                              start_date=start_date)
+        packets = self._load(STATION, _station_key(station_id, period),
+                             start_date, finish_date)
+        self.evict()
+        if not packets:
+            raise EmptyDataException(item=str(station_id))
+        return self.request._prep_station_data(packets, compact=compact)
+
+    def evict(self):
+        """
+        Removes series not accessed longer than ttl and the least recently
+        accessed series while there are more than max_packets stored
+        """
+        expired_at = time.time() - self.ttl.total_seconds()
+        with closing(self._connect()) as conn, conn:
+            expired = conn.execute("SELECT source, key FROM series "
+                                   "WHERE accessed_at < ?",
+                                   (expired_at,)).fetchall()
+            counts = conn.execute(
+                    "SELECT series.source, series.key, COUNT(packet_id) "
+                    "FROM series LEFT JOIN packets "
+                    "ON series.source = packets.source "
+                    "AND series.key = packets.key "
+                    "GROUP BY series.source, series.key "
+                    "ORDER BY series.accessed_at").fetchall()
+        to_evict = set(expired)
+        total = sum(count for *_, count in counts)
+        for source, key, count in counts:
+            if total <= self.max_packets:
+                break
+            if (source, key) not in to_evict:
+                to_evict.add((source, key))
+                total -= count
+        for source, key in to_evict:
+            self.invalidate(source, key)
+        if to_evict:
+            self.logger.info("evicted %d series from cache", len(to_evict))
+
+    def invalidate(self, source: str = None, key: str = None):
+        """
+        Removes stored packets of the series, all the series if source is not
+        passed
+
+        Parameters
+        ----------
+        source: {'device', 'station'}, default None
+        key: str, default None
+            serial_number of the device or "{station_id}:{period name}",
+            all the series of the source if not passed
+        """
+        condition, params = "", []
+        if source:
+            condition, params = " WHERE source = ?", [source]
+            if key:
+                condition += " AND key = ?"
+                params.append(key)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM packets" + condition, params)
+            conn.execute("DELETE FROM series" + condition, params)
+
+
+def _station_key(station_id: int, period: Period) -> str:
+    return f"{station_id}:{period.name}"
+
+
+def _timestamp(date: str) -> int:
+    return int((to_date(date) - EPOCH).total_seconds())
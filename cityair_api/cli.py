@@ -0,0 +1,146 @@
+"""
+cityair-export command: writes packets of devices and stations to
+datasets partitioned by device (station) and day, see ArrowExporter::
+
+    cityair-export --devices all --start 2020-01-01 --finish 2020-02-01 \\
+        --output data --format csv --workers 20
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+from .exceptions import CityAirException
+from .export import FORMATS, ArrowExporter
+from .metrics import ThroughputMeter
+from .request import CityAirRequest, Period
+from .settings import (
+    DEFAULT_HOST, DEFAULT_POOL_SIZE, DEFAULT_REPORT_INTERVAL, TOKEN_VAR_NAME,
+    )
+
+ALL = 'all'
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+            prog='cityair-export',
+            description="Exports packets of CityAir devices and stations to "
+                        "OUTPUT/devices/serial_number=SERIAL/day=YYYY-MM-DD "
+                        "and OUTPUT/stations/station_id=ID/day=YYYY-MM-DD "
+                        "files, writing every page as soon as it's "
+                        "received")
+    parser.add_argument('--devices', nargs='+', metavar='SERIAL',
+                        help=f"serial numbers of the devices or '{ALL}'")
+    parser.add_argument('--stations', nargs='+', metavar='ID',
+                        help=f"ids of the stations or '{ALL}'")
+    parser.add_argument('-s', '--start', required=True,
+                        help="start date, i.e. 2020-01-01")
+    parser.add_argument('-f', '--finish',
+                        help="finish date, now by default")
+    parser.add_argument('-o', '--output', default='.',
+                        help="directory of the datasets, current by default")
+    parser.add_argument('--format', choices=FORMATS, default=FORMATS[0],
+                        help="format of the files, default %(default)s")
+    parser.add_argument('-w', '--workers', type=int,
+                        default=DEFAULT_POOL_SIZE,
+                        help="number of devices (stations) exported at the "
+                             "same time, default %(default)s")
+    parser.add_argument('--period', default=Period.TWENTY_MINS.name.lower(),
+                        choices=[period.name.lower() for period in Period],
+                        help="period of the stations data, "
+                             "default %(default)s")
+    parser.add_argument('--all-cols', action='store_true',
+                        help="keep service columns of the devices packets")
+    parser.add_argument('--token',
+                        help=f"CityAir token, {TOKEN_VAR_NAME} environment "
+                             f"variable by default")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help="url of the CityAir API")
+    parser.add_argument('--report-interval', type=float,
+                        default=DEFAULT_REPORT_INTERVAL.total_seconds(),
+                        help="seconds between throughput reports, 0 not to "
+                             "report till the end, default %(default)s")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="log requests")
+    args = parser.parse_args(argv)
+    if not args.devices and not args.stations:
+        parser.error("either --devices or --stations should be passed")
+    try:
+        _items(args.stations or [], int)
+    except ValueError:
+        parser.error(f"station ids should be integers or '{ALL}'")
+    return args
+
+
+def _items(values: List[str], type_=str) -> Optional[list]:
+    """
+    Parsed values of --devices (--stations), None for 'all'
+    """
+    if ALL in values:
+        return None
+    return [type_(value) for value in values]
+
+
+@contextmanager
+def report_throughput(meter: ThroughputMeter, interval: float):
+    """
+    Prints the meter to stderr every `interval` seconds within the block
+    """
+    stopped = threading.Event()
+
+    def report():
+        while not stopped.wait(interval):
+            print(meter, file=sys.stderr, flush=True)
+
+    thread = threading.Thread(target=report, daemon=True)
+    if interval > 0:
+        thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        if thread.is_alive():
+            thread.join()
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Runs cityair-export, returns exit code: 0 if any data were exported,
+    1 if there were no data, 2 on errors
+    """
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose
+                        else logging.WARNING)
+    meter = ThroughputMeter()
+    try:
+        request = CityAirRequest(args.token, host_url=args.host,
+                                 silent=True, pool_size=args.workers,
+                                 hooks=[meter])
+        exporter = ArrowExporter(request)
+    except (ValueError, ImportError) as e:
+        print(f"cityair-export: {e}", file=sys.stderr)
+        return 2
+    kwargs = dict(format=args.format, workers=args.workers,
+                  start_date=args.start, finish_date=args.finish)
+    rows = {}
+    try:
+        with request, report_throughput(meter, args.report_interval):
+            if args.devices:
+                rows.update(exporter.export_devices(
+                        os.path.join(args.output, 'devices'),
+                        _items(args.devices), all_cols=args.all_cols,
+                        **kwargs))
+            if args.stations:
+                rows.update(exporter.export_stations(
+                        os.path.join(args.output, 'stations'),
+                        _items(args.stations, int),
+                        period=Period[args.period.upper()], **kwargs))
+    except CityAirException as e:
+        print(f"cityair-export: {e}", file=sys.stderr)
+        return 2
+    print(f"{sum(rows.values())} rows of {len(rows)} devices (stations) "
+          f"exported, {meter}", file=sys.stderr)
+    return 0 if rows else 1
@@ -63,6 +63,16 @@ class ServerException(CityAirException):
         super().__init__(message)
 
 
+class TimeoutException(CityAirException, requests.exceptions.Timeout):
+    """
+    raised when the server doesn't respond in time after all the retries
+    """
+
+    def __init__(self, url: str, timeout: float):
+        super().__init__(f"Request to {url} timed out after {timeout} "
+                         f"seconds")
+
+
 class EmptyDataException(CityAirException):
     """
     raised whe 'Result' field in response is empty
@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Union
+
+from .exceptions import EmptyDataException
+from .lazy import lazy_import
+from .request import CityAirRequest, Period
+from .settings import DEFAULT_POOL_SIZE
+from .utils import (
+    RIGHT_PARAMS_NAMES, USELESS_COLS, Pager, decode_values, iter_pages,
+    iter_pages_by_id, to_date,
+    )
+
+np = lazy_import('numpy')
+pa = lazy_import('pyarrow', optional=True)
+pc = lazy_import('pyarrow.compute', optional=True)
+pcsv = lazy_import('pyarrow.csv', optional=True)
+pq = lazy_import('pyarrow.parquet', optional=True)
+
+FORMATS = ('parquet', 'feather', 'csv')
+
+
+class ArrowExporter:
+    """
+    Converts device and station packets straight into pyarrow record
+    batches page by page, without building pandas frames, and writes them
+    to Parquet, Feather or CSV datasets partitioned by device (station) and
+    day::
+
+        root_path/serial_number=CA01PM000123/day=2020-01-01/part-0.parquet
+
+    Columns are named as the ones of CityAirRequest.get_device_data and
+    get_station_data 'df' format, dates are timestamp[ns] columns.
+
+    Usage::
+
+        exporter = ArrowExporter(CityAirRequest(token))
+        for batch in exporter.device_batches('CA01PM000123',
+                                             start_date='2020.01.01'):
+            ...
+        exporter.export_devices('data/devices', start_date='2020.01.01',
+                                finish_date='2020.02.01', workers=10)
+    """
+
+    def __init__(self, request: CityAirRequest):
+        """
+        Parameters
+        ----------
+        request: CityAirRequest
+            used to request packets from the server
+        """
+        if pa is None:
+            raise ImportError("pyarrow is required for ArrowExporter, "
+                              "install it with `pip install pyarrow`")
+        self.request = request
+        self.logger = logging.getLogger(__name__)
+
+    def device_batches(self, serial_number: str, start_date=None,
+                       finish_date=None, last_packet_id=None,
+                       take_count: int = 500, all_cols=False
+                       ) -> Iterator['pa.RecordBatch']:
+        """
+        Yields a record batch per page of the device packets, see
+        CityAirRequest.iter_device_data for the args description
+        -------"""
+        fetch = partial(self.request._get_device_packets, serial_number)
+        if last_packet_id is not None:
+            pages = iter_pages_by_id(fetch, last_packet_id,
+                                     take_count=take_count)
+        elif start_date:
+            pages = iter_pages(fetch, Pager(
+                    start_date, finish_date, take_count=take_count,
+                    **self.request._device_packets_dates.get(serial_number,
+                                                             {})))
+        else:
+            raise ValueError("either start_date or last_packet_id should be "
+                             "passed")
+        for packets in pages:
+            values, columns = decode_values([packet['Data']
+                                             for packet in packets])
+            yield _to_batch(packets, values,
+                            self.request._device_value_names(columns),
+                            cols_to_drop=[] if all_cols else USELESS_COLS)
+
+    def station_batches(self, station_id: int, start_date=None,
+                        finish_date=None, take_count: int = 1000,
+                        period: Period = Period.TWENTY_MINS
+                        ) -> Iterator['pa.RecordBatch']:
+        """
+        Yields a record batch per page of the station packets, see
+        CityAirRequest.iter_station_data for the args description
+        -------"""
+        start_date = start_date or (datetime.now() - timedelta(weeks=1))
+        fetch = partial(self.request._get_station_packets, station_id,
+                        period=period)
+        for packets in iter_pages(fetch, Pager(start_date, finish_date,
+                                               take_count=take_count)):
+            values, columns = decode_values(
+                    [packet['Data'] for packet in packets], keys=('VT',))
+            yield _to_batch(packets, values,
+                            self.request._station_value_names(columns))
+
+    def export_device(self, serial_number: str, root_path: str,
+                      format: str = 'parquet', **kwargs) -> int:
+        """
+        Writes packets of the device to the partitions of
+        `root_path`/serial_number=`serial_number` page by page
+
+        Parameters
+        ----------
+        serial_number: str
+            serial_number of the device
+        root_path: str
+            directory of the dataset
+        format: {'parquet', 'feather', 'csv'}, default 'parquet'
+            format of the files
+        **kwargs:
+            passed to device_batches, i.e. start_date, finish_date
+        -------
+        Returns number of rows written
+        """
+        return _write_partitions(
+                self.device_batches(serial_number, **kwargs),
+                os.path.join(root_path, f"serial_number={serial_number}"),
+                format)
+
+    def export_station(self, station_id: int, root_path: str,
+                       format: str = 'parquet', **kwargs) -> int:
+        """
+        Writes packets of the station to the partitions of
+        `root_path`/station_id=`station_id` page by page, see
+        export_device for the args description
+        -------"""
+        return _write_partitions(
+                self.station_batches(station_id, **kwargs),
+                os.path.join(root_path, f"station_id={station_id}"), format)
+
+    def export_devices(self, root_path: str,
+                       serial_numbers: List[str] = None,
+                       format: str = 'parquet',
+                       workers: int = DEFAULT_POOL_SIZE,
+                       **kwargs) -> Dict[str, int]:
+        """
+        Writes packets of several devices concurrently
+
+        Parameters
+        ----------
+        root_path, format, **kwargs:
+            see export_device
+        serial_numbers: list of str, default None
+            serial_numbers of the devices, all the devices available if not
+            passed
+        workers: int, default {DEFAULT_POOL_SIZE}
+            number of devices exported at the same time
+        -------
+        Returns number of rows written for each device having data
+        """
+        serial_numbers = serial_numbers or self.request.get_devices()
+        return self._export_many(self.export_device, serial_numbers,
+                                 workers, root_path=root_path, format=format,
+                                 **kwargs)
+
+    def export_stations(self, root_path: str, station_ids: List[int] = None,
+                        format: str = 'parquet',
+                        workers: int = DEFAULT_POOL_SIZE,
+                        **kwargs) -> Dict[int, int]:
+        """
+        Writes packets of several stations concurrently, see export_devices
+        for the args description
+        -------"""
+        station_ids = station_ids or self.request.get_stations()
+        return self._export_many(self.export_station, station_ids, workers,
+                                 root_path=root_path, format=format,
+                                 **kwargs)
+
+    def _export_many(self, method: Callable[..., int], items: list,
+                     workers: int, **kwargs) -> dict:
+        # warming up cached lookups not to request them from every thread
+        self.request._check_metadata()
+        self.request._device_by_serial, self.request._device_value_types
+        self.request._device_packets_dates
+        self.request._stations_value_types
+
+        def export(item):
+            try:
+                return method(item, **kwargs)
+            except EmptyDataException:
+                self.logger.warning("There are no data for %s", item)
+                return 0
+
+        with ThreadPoolExecutor(workers) as pool:
+            res = dict(zip(items, pool.map(export, items)))
+        return {item: rows for item, rows in res.items() if rows}
+
+
+def _to_batch(packets: List[dict], values: np.ndarray, value_names: list,
+              cols_to_drop: List[str] = USELESS_COLS) -> 'pa.RecordBatch':
+    """
+    Builds record batch of packets fields (renamed with RIGHT_PARAMS_NAMES,
+    nested dicts are flattened) and decoded values, null columns are
+    dropped as prep_df does
+    """
+    rows = [_flatten(packet, exclude=('Data', 'DataJson'))
+            for packet in packets]
+    arrays = {}
+    for key in dict.fromkeys(key for row in rows for key in row):
+        name = RIGHT_PARAMS_NAMES.get(key, key)
+        if name in cols_to_drop or name in arrays:
+            continue
+        column = [row.get(key) for row in rows]
+        if 'date' in name.lower():
+            array = _to_timestamps(column)
+        else:
+            array = pa.array(column)
+        if array.null_count < len(array):
+            arrays[name] = array
+    # transposing once, so that every column is contiguous and handed to
+    # arrow without copying
+    for name, column in zip(value_names, np.ascontiguousarray(values.T)):
+        name = RIGHT_PARAMS_NAMES.get(name, name)
+        if name in arrays:
+            # the latest value wins as in CityAirRequest._prep_station_data
+            column = np.where(np.isnan(column),
+                              arrays[name].to_numpy(zero_copy_only=False),
+                              column)
+        arrays[name] = pa.array(column, from_pandas=True)
+    return pa.RecordBatch.from_arrays(list(arrays.values()),
+                                      names=list(arrays))
+
+
+def _flatten(record: dict, exclude=()) -> dict:
+    res = {}
+    for key, value in record.items():
+        if key in exclude:
+            continue
+        if isinstance(value, dict):
+            res.update(_flatten(value))
+        else:
+            res[key] = value
+    return res
+
+
+def _to_timestamps(dates: list) -> 'pa.Array':
+    """
+    Parses dates at once, dates having timezone are converted with to_date
+    keeping local time
+    """
+    try:
+        return pa.array(dates, type=pa.string()).cast(pa.timestamp('ns'))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([to_date(date) for date in dates],
+                        type=pa.timestamp('ns'))
+
+
+def _write_partitions(batches: Iterator['pa.RecordBatch'], path: str,
+                      format: str = 'parquet') -> int:
+    """
+    Writes batches to `path`/day=YYYY-MM-DD/part-N files. Batches come in
+    order of the dates, so the file of a day is kept open until a batch of
+    the later days, a day coming again is written to a new part. Files of
+    the days written before are replaced. New part is also started if the
+    batch has columns the file of the day has no.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown option of format argument: {format}. "
+                         f"Available formats are: {', '.join(FORMATS)}")
+    writers = {}
+    parts_counts = {}
+    rows_count = 0
+    try:
+        for batch in batches:
+            days = pc.strftime(batch.column('date'), format='%Y-%m-%d')
+            batch_days = sorted(pc.unique(days).drop_null().to_pylist())
+            # not to run out of file descriptors on the long ranges
+            for day in [day for day in writers
+                        if batch_days and day < batch_days[0]]:
+                writers.pop(day).close()
+            for day in batch_days:
+                day_batch = batch.filter(pc.equal(days, day))
+                writer = writers.get(day)
+                if writer is not None:
+                    conformed = _conform(day_batch, writer.schema)
+                    if conformed is not None:
+                        writer.write_batch(conformed)
+                        rows_count += len(day_batch)
+                        continue
+                    writer.close()
+                parts_counts[day] = parts_counts.get(day, -1) + 1
+                writers[day] = _PartWriter(os.path.join(path, f"day={day}"),
+                                           day_batch.schema, format,
+                                           parts_counts[day])
+                writers[day].write_batch(day_batch)
+                rows_count += len(day_batch)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    if not rows_count:
+        raise EmptyDataException(item=path)
+    return rows_count
+
+
+def _conform(batch: 'pa.RecordBatch', schema: 'pa.Schema'
+             ) -> Union['pa.RecordBatch', None]:
+    """
+    Casts batch to the schema adding null columns missing in the batch,
+    returns None if the batch has columns the schema has no
+    """
+    if batch.schema.equals(schema):
+        return batch
+    if any(name not in schema.names for name in batch.schema.names):
+        return None
+    arrays = []
+    for field in schema:
+        if field.name in batch.schema.names:
+            array = batch.column(field.name)
+            if not array.type.equals(field.type):
+                try:
+                    array = array.cast(field.type)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    return None
+        else:
+            array = pa.nulls(len(batch), type=field.type)
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _PartWriter:
+    """
+    Writer of the next part file of a partition directory
+    """
+
+    def __init__(self, path: str, schema: 'pa.Schema', format: str,
+                 parts_count: int = 0):
+        os.makedirs(path, exist_ok=True)
+        if not parts_count:
+            # replacing data of the previous exports
+            for name in os.listdir(path):
+                if name.startswith('part-'):
+                    os.remove(os.path.join(path, name))
+        file_path = os.path.join(path,
+                                 f"part-{parts_count}.{format}")
+        if format == 'parquet':
+            self._writer = pq.ParquetWriter(file_path, schema)
+        elif format == 'csv':
+            self._writer = pcsv.CSVWriter(file_path, schema)
+        else:
+            self._writer = pa.ipc.new_file(file_path, schema)
+        self.schema = schema
+
+    def write_batch(self, batch: 'pa.RecordBatch'):
+        self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from typing import Hashable, List, Sequence, Union
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+spatial = lazy_import('scipy.spatial', optional=True)
+
+EARTH_RADIUS_KM = 6371.0088
+# max number of query point-to-point distances computed at once without scipy
+BRUTE_FORCE_CHUNK = 2 ** 20
+
+Coordinate = Union[float, Sequence[float], 'np.ndarray']
+
+
+def to_unit_vectors(latitudes: Coordinate, longitudes: Coordinate
+                    ) -> np.ndarray:
+    """
+    Converts degrees to points of the unit sphere (n x 3 array), so that
+    the nearest points are the ones with the shortest chords
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float).ravel())
+    lon = np.radians(np.asarray(longitudes, dtype=float).ravel())
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon),
+                            np.sin(lat)])
+
+
+def chord_to_km(chords: np.ndarray) -> np.ndarray:
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chords / 2, 0, 1))
+
+
+class SpatialIndex:
+    """
+    Index of points (stations or devices) by their coordinates answering
+    nearest and bounding box queries for arrays of query points at once
+
+    Nearest points are looked up in k-d tree of scipy.spatial.cKDTree over
+    the points of the unit sphere if scipy is installed, otherwise by
+    vectorized numpy distances. Bounding boxes are looked up by binary
+    search in the points sorted by latitude.
+    """
+
+    def __init__(self, ids: Sequence[Hashable], latitudes: Coordinate,
+                 longitudes: Coordinate):
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        known = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        self.ids = np.asarray(ids, dtype=object)[known]
+        self.latitudes = latitudes[known]
+        self.longitudes = longitudes[known]
+        self.vectors = to_unit_vectors(self.latitudes, self.longitudes)
+        self.tree = spatial.cKDTree(self.vectors) if spatial and len(self) \
+            else None
+        self._by_latitude = np.argsort(self.latitudes, kind='stable')
+        self._sorted_latitudes = self.latitudes[self._by_latitude]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, latitude: Coordinate, longitude: Coordinate,
+                k: int = 1) -> pd.DataFrame:
+        """
+        k nearest points of every query point
+
+        :return: DataFrame with 'id' and 'distance' (km) columns, indexed by
+            'point' (position of the query point) and 'rank' (0 is the
+            nearest), 'point' level is dropped if single point is passed
+        """
+        single = np.ndim(latitude) == 0
+        queries = to_unit_vectors(latitude, longitude)
+        k = min(k, len(self))
+        if k < 1:
+            chords = np.empty((len(queries), 0))
+            positions = np.empty((len(queries), 0), dtype=int)
+        elif self.tree is not None:
+            chords, positions = self.tree.query(queries, k=k)
+            chords = chords.reshape(len(queries), k)
+            positions = positions.reshape(len(queries), k)
+        else:
+            chords, positions = self._brute_force_nearest(queries, k)
+        index = pd.MultiIndex.from_product(
+                [range(len(queries)), range(k)], names=['point', 'rank'])
+        df = pd.DataFrame({'id': self.ids[positions.ravel()],
+                           'distance': chord_to_km(chords.ravel())},
+                          index=index)
+        return df.droplevel('point') if single else df
+
+    def _brute_force_nearest(self, queries: np.ndarray, k: int):
+        chunk = max(1, BRUTE_FORCE_CHUNK // len(self))
+        all_chords, all_positions = [], []
+        for start in range(0, len(queries), chunk):
+            # squared chords of the unit vectors are 2 - 2 * cos
+            squared = 2 - 2 * queries[start:start + chunk] @ self.vectors.T
+            positions = np.argpartition(squared, k - 1, axis=1)[:, :k]
+            squared = np.take_along_axis(squared, positions, axis=1)
+            order = np.argsort(squared, axis=1, kind='stable')
+            all_positions.append(np.take_along_axis(positions, order, axis=1))
+            all_chords.append(np.sqrt(np.clip(
+                    np.take_along_axis(squared, order, axis=1), 0, None)))
+        return np.concatenate(all_chords), np.concatenate(all_positions)
+
+    def in_bbox(self, min_latitude: Coordinate, min_longitude: Coordinate,
+                max_latitude: Coordinate, max_longitude: Coordinate
+                ) -> Union[List[Hashable], List[List[Hashable]]]:
+        """
+        Ids of the points within the bounding box, list of them for every
+        box if arrays are passed, min_longitude > max_longitude is the box
+        crossing the antimeridian
+        """
+        single = np.ndim(min_latitude) == 0
+        boxes = np.broadcast_arrays(*(
+                np.asarray(bound, dtype=float).ravel()
+                for bound in (min_latitude, min_longitude, max_latitude,
+                              max_longitude)))
+        starts = np.searchsorted(self._sorted_latitudes, boxes[0], 'left')
+        ends = np.searchsorted(self._sorted_latitudes, boxes[2], 'right')
+        res = []
+        for start, end, min_lon, max_lon in zip(starts, ends, boxes[1],
+                                                boxes[3]):
+            positions = self._by_latitude[start:end]
+            lon = self.longitudes[positions]
+            if min_lon <= max_lon:
+                inside = (lon >= min_lon) & (lon <= max_lon)
+            else:
+                inside = (lon >= min_lon) | (lon <= max_lon)
+            res.append(list(self.ids[np.sort(positions[inside])]))
+        return res[0] if single else res
@@ -0,0 +1,35 @@
+import importlib
+import importlib.util
+import sys
+import types
+from typing import Optional
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in of the module which is imported on the first access to its
+    attributes, so that heavy dependencies (pandas, numpy, pyarrow) are not
+    imported by `import cityair_api` and the calls not using them
+    """
+
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str, optional: bool = False
+                ) -> Optional[types.ModuleType]:
+    """
+    Lazily imported module, already imported one is returned as is
+
+    :param optional: whether to return None if the module is not installed,
+        like `try: import ... except ImportError` does
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    # only the top level package is looked up, finding a submodule would
+    # import its package
+    if optional and importlib.util.find_spec(name.partition('.')[0]) is None:
+        return None
+    return LazyModule(name)
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Optional
+
+from .settings import DEFAULT_METADATA_TTL
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+
+class MetadataCache:
+    """
+    Storage of metadata responses (devices, value types, stations) shared
+    by all the CityAirRequest objects of the process and, if `cache_dir` is
+    passed, by all the processes using the same directory
+
+    Entries are json files named by key, which are considered expired
+    `ttl` after being written. Concurrent misses of the same key are
+    serialized with a lock, so that only one process requests the server.
+    """
+    _memory = {}
+    _locks = {}
+    _memory_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str = None,
+                 ttl: timedelta = DEFAULT_METADATA_TTL):
+        """
+        Parameters
+        ----------
+        cache_dir: str, default None
+            directory for the files, metadata is shared only within the
+            process if not passed
+        ttl: datetime.timedelta, default {DEFAULT_METADATA_TTL}
+            time after which metadata is requested again
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"metadata_{key}.json")
+
+    def _is_fresh(self, timestamp: float) -> bool:
+        return time.time() - timestamp < self.ttl.total_seconds()
+
+    def load(self, key: str) -> Optional[dict]:
+        """
+        Returns stored data of the key or None if it's missing or expired
+        """
+        entry = self._memory.get((self.cache_dir, key))
+        if entry and self._is_fresh(entry[0]):
+            return entry[1]
+        if not self.cache_dir:
+            return None
+        try:
+            timestamp = os.path.getmtime(self._path(key))
+            if not self._is_fresh(timestamp):
+                return None
+            with open(self._path(key)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._memory[(self.cache_dir, key)] = (timestamp, data)
+        return data
+
+    def store(self, key: str, data: dict):
+        self._memory[(self.cache_dir, key)] = (time.time(), data)
+        if not self.cache_dir:
+            return
+        # writing to the temporary file first not to expose partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(key))
+
+    def get(self, key: str, loader: Callable[[], dict]) -> dict:
+        """
+        Returns stored data of the key, calling `loader` to get and store it
+        if it's missing or expired
+        """
+        data = self.load(key)
+        if data is None:
+            with self._lock(key):
+                data = self.load(key)
+                if data is None:
+                    data = loader()
+                    self.store(key, data)
+        return data
+
+    def expiration(self, key: str) -> Optional[float]:
+        """
+        Returns time (as of time.time) when the data of the key stored in
+        the process expires, None if there is no such data
+        """
+        entry = self._memory.get((self.cache_dir, key))
+        return entry[0] + self.ttl.total_seconds() if entry else None
+
+    def invalidate(self, key: str):
+        self._memory.pop((self.cache_dir, key), None)
+        if self.cache_dir:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _lock(self, key: str):
+        with self._memory_lock:
+            lock = self._locks.setdefault((self.cache_dir, key),
+                                          threading.Lock())
+        with lock:
+            if not self.cache_dir or fcntl is None:
+                yield
+                return
+            with open(self._path(key) + '.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
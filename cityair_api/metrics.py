@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+# span fields summed up by MetricsAggregator
+SPAN_TOTALS = ('elapsed', 'size', 'packets', 'retries', 'decode_time',
+               'build_time')
+
+
+@contextmanager
+def span(name: str, hooks: List[Callable[[dict], None]], **attrs
+         ) -> Iterator[dict]:
+    """
+    Measures the wrapped block and passes the span to every hook, errors of
+    the hooks are logged and don't affect the block
+
+    Span is a dict of `attrs`, 'name', 'started' (epoch seconds), 'elapsed'
+    (seconds) and 'error' (exception class name or None), the block could
+    add fields to the yielded dict:
+
+    * 'request' spans (one per CityAirRequest._make_request): 'endpoint',
+      'filter_type', 'status', 'attempts', 'retries', 'size' (bytes
+      received), 'packets', 'decode_time' (seconds of json decoding)
+    * 'frame' spans (building DataFrame of packets): 'endpoint', 'packets',
+      'build_time'
+    """
+    record = dict(attrs, name=name, started=time.time(), error=None)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        record['elapsed'] = time.perf_counter() - started
+        for hook in hooks:
+            try:
+                hook(record)
+            except Exception:
+                logger.exception("%s span hook %r failed", name, hook)
+
+
+class MetricsAggregator:
+    """
+    In-memory collector of spans, pass it to the hooks of CityAirRequest
+    and print it after a bulk pull:
+
+    >>> metrics = MetricsAggregator()
+    >>> R = CityAirRequest(token, hooks=[metrics])
+    >>> df = R.get_devices_data(start_date='2020.01.01', workers=10)
+    >>> print(metrics)
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict):
+        with self._lock:
+            self.spans.append(record)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Frame indexed by span name and endpoint with count of spans, errors
+        and totals of SPAN_TOTALS
+        """
+        with self._lock:
+            df = pd.DataFrame.from_records(self.spans)
+        if df.empty:
+            return pd.DataFrame()
+        for col in SPAN_TOTALS + ('endpoint', 'error'):
+            if col not in df.columns:
+                df[col] = None
+        df['endpoint'] = df['endpoint'].fillna('')
+        grouped = df.groupby(['name', 'endpoint'])
+        res = grouped[list(SPAN_TOTALS)].sum(min_count=1)
+        res.insert(0, 'errors', grouped['error'].count())
+        res.insert(0, 'count', grouped.size())
+        res['mean_elapsed'] = res['elapsed'] / res['count']
+        return res.dropna(axis=1, how='all')
+
+    def __str__(self):
+        summary = self.summary()
+        if summary.empty:
+            return "no requests were made"
+        return summary.to_string(float_format=lambda x: f"{x:.3f}")
+
+
+class ThroughputMeter:
+    """
+    Hook counting packets and bytes received by the requests, its str is
+    the throughput since the first request:
+
+    >>> meter = ThroughputMeter()
+    >>> R = CityAirRequest(token, hooks=[meter])
+    >>> df = R.get_devices_data(start_date='2020.01.01', workers=10)
+    >>> print(meter)
+    1200000 packets, 350.2 MB in 60.1 s: 19967 packets/s, 5.83 MB/s
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.packets = 0
+        self.size = 0
+        self.started = None
+        self._lock = threading.Lock()
+
+    def __call__(self, record: dict):
+        if record['name'] != 'request':
+            return
+        with self._lock:
+            if self.started is None or record['started'] < self.started:
+                self.started = record['started']
+            self.requests += 1
+            self.packets += record.get('packets') or 0
+            self.size += record.get('size') or 0
+
+    def summary(self) -> dict:
+        """
+        Counts of requests, packets, bytes received, seconds since the
+        first request and rates of packets and megabytes per second
+        """
+        with self._lock:
+            elapsed = time.time() - self.started if self.started else 0.
+            res = dict(requests=self.requests, packets=self.packets,
+                       size=self.size, elapsed=elapsed)
+        res['packets_per_second'] = res['packets'] / elapsed if elapsed \
+            else 0.
+        res['mb_per_second'] = res['size'] / 2 ** 20 / elapsed if elapsed \
+            else 0.
+        return res
+
+    def __str__(self):
+        summary = self.summary()
+        return (f"{summary['packets']} packets, "
+                f"{summary['size'] / 2 ** 20:.1f} MB in "
+                f"{summary['elapsed']:.1f} s: "
+                f"{summary['packets_per_second']:.0f} packets/s, "
+                f"{summary['mb_per_second']:.2f} MB/s")
+
+
+class OpenTelemetryHook:
+    """
+    Hook exporting spans to OpenTelemetry, the tracer is the one of
+    opentelemetry.trace.get_tracer:
+
+    >>> R = CityAirRequest(token, hooks=[OpenTelemetryHook(tracer)])
+    """
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    def __call__(self, record: dict):
+        attributes = {f"cityair.{key}": value for key, value in record.items()
+                      if key not in ('name', 'started') and value is not None}
+        started = int(record['started'] * 10 ** 9)
+        otel_span = self.tracer.start_span(f"cityair.{record['name']}",
+                                           start_time=started,
+                                           attributes=attributes)
+        otel_span.end(end_time=started + int(record['elapsed'] * 10 ** 9))
@@ -1,32 +1,52 @@
+from __future__ import annotations
+
+import hashlib
 import json
 import logging
 import os
-from collections import Counter
-from collections.abc import Iterable
+import random
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from enum import Enum
+from functools import partial
 from pprint import pformat
-from typing import Dict, List, Union
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
 
-import pandas as pd
 import requests
-from cached_property import cached_property
+from cached_property import threaded_cached_property
+from requests.adapters import HTTPAdapter
 
 from .exceptions import (
     CityAirException, EmptyDataException, NoAccessException, ServerException,
-    TransportException, anonymize_request,
+    TimeoutException, TransportException, anonymize_request,
     )
+from .geo import Coordinate
+from .lazy import lazy_import
+from .metadata import MetadataCache
+from .metrics import span
 from .settings import (
-    DEFAULT_HOST, DEVICES_PACKETS_URL, DEVICES_URL,
-    STATIONS_PACKETS_URL, STATIONS_URL,
-    TOKEN_VAR_NAME,
+    DEFAULT_BACKOFF_FACTOR, DEFAULT_HOST, DEFAULT_LOGS_TAKE_COUNT,
+    DEFAULT_MAX_RETRIES, DEFAULT_MEMO_SIZE, DEFAULT_METADATA_TTL,
+    DEFAULT_POOL_SIZE, DEVICES_PACKETS_URL, DEVICES_URL, FULL_LOGS_URL,
+    LOG_FILTERS, LOGS_URL, PACKET_SENDER_IDS, REQUEST_METRICS_MAXLEN,
+    RETRY_STATUS_CODES, STATIONS_PACKETS_URL, STATIONS_URL, TOKEN_VAR_NAME,
     )
+from .topology import Topology
 from .utils import (
-    MAIN_DEVICE_PARAMS, MAIN_STATION_PARAMS, RIGHT_PARAMS_NAMES, USELESS_COLS,
-    add_progress_bar, is_main_device, prep_df, prep_dicts, timeit, to_date,
-    unpack_cols,
+    CHECKINFO_COLS, JSON_DECODE_ERRORS, MAIN_DEVICE_PARAMS, RIGHT_PARAMS_NAMES,
+    USELESS_COLS, Pager, Resampler, SingleFlight, compact_df, decode_values,
+    fetch_pages, is_main_device, iter_pages, iter_pages_by_id,
+    last_packet_date, loads_json, map_device_and_children_by_id,
+    map_device_by_id, map_device_by_serial, map_device_packets_dates,
+    map_value_types, parse_checkinfos, prep_df, split_dates, to_date,
+    to_dates, to_timedelta, unpack_cols,
     )
 
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow', optional=True)
+
 
 class Period(Enum):
     FIVE_MINS = 1
@@ -34,6 +54,28 @@ class Period(Enum):
     HOUR = 3
     DAY = 4
 
+    @property
+    def interval(self) -> timedelta:
+        return PERIOD_INTERVALS[self]
+
+    @classmethod
+    def coarsest_dividing(cls, interval: timedelta) -> 'Period':
+        """
+        The coarsest period windows of `interval` could be assembled from,
+        FIVE_MINS if there is no such period
+        """
+        dividing = [period for period in cls
+                    if not interval % period.interval]
+        return dividing[-1] if dividing else cls.FIVE_MINS
+
+
+PERIOD_INTERVALS = {
+        Period.FIVE_MINS: timedelta(minutes=5),
+        Period.TWENTY_MINS: timedelta(minutes=20),
+        Period.HOUR: timedelta(hours=1),
+        Period.DAY: timedelta(days=1),
+        }
+
 
 class CityAirRequest:
     """
@@ -41,7 +83,11 @@ class CityAirRequest:
     """
 
     def __init__(self, token=None, host_url=DEFAULT_HOST, timeout=100,
-                 verify_ssl=True, silent=False):
+                 verify_ssl=True, silent=False, pool_size=DEFAULT_POOL_SIZE,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 metadata_cache_dir=None, metadata_ttl=DEFAULT_METADATA_TTL,
+                 hooks=None, memo_ttl=None, memo_size=DEFAULT_MEMO_SIZE):
         """
         Parameters
         ----------
@@ -56,11 +102,52 @@ class CityAirRequest:
             whether to verify SSL certificate
         silent: bool, default False
             whether
+        pool_size: int, default {DEFAULT_POOL_SIZE}
+            max number of keep-alive connections to the server, should be
+            not less than the number of threads sharing the object
+        max_retries: int, default {DEFAULT_MAX_RETRIES}
+            how many times to repeat the request failed due to connection
+            error, timeout or 5xx response
+        backoff_factor: float, default {DEFAULT_BACKOFF_FACTOR}
+            base of the delay between retries, actual delay is random
+            between 0 and backoff_factor * 2 ** attempt seconds
+        metadata_cache_dir: str, default None
+            directory to share devices, value types and stations metadata
+            between processes, by default it's shared only between the
+            objects of the same process
+        metadata_ttl: datetime.timedelta, default {DEFAULT_METADATA_TTL}
+            time after which metadata is requested again, see also
+            invalidate_metadata
+        hooks: list of callables, default None
+            called with every span (dict of the request or DataFrame build
+            metrics, see metrics.span), e.g. metrics.MetricsAggregator or
+            metrics.OpenTelemetryHook, spans of the latest requests are kept
+            in request_metrics anyway
+        memo_ttl: datetime.timedelta, default None
+            identical requests running at the same time (i.e. from
+            different threads) are always merged into one, if memo_ttl is
+            passed their results are also reused for this time
+        memo_size: int, default {DEFAULT_MEMO_SIZE}
+            max number of the results kept if memo_ttl is passed
         """
 
         self.host_url = host_url
         self.timeout = timeout
         self.verify_ssl = verify_ssl
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate',
+                                     'Connection': 'keep-alive'})
+        self.session.verify = verify_ssl
+        self.request_metrics = deque(maxlen=REQUEST_METRICS_MAXLEN)
+        self.hooks = list(hooks or [])
+        self._single_flight = SingleFlight(memo_ttl, memo_size)
+        self._metadata_cache = MetadataCache(metadata_cache_dir, metadata_ttl)
         if token:
             self.token = token
         else:
@@ -75,76 +162,183 @@ class CityAirRequest:
             self.token = token
         self.logger = logging.getLogger(__name__)
 
-    @cached_property
+    def close(self):
+        """
+        Closes pooled connections to the server
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _span(self, name: str, **attrs):
+        """
+        Context manager measuring the block as a span, see metrics.span
+        """
+        return span(name, [self._emit], **attrs)
+
+    def _emit(self, record: dict):
+        if record['name'] == 'request':
+            self.request_metrics.append(record)
+        self.logger.debug("%s span: %s", record['name'], record)
+        for hook in self.hooks:
+            try:
+                hook(record)
+            except Exception:
+                self.logger.exception("%s span hook %r failed",
+                                      record['name'], hook)
+
+    def _post(self, url: str, body: dict, record: dict = None
+              ) -> requests.models.Response:
+        """
+        Posting request via pooled session, retrying it with jittered
+        exponential backoff on connection errors, timeouts and 5xx responses,
+        status, attempts and size of the response are added to the `record`
+        span
+        """
+        record = {} if record is None else record
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            record.update(attempts=attempt + 1, retries=attempt)
+            try:
+                response = self.session.post(url, json=body,
+                                             timeout=self.timeout)
+            except requests.exceptions.ConnectionError as e:
+                if is_last_attempt:
+                    raise CityAirException(f"Got connection error: {e}") \
+                        from e
+                reason = str(e)
+            except requests.exceptions.Timeout as e:
+                if is_last_attempt:
+                    raise TimeoutException(url, self.timeout) from e
+                reason = str(e)
+            else:
+                if (response.status_code not in RETRY_STATUS_CODES
+                        or is_last_attempt):
+                    break
+                reason = f"response code {response.status_code}"
+            delay = random.uniform(0, self.backoff_factor * 2 ** attempt)
+            self.logger.info("retrying request to %s in %.2f seconds (%s)",
+                             url, delay, reason)
+            time.sleep(delay)
+        elapsed = time.perf_counter() - started
+        record.update(status=response.status_code,
+                      size=len(response.content))
+        self.logger.debug("request to %s took %.3f seconds, %d attempt(s)",
+                          url, elapsed, attempt + 1)
+        return response
+
+    @property
+    def _metadata_key(self) -> str:
+        # metadata depends on the access rights, so the token is a part of
+        # the key, hashed not to be exposed in file names
+        return hashlib.sha256(
+                f"{self.host_url} {self.token}".encode()).hexdigest()[:16]
+
+    def _get_metadata(self, name: str, method_url: str, *keys: str) -> dict:
+        """
+        Returns {key: data} of the metadata request, shared by the objects
+        and processes via MetadataCache
+        """
+        cache_key = f"{self._metadata_key}_{name}"
+        data = self._metadata_cache.get(
+                cache_key,
+                lambda: dict(zip(keys, self._make_request(method_url, *keys))))
+        self._track_metadata_expiration(cache_key)
+        return data
+
+    def _track_metadata_expiration(self, cache_key: str):
+        # the snapshot of the object expires with the earliest of its
+        # entries, even if they were stored by another object
+        expiration = self._metadata_cache.expiration(cache_key) or time.time()
+        self._metadata_expires_at = min(
+                self.__dict__.get('_metadata_expires_at', expiration),
+                expiration)
+
+    @threaded_cached_property
+    def _devices_metadata(self) -> dict:
+        return self._get_metadata('devices', DEVICES_URL, "Devices",
+                                  "PacketsValueTypes")
+
+    @threaded_cached_property
+    def _stations_metadata(self) -> dict:
+        return self._get_metadata('stations', STATIONS_URL, "Locations",
+                                  "MoItems", "Devices", "PacketValueTypes")
+
+    def invalidate_metadata(self):
+        """
+        Drops devices, value types and stations metadata, so that it's
+        requested again on the next use, e.g. after adding a device,
+        memoized responses (see memo_ttl) are dropped as well
+        """
+        self._single_flight.clear()
+        for name in ('devices', 'stations'):
+            self._metadata_cache.invalidate(f"{self._metadata_key}_{name}")
+        self._drop_metadata()
+
+    def _drop_metadata(self):
+        """
+        Drops the metadata snapshot of the object and lookups built from it
+        """
+        for attr in ('_devices_metadata', '_stations_metadata',
+                     '_device_by_serial', '_device_value_types',
+                     '_stations_value_types', '_device_by_id',
+                     '_device_and_children_by_id', '_topology',
+                     '_device_packets_dates', '_metadata_expires_at'):
+            self.__dict__.pop(attr, None)
+
+    def _check_metadata(self, refresh: bool = False):
+        """
+        Drops the metadata snapshot if `refresh` is passed (see
+        invalidate_metadata) or it's older than metadata_ttl, so that it's
+        requested again on the next use. Snapshot is kept between the calls
+        not to look it up on every packet, so the methods using it call
+        this first
+        """
+        if refresh:
+            self.invalidate_metadata()
+        elif time.time() >= self.__dict__.get('_metadata_expires_at',
+                                              float('inf')):
+            self._drop_metadata()
+
+    @threaded_cached_property
     def _device_by_serial(self):
-        devices_data = self._make_request(DEVICES_URL, "Devices")
-        return dict(zip([(data.get('SerialNumber')) for data in devices_data],
-                        [data.get('DeviceId') for data in devices_data]))
+        return map_device_by_serial(self._devices_metadata['Devices'])
 
-    @cached_property
+    @threaded_cached_property
     def _device_value_types(self):
-        value_types_data = self._make_request(DEVICES_URL,
-                                              "PacketsValueTypes")
-        value_types = dict(
-                zip([(data.get('ValueType')) for data in value_types_data],
-                    [data.get('TypeName') for data in value_types_data]))
-        # adding "_" to not unique value type names
-        name_counts = Counter(value_types.values())
-        for id, name in value_types.items():
-            current_count = name_counts[name]
-            if current_count > 1:
-                value_types[id] = name + (current_count - 1) * "_"
-                name_counts[name] = current_count - 1
-        return value_types
-
-    @cached_property
+        return map_value_types(self._devices_metadata['PacketsValueTypes'],
+                               unique_names=True)
+
+    @threaded_cached_property
     def _stations_value_types(self):
-        value_types_data = self._make_request(STATIONS_URL,
-                                              "PacketValueTypes")
-        return dict(zip(
-                [info['ValueType'] for info in value_types_data],
-                [info['TypeName'] for info in value_types_data]
-                ))
-
-    @cached_property
+        return map_value_types(self._stations_metadata['PacketValueTypes'])
+
+    @threaded_cached_property
+    def _device_packets_dates(self):
+        return map_device_packets_dates(self._devices_metadata['Devices'])
+
+    @threaded_cached_property
     def _device_by_id(self):
-        devices_data = self._make_request(DEVICES_URL, "Devices")
-        device_by_id = dict(
-                zip([(data.get('DeviceId')) for data in devices_data],
-                    [data.get('SerialNumber') for data in devices_data]))
-        for device in devices_data:
-            for child in device.get('ChildDevices', []):
-                device_by_id.update({child["DeviceId"]: child['SerialNumber']})
-        return device_by_id
-
-    @cached_property
+        return map_device_by_id(self._devices_metadata['Devices'])
+
+    @threaded_cached_property
     def _device_and_children_by_id(self):
-        devices_data = self._make_request(DEVICES_URL, "Devices")
-        res = {}
-        for data in devices_data:
-            key = data.get('DeviceId')
-            serials = [data.get('SerialNumber')]
-            for child_data in data.get('ChildDevices'):
-                serials.append(child_data.get('SerialNumber'))
-                res[child_data.get('Id')] = [child_data.get('SerialNumber')]
-            res[key] = serials
-        return res
+        return map_device_and_children_by_id(
+                self._devices_metadata['Devices'])
 
-    @cached_property
-    def _stations_by_device(self):
-        stations = self.get_stations(format='dicts')
-        res = {}
-        for station in stations:
-            device_list = station.pop('devices')
-            for device in device_list:
-                try:
-                    if station not in res[device]:
-                        res[device].append(station.copy())
-                except KeyError:
-                    res[device] = [station.copy()]
-        return res
+    @threaded_cached_property
+    def _topology(self) -> Topology:
+        stations_metadata = self._stations_metadata
+        return Topology(self._devices_metadata['Devices'],
+                        stations_metadata['Locations'],
+                        stations_metadata['MoItems'],
+                        stations_metadata['Devices'])
 
-    @timeit
     def _make_request(self, method_url: str, *keys: str,
                       silent: bool = True, **kwargs: object):
         """
@@ -163,13 +357,35 @@ class CityAirRequest:
         -------"""
         body = {"Token": getattr(self, 'token'), **kwargs}
         url = f"{self.host_url}/{method_url}"
-        try:
-            response = requests.post(url, json=body, timeout=self.timeout,
-                                     verify=self.verify_ssl)
-            self.logger.debug("post request to url: %s\n"
-                              "body:%s", url, pformat(body))
-        except requests.exceptions.ConnectionError as e:
-            raise CityAirException(f"Got connection error: {e}") from e
+
+        def request():
+            with self._request_span(method_url, url, body) as record:
+                response = self._post(url, body, record)
+                self.logger.debug("post request to url: %s\n"
+                                  "body:%s", url,
+                                  pformat(anonymize_request(body)))
+                return self._parse_response(response, body, keys, silent,
+                                            record)
+
+        # the token is the same for all the requests of the object
+        key = (url, keys, silent, json.dumps(anonymize_request(body),
+                                             sort_keys=True, default=str))
+        return self._single_flight.do(key, request)
+
+    def _request_span(self, method_url: str, url: str, body: dict):
+        return self._span('request', endpoint=method_url, url=url,
+                          filter_type=body.get('Filter', {}).get(
+                                  'FilterType'))
+
+    def _parse_response(self, response: requests.models.Response, body: dict,
+                        keys: Tuple[str, ...], silent: bool,
+                        record: dict = None):
+        """
+        Checks the server response and extracts data of the requested keys
+        from it, see _make_request for the args description, json decoding
+        time and count of packets are added to the `record` span
+        """
+        record = {} if record is None else record
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError as e:
@@ -178,20 +394,25 @@ class CityAirRequest:
             except Exception:
                 details = ""
             raise CityAirException(f"Got HTTP error: {e}: {details}") from e
+        started = time.perf_counter()
         try:
-            response_json = response.json()
-        except json.JSONDecodeError as e:
+            response_json = loads_json(response.content)
+        except JSON_DECODE_ERRORS as e:
             raise TransportException(response) from e
+        finally:
+            record['decode_time'] = time.perf_counter() - started
         if response_json.get('IsError'):
             raise ServerException(response)
         response_data = response_json.get('Result')
+        if 'Packets' in keys:
+            record['packets'] = len(response_data['Packets'])
         for key in keys:
             if len(response_data[key]) == 0:
                 if not silent:
                     raise EmptyDataException(response=response)
                 self.logger.warning("There are no %s available.\n"
                                     "url:%s\n"
-                                    "filter%s", key, url,
+                                    "filter%s", key, response.url,
                                     anonymize_request(body))
         if len(keys) == 0:
             return response_data
@@ -201,73 +422,89 @@ class CityAirRequest:
             return [response_data[key] for key in keys]
 
     def get_devices(self, format: str = 'list', include_offline: bool = True,
-                    include_children: bool = False) \
+                    include_children: bool = False, refresh: bool = False) \
             -> Union[List[str], pd.DataFrame, List[dict]]:
         """
         Provides devices information in various formats
 
+        Devices, stations and locations are looked up in the metadata
+        snapshot, which is requested again after metadata_ttl
+
         Parameters
         ----------
-        format:  {'list', 'df', 'dicts', 'raw'}, default 'list'
+        format:  {'list', 'df', 'dicts', 'raw', 'json'}, default 'list'
             * 'list' : returns list of serial_numbers
             * 'df' : returns pd.DataFrame pretty formatted
             * 'dicts' : returns list of dictionaries, each including various
             params
             * 'raw' : returns pd.DataFrame including all info got from
             server, other params are ignored
+            * 'json' : returns list of the records got from server as is,
+            other params are ignored, doesn't import pandas
         include_offline: bool, default True
             whether to include offline devices to the output
         include_children : bool, default False
             whether to include info of child devices to the output
+        refresh: bool, default False
+            whether to request the metadata again, see invalidate_metadata
         -------"""
-        devices_data = self._make_request(DEVICES_URL, "Devices")
-        df = pd.DataFrame.from_records(devices_data)
+        self._check_metadata(refresh)
+        return self._prep_devices(format=format,
+                                  include_offline=include_offline,
+                                  include_children=include_children)
+
+    def _prep_devices(self, format: str = 'list',
+                      include_offline: bool = True,
+                      include_children: bool = False) \
+            -> Union[List[str], pd.DataFrame, List[dict]]:
+        """
+        Looks up devices in the topology, see get_devices for the args
+        description
+        """
         if format == 'raw':
-            return df
-        df = prep_df(df, dicts_cols=['children'])
-
-        if not include_offline:
-            df = df[df['is_online']]
-        df_with_children = df.copy(deep=True)
-        for children in df['children']:
-            for child in children:
-                df_with_children = df_with_children.append(child,
-                                                           ignore_index=True)
-        if include_children:
-            df = df_with_children
-        df.set_index('serial_number', inplace=True, drop=False)
-        df['stations'] = pd.Series(getattr(self, '_stations_by_device', []))
-        df['children'].apply(
-                lambda children_info: [child_info.pop('id') for child_info in
-                                       children_info] if isinstance(
-                        children_info,
-                        Iterable) else [])
-        if format == 'dicts':
-            res = []
-            for serial_number, row in df.iterrows():
-                row = dict(row)
-                single_dict = {param: row.pop(param, None) for param in
-                               MAIN_DEVICE_PARAMS}
-                single_dict.update(misc=row)
-                res.append(single_dict)
-            return res
-        elif format == 'list':
-            devices = df.index
-            if not include_children:
-                devices = filter(is_main_device, devices)
-            return list(devices)
-        elif format == 'df':
-            return df.set_index('serial_number')
-        else:
+            return pd.DataFrame.from_records(
+                    self._devices_metadata['Devices'])
+        if format == 'json':
+            return list(self._devices_metadata['Devices'])
+        if format not in ('list', 'df', 'dicts'):
             raise ValueError(
                     f"Unknown type of format argument: {format}. Available "
-                    f"formats are: 'list', 'df', 'dicts', 'raw'")
+                    f"formats are: 'list', 'df', 'dicts', 'raw', 'json'")
+        topology = self._topology
+        devices = [device for device in topology.devices.values()
+                   if include_offline or device.get('is_online', True)]
+        if include_children:
+            devices += [topology.children[child] for device in devices
+                        for child in topology.children_by_parent[
+                            device['serial_number']]]
+        if format == 'list':
+            serials = [device['serial_number'] for device in devices]
+            if not include_children:
+                serials = list(filter(is_main_device, serials))
+            return serials
+        if format == 'df':
+            df = pd.DataFrame.from_records(devices, index='serial_number')
+            df['stations'] = [topology.device_stations(serial)
+                              for serial in df.index]
+            return df
+        res = []
+        for device in devices:
+            device = dict(device, stations=topology.device_stations(
+                    device['serial_number']))
+            single_dict = {param: device.pop(param, None) for param in
+                           MAIN_DEVICE_PARAMS}
+            single_dict.update(misc=device)
+            res.append(single_dict)
+        return res
 
-    @add_progress_bar
     def get_device_data(self, serial_number: str, start_date=None,
                         finish_date=None, last_packet_id=None,
                         skip_count: int = 0, take_count: int = 500,
-                        all_cols=False, format: str = 'df'
+                        all_cols=False, format: str = 'df',
+                        verbose: bool = True, workers: int = 1,
+                        compact: Union[bool, str] = False,
+                        period: Union[timedelta, str, None] = None,
+                        agg: Union[str, List[str]] = 'mean'
                         ) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
         """
         Provides data from the selected device
@@ -283,13 +520,15 @@ class CityAirRequest:
         skip_count: int, default 0
             if last_packet_id is passed, number of packets to skip form last
             packet id
-        take_count: int, default 1000
-            count of packets which is requested from the server
+        take_count: int, default 500
+            count of packets which is requested from the server, if
+            start_date is passed it's the initial one: page size is adapted
+            to the server response time, see utils.Pager
         all_cols: bool, default False
             whether to keep or drop columns which are not directly related
             to air
              quality data (i.e. battery status, ps 220, recieve date)
-        format:  {'df', 'dict'}, default 'df'
+        format:  {'df', 'dict', 'json'}, default 'df'
             * 'df' : returns one pd.DataFrame, where value_name is
             concatenated with
                      serial_number of the device if there is more than one
@@ -298,10 +537,68 @@ class CityAirRequest:
             * 'dict' : returns dictionary, where key is serial_number of
                        the device and value is pd.DataFrame containing all
                        data of the device
+            * 'json' : returns list of packets got from server as is,
+                       all_cols, compact, period and agg are ignored,
+                       doesn't import pandas
         verbose: bool, default True:
-            whether to show progress bar
+            whether to show progress bar if start_date is passed
+        workers: int, default 1
+            if more than 1 and start_date is passed, [start_date,
+            finish_date] is split into windows which are requested
+            concurrently by `workers` threads
+        compact: {False, True, 'numpy', 'pyarrow'}, default False
+            whether to shrink memory taken by the frames, see
+            utils.compact_df: values are stored as float32, repeated strings
+            as categories, 'pyarrow' also backs the columns with Arrow arrays
+        period: datetime.timedelta or str, default None
+            if passed, data is downsampled to windows of the period (i.e.
+            '15min', '1h') while pages are being received, so that raw
+            packets are never kept in memory at once, see utils.Resampler
+        agg: str or list of str, default 'mean'
+            aggregation of the windows if period is passed, one or a list
+            of 'mean', 'min', 'max', 'count', 'sum', columns are
+            (column, aggregation) MultiIndex if a list is passed
         -------"""
+        self._check_metadata()
+        if period is not None and format != 'json':
+            return self._get_resampled_device_data(
+                    serial_number, start_date, finish_date, last_packet_id,
+                    skip_count, take_count, all_cols, format, verbose,
+                    workers, compact, period, agg)
+        if start_date and last_packet_id is None:
+            packets = fetch_pages(
+                    partial(self._get_device_packets, serial_number),
+                    start_date, finish_date, take_count=take_count,
+                    workers=workers, verbose=verbose, label=serial_number,
+                    **self._device_packets_dates.get(serial_number, {}))
+        else:
+            packets = self._get_device_packets(
+                    serial_number, start_date=start_date,
+                    finish_date=finish_date, last_packet_id=last_packet_id,
+                    skip_count=skip_count, take_count=take_count)
+        if format == 'json':
+            return list(packets)
+        return self._prep_device_data(packets, serial_number,
+                                      all_cols=all_cols, format=format,
+                                      compact=compact)
 
+    def _get_device_packets(self, serial_number: str, **kwargs) -> List[dict]:
+        """
+        Requests raw packets of the device, kwargs are passed to
+        _device_packets_filter
+        """
+        filter_ = self._device_packets_filter(serial_number, **kwargs)
+        return self._make_request(DEVICES_PACKETS_URL, 'Packets',
+                                  Filter=filter_, silent=False)
+
+    def _device_packets_filter(self, serial_number: str, start_date=None,
+                               finish_date=None, last_packet_id=None,
+                               skip_count: int = 0,
+                               take_count: int = 500) -> dict:
+        """
+        Builds "Filter" of the device packets request, see get_device_data
+        for the args description
+        """
         device_id = self._device_by_serial.get(serial_number)
         if not device_id:
             raise NoAccessException(serial_number)
@@ -321,22 +618,53 @@ class CityAirRequest:
         else:
             filter_['FilterType'] = 3
             filter_['Skip'] = skip_count
-        packets = self._make_request(DEVICES_PACKETS_URL, 'Packets',
-                                     Filter=filter_, silent=False)
-        df = pd.DataFrame.from_records(packets)
+        return filter_
+
+    def _prep_device_data(self, packets: List[dict], serial_number: str,
+                          all_cols=False, format: str = 'df',
+                          compact: Union[bool, str] = False
+                          ) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+        """
+        Formats "Packets" of the server response, see get_device_data for
+        the args description
+        """
+        started = time.perf_counter()
+        with self._span('frame', endpoint=DEVICES_PACKETS_URL,
+                        packets=len(packets)) as record:
+            res = self._format_device_frame(
+                    self._device_packets_frame(packets), serial_number,
+                    all_cols=all_cols, format=format, compact=compact)
+            record['build_time'] = time.perf_counter() - started
+        return res
 
+    @staticmethod
+    def _device_packets_frame(packets: List[dict]) -> pd.DataFrame:
+        """
+        Frame of the packets fields and decoded values, which are named
+        "value `device_id` `value_id`"
+        """
+        df = pd.DataFrame.from_records(packets,
+                                       exclude=['Data', 'DataJson'])
         df = unpack_cols(df, ['ServiceData'])
-        df.drop(['DataJson'], 1, inplace=True, errors='ignore')
-        records = []
-        for packets in df['Data']:
-            #  packets = json.loads(packets)
-            records.append(dict(zip(
-                    [f"value {packet['D']} {packet['VT']}" for packet in
-                     packets],
-                    [packet['V'] for packet in packets])))
-        df = df.assign(**pd.DataFrame.from_records(records))
+        values, columns = decode_values([packet['Data']
+                                         for packet in packets])
+        return pd.concat([df, pd.DataFrame(
+                values, index=df.index,
+                columns=[f"value {device_id} {value_id}"
+                         for device_id, value_id in columns])], axis=1)
+
+    def _format_device_frame(self, df: pd.DataFrame, serial_number: str,
+                             all_cols=False, format: str = 'df',
+                             compact: Union[bool, str] = False
+                             ) -> Union[pd.DataFrame,
+                                        Dict[str, pd.DataFrame]]:
+        """
+        Names values columns of _device_packets_frame and formats it, see
+        get_device_data for the args description
+        """
         values_cols = list(
                 filter(lambda col: col.startswith('value'), df.columns))
+        columns = [tuple(map(int, col.split(' ')[1:])) for col in values_cols]
         if format == 'dict':
             res = dict()
             for col in values_cols:
@@ -352,36 +680,221 @@ class CityAirRequest:
                                             axis=1)
             try:
                 res[serial_number] = pd.concat(
-                        [df.drop(values_cols + ['Data', 'SendDate', 'date'],
+                        [df.drop(values_cols + ['SendDate', 'date'],
                                  axis=1, errors='ignore'), res[serial_number]],
                         axis=1)
             except KeyError:
-                res[serial_number] = df.drop(values_cols + ['Data'], axis=1,
+                res[serial_number] = df.drop(values_cols, axis=1,
                                              errors='ignore')
             for device in res:
-                res[device] = prep_df(res[device], index_col='date',
-                                      cols_to_unpack=['coordinates'],
-                                      cols_to_drop=[] if all_cols else
-                                      USELESS_COLS)
+                res[device] = compact_df(
+                        prep_df(res[device], index_col='date',
+                                cols_to_unpack=['coordinates'],
+                                cols_to_drop=[] if all_cols else
+                                USELESS_COLS), compact)
             return res
         elif format == 'df':
-            value_types_count = Counter(list(
-                    map(lambda s: (s.split(' ')[-1]), values_cols)))
-            for col in list(
-                    filter(lambda col: col.startswith('value'), df.columns)):
-                _, device_id, value_id = col.split(' ')
-                serial = self._device_by_id[int(device_id)]
-                value_name = self._device_value_types[int(value_id)]
-                if value_types_count[value_id] > 1:
-                    proper_col_name = f"{value_name} [{serial}]"
-                else:
-                    proper_col_name = f"{value_name}"
-                df.rename(columns={col: proper_col_name}, inplace=True)
-            df = prep_df(df.drop(['Data'], axis=1),
-                         right_param_names=RIGHT_PARAMS_NAMES,
+            df.rename(columns=dict(zip(
+                    values_cols, self._device_value_names(columns))),
+                    inplace=True)
+            df = prep_df(df, right_param_names=RIGHT_PARAMS_NAMES,
                          index_col='date', cols_to_unpack=['coordinates'],
                          cols_to_drop=[] if all_cols else USELESS_COLS)
-            return df
+            return compact_df(df, compact)
+        else:
+            raise ValueError(
+                    f"Unknown option of format argument: {format}. Available "
+                    f"formats are: 'df', 'dict'")
+
+    def _get_resampled_device_data(self, serial_number: str, start_date,
+                                   finish_date, last_packet_id, skip_count,
+                                   take_count, all_cols, format, verbose,
+                                   workers, compact, period, agg
+                                   ) -> Union[pd.DataFrame,
+                                              Dict[str, pd.DataFrame]]:
+        """
+        get_device_data downsampling every page as soon as it's received
+        """
+        resampler = Resampler(to_timedelta(period), agg)
+        update = partial(self._update_device_resampler, resampler)
+        if start_date and last_packet_id is None:
+            fetch_pages(partial(self._get_device_packets, serial_number),
+                        start_date, finish_date, take_count=take_count,
+                        workers=workers, verbose=verbose, label=serial_number,
+                        on_page=update,
+                        **self._device_packets_dates.get(serial_number, {}))
+        else:
+            update(self._get_device_packets(
+                    serial_number, start_date=start_date,
+                    finish_date=finish_date, last_packet_id=last_packet_id,
+                    skip_count=skip_count, take_count=take_count))
+        return self._format_resampled_device_data(
+                resampler, serial_number, all_cols=all_cols, format=format,
+                compact=compact)
+
+    def _update_device_resampler(self, resampler: Resampler,
+                                 packets: List[dict]):
+        df = self._device_packets_frame(packets)
+        if 'coordinates' in df:
+            df = unpack_cols(df, ['coordinates'])
+        resampler.update(df.set_index(to_dates(df['date'])))
+
+    def _format_resampled_device_data(self, resampler: Resampler,
+                                      serial_number: str, all_cols=False,
+                                      format: str = 'df',
+                                      compact: Union[bool, str] = False
+                                      ) -> Union[pd.DataFrame,
+                                                 Dict[str, pd.DataFrame]]:
+        """
+        Values are named once the pages are merged, so that names do not
+        depend on the devices measuring in the particular page
+        """
+        return _format_resampled(
+                resampler, lambda df: self._format_device_frame(
+                        df.reset_index(), serial_number, all_cols=all_cols,
+                        format=format, compact=compact))
+
+    def _device_value_names(self, columns: List[Tuple[int, int]]
+                            ) -> List[str]:
+        """
+        Names of the values columns of the 'df' format of get_device_data:
+        value type, followed by serial_number of the device if a few
+        devices measure values of the type
+
+        :param columns: (device_id, value_id) of the columns, see
+            utils.decode_values
+        """
+        value_types_count = Counter(value_id for _, value_id in columns)
+        names = []
+        for device_id, value_id in columns:
+            value_name = self._device_value_types[int(value_id)]
+            if value_types_count[value_id] > 1:
+                serial = self._device_by_id[int(device_id)]
+                value_name = f"{value_name} [{serial}]"
+            names.append(value_name)
+        return names
+
+    def iter_device_data(self, serial_number: str, start_date=None,
+                         finish_date=None, last_packet_id=None,
+                         take_count: int = 500, all_cols=False,
+                         format: str = 'df', compact: Union[bool, str] = False
+                         ) -> Iterator[Union[pd.DataFrame,
+                                             Dict[str, pd.DataFrame],
+                                             'pa.RecordBatch']]:
+        """
+        Yields data from the selected device page by page, so that only one
+        page is kept in memory
+
+        Every yielded pd.DataFrame has attrs "last_packet_id" and
+        "next_start_date": iteration interrupted could be resumed passing
+        any of them as last_packet_id or start_date
+
+        Parameters
+        ----------
+        serial_number: str
+            serial_number of the device
+        start_date, finish_date: str or datetime.datetime
+            dates on which data is being queried
+        last_packet_id: int, default None
+            if passed, packets are queried starting from this packet_id
+            instead of start_date
+        take_count: int, default 500
+            count of packets in a page, adapted to the server response time
+            if start_date is passed, see utils.Pager
+        all_cols, compact:
+            see get_device_data
+        format:  {'df', 'dict', 'arrow'}, default 'df'
+            * 'df', 'dict' : see get_device_data
+            * 'arrow' : yields pyarrow.RecordBatch made of 'df' page,
+                        resume info is in the schema metadata
+        -------"""
+        self._check_metadata()
+        fetch = partial(self._get_device_packets, serial_number)
+        if last_packet_id is not None:
+            pages = iter_pages_by_id(fetch, last_packet_id,
+                                     take_count=take_count)
+        elif start_date:
+            pages = iter_pages(fetch, Pager(
+                    start_date, finish_date, take_count=take_count,
+                    **self._device_packets_dates.get(serial_number, {})))
+        else:
+            raise ValueError("either start_date or last_packet_id should be "
+                             "passed")
+        for packets in pages:
+            data = self._prep_device_data(
+                    packets, serial_number, all_cols=all_cols,
+                    format='df' if format == 'arrow' else format,
+                    compact=compact)
+            yield _with_resume_info(data, packets, format)
+
+    def get_devices_data(self, serial_numbers: List[str] = None,
+                         start_date=None, finish_date=None,
+                         format: str = 'df', workers: int = DEFAULT_POOL_SIZE,
+                         **kwargs) -> Union[pd.DataFrame,
+                                            Dict[str, pd.DataFrame]]:
+        """
+        Provides data from several devices at once, devices are requested
+        concurrently
+
+        Parameters
+        ----------
+        serial_numbers: list of str, default None
+            serial_numbers of the devices, all the main devices available
+            if not passed
+        start_date, finish_date: str or datetime.datetime
+            dates on which data is being queried
+        format:  {'df', 'dict'}, default 'df'
+            * 'df' : returns one pd.DataFrame indexed by serial_number and
+                     date, columns are value names, child devices are
+                     separate serial_numbers
+            * 'dict' : returns dictionary, where key is serial_number of
+                       the device (including child devices) and value is
+                       pd.DataFrame containing all data of the device
+        workers: int, default {DEFAULT_POOL_SIZE}
+            number of devices requested at the same time
+        **kwargs:
+            passed to get_device_data, i.e. take_count, all_cols, compact
+        -------"""
+        self._check_metadata()
+        serial_numbers = serial_numbers or self.get_devices()
+        # warming up cached lookups not to request them from every thread
+        self._device_by_serial, self._device_by_id, self._device_value_types
+        data = self._fetch_many(self.get_device_data, serial_numbers,
+                                workers, start_date=start_date,
+                                finish_date=finish_date, format='dict',
+                                **kwargs)
+        res = {serial: df for device_data in data.values()
+               for serial, df in device_data.items()}
+        return self._format_many(res, format, 'serial_number')
+
+    def _fetch_many(self, method, items: list, workers: int,
+                    **kwargs) -> dict:
+        """
+        Calls `method` for each of `items` on the pool of `workers` threads,
+        items having no data are skipped
+        """
+
+        def fetch(item):
+            try:
+                return method(item, verbose=False, **kwargs)
+            except EmptyDataException:
+                self.logger.warning("There are no data for %s", item)
+
+        with ThreadPoolExecutor(workers) as pool:
+            res = dict(zip(items, pool.map(fetch, items)))
+        res = {item: data for item, data in res.items() if data is not None}
+        if not res:
+            raise EmptyDataException(item=', '.join(map(str, items)))
+        return res
+
+    @staticmethod
+    def _format_many(res: Dict[object, pd.DataFrame], format: str,
+                     key_name: str) -> Union[pd.DataFrame,
+                                             Dict[object, pd.DataFrame]]:
+        if format == 'dict':
+            return res
+        elif format == 'df':
+            return pd.concat(res, names=[key_name, 'date'], sort=False)
         else:
             raise ValueError(
                     f"Unknown option of format argument: {format}. Available "
@@ -389,76 +902,82 @@ class CityAirRequest:
 
     def get_stations(self, format: str = 'list',
                      include_offline: bool = True, include_3rd_party=False,
+                     refresh: bool = False,
                      ) -> Union[List[str], pd.DataFrame, List[dict]]:
         """
-        Provides devices information in various formats
+        Provides stations information in various formats, see get_devices
+        on the metadata snapshot
 
         Parameters
         ----------
-        format:  {'list', 'df', 'dicts', 'raw'}, default 'list'
-            * 'list' : returns list of serial_numbers
+        format:  {'list', 'df', 'dicts', 'raw', 'json'}, default 'list'
+            * 'list' : returns list of station ids
             * 'df' : returns pd.DataFrame pretty formatted
             * 'dicts' : returns list of dictionaries, each including various
             params
             * 'raw' : returns pd.DataFrame including all info got from
             server, other params are ignored
+            * 'json' : returns list of the records got from server as is,
+            other params are ignored, doesn't import pandas
         include_offline: bool, default True
-           whether to include offline devices to the output
+           whether to include offline stations to the output
         include_3rd_party: bool, default False
             whether to include 3rd party sources (not having devices)
+        refresh: bool, default False
+            whether to request the metadata again, see invalidate_metadata
         -------"""
-        locations_data, stations_data, devices_data = self._make_request(
-                STATIONS_URL, "Locations",
-                "MoItems", "Devices")
-        locations = dict(
-                zip([(data.get('LocationId')) for data in locations_data],
-                    [data.get('Name') for data in locations_data]))
-        for device_data in devices_data:
-            self._device_by_id.update(
-                    {device_data['DeviceId']: device_data['SerialNumber']})
-        df = pd.DataFrame.from_records(stations_data)
+        self._check_metadata(refresh)
+        return self._prep_stations(format=format,
+                                   include_offline=include_offline,
+                                   include_3rd_party=include_3rd_party)
+
+    def _prep_stations(self, format: str = 'list',
+                       include_offline: bool = True,
+                       include_3rd_party=False,
+                       ) -> Union[List[str], pd.DataFrame, List[dict]]:
+        """
+        Looks up stations in the topology, see get_stations for the args
+        description
+        """
         if format == 'raw':
-            return df
-        df = prep_df(df, index_col='id', dropna=False,
-                     cols_to_unpack=['coordinates'])
-        df['devices'] = df['devices_auto'].apply(
-                lambda link: self._device_and_children_by_id.get(
-                        link.get('DeviceId')) if link else [])
-        df['devices'] += df['devices_manual'].apply(
-                lambda links: [self._device_by_id.get(link.get('DeviceId')) for
-                               link in
-                               links] if links else [])
-        df['devices'] = df['devices'].apply(
-                lambda x: x if isinstance(x, list) else [])
-        df.drop(['devices_auto', 'devices_manual'], axis=1, inplace=True)
-        df['location'] = df['location'].apply(
-                lambda id_: locations.get(id_, None) if id_ else None)
-        if not include_3rd_party:
-            df = df[df["devices"].apply(lambda serials: any(
-                    filter(lambda serial: serial.startswith("CA"), serials)))]
-        if not include_offline:
-            df = df[df['is_online']]
-        if format == 'dicts':
-            res = []
-            for _, row in df.reset_index().iterrows():
-                res.append({param: row.get(param) for param in
-                            MAIN_STATION_PARAMS})
-            return res
-        elif format == 'list':
-            return list(df.index)
-        elif format == 'df':
-            return df
-        else:
+            return pd.DataFrame.from_records(
+                    self._stations_metadata['MoItems'])
+        if format == 'json':
+            return list(self._stations_metadata['MoItems'])
+        if format not in ('list', 'df', 'dicts'):
             raise ValueError(
                     f"Unknown type of format argument: {format}. Available "
-                    f"formats are: 'list', 'df', 'dicts', 'raw'")
+                    f"formats are: 'list', 'df', 'dicts', 'raw', 'json'")
+        topology = self._topology
+        if format == 'df':
+            df = topology.stations_frame
+            if not include_3rd_party:
+                df = df[[topology.has_main_device(station_id)
+                         for station_id in df.index]]
+            if not include_offline:
+                df = df[df['is_online']]
+            return df.copy()
+        station_ids = [station_id for station_id in topology.stations
+                       if (include_3rd_party
+                           or topology.has_main_device(station_id))
+                       and (include_offline
+                            or topology.station_is_online[station_id])]
+        if format == 'dicts':
+            return [dict(topology.stations[station_id])
+                    for station_id in station_ids]
+        return station_ids
 
-    @add_progress_bar
     def get_station_data(self, station_id: int,
                          start_date: Union[str, datetime, None] = None,
                          finish_date: Union[str, datetime, None] = None,
                          take_count: int = 1000,
-                         period: Period = Period.TWENTY_MINS) -> pd.DataFrame:
+                         period: Union[Period, timedelta, str] =
+                         Period.TWENTY_MINS,
+                         verbose: bool = True, workers: int = 1,
+                         compact: Union[bool, str] = False,
+                         agg: Union[str, List[str]] = 'mean',
+                         format: str = 'df'
+                         ) -> Union[pd.DataFrame, List[dict]]:
         """
         Provides data from the selected station
         Parameters
@@ -468,12 +987,133 @@ class CityAirRequest:
         start_date, finish_date: str or datetime.datetime
             dates on which data is being queried
         take_count : int, default 1000
-            count of packets which is requested from the server
-        period: Period (enum), default cityair_api.Period.TWENTY_MINS
-            period could be five mins, twenty mins, hour, day
+            count of packets which is requested from the server, the
+            initial one if start_date is passed, see get_device_data
+        period: Period (enum), datetime.timedelta or str,
+                default cityair_api.Period.TWENTY_MINS
+            period could be five mins, twenty mins, hour, day, any other
+            period (i.e. '6h', timedelta(weeks=1)) is downsampled on the
+            client from the coarsest server period dividing it
         verbose: bool, default True:
-            whether to show progress bar
+            whether to show progress bar if start_date is passed
+        workers: int, default 1
+            if more than 1 and start_date is passed, [start_date,
+            finish_date] is split into windows which are requested
+            concurrently by `workers` threads
+        compact: {False, True, 'numpy', 'pyarrow'}, default False
+            see get_device_data
+        agg: str or list of str, default 'mean'
+            aggregation of the windows if period is not a Period, see
+            get_device_data
+        format: {'df', 'json'}, default 'df'
+            'json' returns list of packets got from server as is (of the
+            server period the data would be downsampled from), compact and
+            agg are ignored, doesn't import pandas if period is a Period
+        -------"""
+        self._check_metadata()
+        period, resampler = self._station_resampler(period, agg)
+        if format == 'json':
+            resampler = None
+        on_page = None
+        if resampler is not None:
+            on_page = partial(self._update_station_resampler, resampler)
+        if start_date:
+            packets = fetch_pages(
+                    partial(self._get_station_packets, station_id,
+                            period=period),
+                    start_date, finish_date, take_count=take_count,
+                    workers=workers, verbose=verbose, label=str(station_id),
+                    on_page=on_page)
+        else:
+            packets = self._get_station_packets(
+                    station_id, finish_date=finish_date,
+                    take_count=take_count, period=period)
+            if on_page is not None:
+                on_page(packets)
+        if format == 'json':
+            return list(packets)
+        if resampler is not None:
+            return _format_resampled(resampler,
+                                     partial(compact_df, compact=compact))
+        return self._prep_station_data(packets, compact=compact)
+
+    def _update_station_resampler(self, resampler: Resampler,
+                                  packets: List[dict]):
+        resampler.update(self._prep_station_data(packets))
+
+    @staticmethod
+    def _station_resampler(period: Union[Period, timedelta, str],
+                           agg: Union[str, List[str]] = 'mean'
+                           ) -> Tuple[Period, Union[Resampler, None]]:
+        """
+        Server period to request and the resampler downsampling its data
+        to `period`, which is None if `period` is a Period
+        """
+        if isinstance(period, Period):
+            return period, None
+        interval = to_timedelta(period)
+        aggs = [agg] if isinstance(agg, str) else agg
+        # server windows hold means, which could be averaged further,
+        # other aggregations are computed from the finest windows
+        if set(aggs) == {'mean'}:
+            server_period = Period.coarsest_dividing(interval)
+        else:
+            server_period = Period.FIVE_MINS
+        return server_period, Resampler(interval, agg)
+
+    def iter_station_data(self, station_id: int,
+                          start_date: Union[str, datetime, None] = None,
+                          finish_date: Union[str, datetime, None] = None,
+                          take_count: int = 1000,
+                          period: Period = Period.TWENTY_MINS,
+                          format: str = 'df',
+                          compact: Union[bool, str] = False
+                          ) -> Iterator[Union[pd.DataFrame,
+                                              'pa.RecordBatch']]:
+        """
+        Yields data from the selected station page by page, so that only
+        one page is kept in memory
+
+        Every yielded pd.DataFrame has attr "next_start_date": iteration
+        interrupted could be resumed passing it as start_date
+
+        Parameters
+        ----------
+        station_id, start_date, finish_date, take_count, period, compact:
+            see get_station_data
+        format:  {'df', 'arrow'}, default 'df'
+            * 'df' : yields pd.DataFrame
+            * 'arrow' : yields pyarrow.RecordBatch, resume info is in the
+                        schema metadata
         -------"""
+        self._check_metadata()
+        start_date = start_date or (datetime.now() - timedelta(weeks=1))
+        fetch = partial(self._get_station_packets, station_id,
+                        period=period)
+        for packets in iter_pages(fetch, Pager(start_date, finish_date,
+                                               take_count=take_count)):
+            yield _with_resume_info(
+                    self._prep_station_data(packets, compact=compact),
+                    packets, format)
+
+    def _get_station_packets(self, station_id: int, **kwargs) -> List[dict]:
+        """
+        Requests raw packets of the station, kwargs are passed to
+        _station_packets_filter
+        """
+        filter_ = self._station_packets_filter(station_id, **kwargs)
+        return self._make_request(STATIONS_PACKETS_URL, 'Packets',
+                                  Filter=filter_, silent=False)
+
+    def _station_packets_filter(self, station_id: int,
+                                start_date: Union[str, datetime, None] = None,
+                                finish_date: Union[str, datetime, None] = None,
+                                take_count: int = 1000,
+                                period: Period = Period.TWENTY_MINS) -> dict:
+        """
+        Builds "Filter" of the station packets request, see get_station_data
+        for the args description
+        """
         start_date = start_date or (datetime.now() - timedelta(weeks=1))
         finish_date = finish_date or datetime.utcnow()
         filter_ = {
@@ -484,40 +1124,479 @@ class CityAirRequest:
                 'BeginTime': to_date(start_date, format="str"),
                 'EndTime': to_date(finish_date, format="str")
                 }
-        packets = self._make_request(STATIONS_PACKETS_URL, 'Packets',
-                                     Filter=filter_, silent=False)
-        df = pd.DataFrame.from_records(packets)
-        records = []
-        for packets in df['Data']:
-            records.append(dict(zip(
-                    [self._stations_value_types.get(packet['VT'], 'undefined')
-                     for packet in packets],
-                    [packet['V'] for packet in packets])))
-        df = df.assign(**pd.DataFrame.from_records(records))
-        df = prep_df(df.drop(['Data'], axis=1), index_col='date')
+        return filter_
+
+    def _station_value_names(self, columns: List[Tuple[int]]) -> List[str]:
+        """
+        Names of the values columns of get_station_data, could have
+        duplicates
+
+        :param columns: (value_id,) of the columns, see utils.decode_values
+        """
+        return [self._stations_value_types.get(value_id, 'undefined')
+                for value_id, in columns]
+
+    def _prep_station_data(self, packets: List[dict],
+                           compact: Union[bool, str] = False
+                           ) -> pd.DataFrame:
+        """
+        Formats "Packets" of the station packets response
+        """
+        started = time.perf_counter()
+        with self._span('frame', endpoint=STATIONS_PACKETS_URL,
+                        packets=len(packets)) as record:
+            df = pd.DataFrame.from_records(packets, exclude=['Data'])
+            values, columns = decode_values(
+                    [packet['Data'] for packet in packets], keys=('VT',))
+            values = pd.DataFrame(values, index=df.index,
+                                  columns=self._station_value_names(columns))
+            if values.columns.has_duplicates:
+                values = values.T.groupby(level=0, sort=False).last().T
+            df = pd.concat([df, values], axis=1)
+            df = compact_df(prep_df(df, index_col='date'), compact)
+            record['build_time'] = time.perf_counter() - started
         return df
 
-    def get_locations(self) -> List[dict]:
+    def get_stations_data(self, station_ids: List[int] = None,
+                          start_date: Union[str, datetime, None] = None,
+                          finish_date: Union[str, datetime, None] = None,
+                          format: str = 'df',
+                          workers: int = DEFAULT_POOL_SIZE,
+                          **kwargs) -> Union[pd.DataFrame,
+                                             Dict[int, pd.DataFrame]]:
+        """
+        Provides data from several stations at once, stations are requested
+        concurrently
+
+        Parameters
+        ----------
+        station_ids: list of int, default None
+            ids of the stations, all the stations available if not passed
+        start_date, finish_date: str or datetime.datetime
+            dates on which data is being queried
+        format:  {'df', 'dict'}, default 'df'
+            * 'df' : returns one pd.DataFrame indexed by station id and date
+            * 'dict' : returns dictionary, where key is id of the station
+                       and value is pd.DataFrame containing its data
+        workers: int, default {DEFAULT_POOL_SIZE}
+            number of stations requested at the same time
+        **kwargs:
+            passed to get_station_data, i.e. take_count, period, compact
+        -------"""
+        self._check_metadata()
+        station_ids = station_ids or self.get_stations()
+        self._stations_value_types
+        res = self._fetch_many(self.get_station_data, station_ids, workers,
+                               start_date=start_date,
+                               finish_date=finish_date, **kwargs)
+        return self._format_many(res, format, 'station_id')
+
+    def get_device_logs(self, serial_number: str, start_date=None,
+                        finish_date=None, kind: str = None,
+                        full: bool = False,
+                        take_count: int = DEFAULT_LOGS_TAKE_COUNT,
+                        workers: int = 1) -> pd.DataFrame:
+        """
+        Provides log messages of the device as pd.DataFrame indexed by date
+        with "message" column
+
+        Parameters
+        ----------
+        serial_number: str
+            serial_number of the device
+        start_date, finish_date: str or datetime.datetime
+            dates on which logs are queried, the last day by default
+        kind: {None, 'checkinfo', 'packet'}, default None
+            * None : all the messages
+            * 'checkinfo' : CheckInfo health records, see get_checkinfos
+            * 'packet' : messages on the packets sent
+        full: bool, default False
+            whether to request full messages (LoggerApi/GetFullLogItems)
+        take_count: int, default {DEFAULT_LOGS_TAKE_COUNT}
+            count of messages in a page
+        workers: int, default 1
+            number of date windows requested at the same time
+        -------"""
+        self._check_metadata()
+        frames = self._fetch_logs(serial_number, start_date, finish_date,
+                                  kind=kind, full=full,
+                                  take_count=take_count, workers=workers,
+                                  on_page=partial(self._prep_logs,
+                                                  kind=kind))
+        if not frames:
+            raise EmptyDataException(item=serial_number)
+        return pd.concat(frames).sort_index()
+
+    def _fetch_logs(self, serial_number: str, start_date, finish_date,
+                    on_page: Callable[[List[dict]], Any], kind: str = None,
+                    full: bool = False,
+                    take_count: int = DEFAULT_LOGS_TAKE_COUNT,
+                    workers: int = 1) -> list:
         """
-        Provides information on locations including stations and devices
+        Pages through the logs of [start_date, finish_date], split into
+        windows requested concurrently, passing every page to `on_page`
+        as soon as it's received, so that raw messages are not accumulated
+
+        :return: results of `on_page` for the pages in order of the dates
         """
-        stations = self.get_stations(format='dicts')
-        stations_by_location = {}
-        for station in stations:
-            location = station.pop('location')
-            if location:
+        url = FULL_LOGS_URL if full else LOGS_URL
+        finish_date, windows = _logs_windows(start_date, finish_date, kind,
+                                             workers)
+
+        def fetch_window(window):
+            res, skip = [], 0
+            while True:
+                filter_ = self._logs_filter(serial_number, *window,
+                                            kind=kind, skip=skip,
+                                            take_count=take_count)
                 try:
-                    stations_by_location[location].append(station)
-                except KeyError:
-                    stations_by_location[location] = [station]
-
-        locations_data = self._make_request(STATIONS_URL, "Locations")
-        locations_data = prep_dicts(locations_data, RIGHT_PARAMS_NAMES,
-                                    USELESS_COLS + ['LocationId'])
-        for location_data in locations_data:
-            location_data['stations'] = stations_by_location.get(
-                    location_data.get('name'))
-        return locations_data
+                    items = self._make_request(url, 'LogItems',
+                                               Filter=filter_, silent=False)
+                except EmptyDataException:
+                    break
+                page_size = len(items)
+                items = _clip_logs(items, window, finish_date)
+                if items:
+                    res.append(on_page(items))
+                if page_size < take_count:
+                    break
+                skip += take_count
+            return res
+
+        with ThreadPoolExecutor(workers) as pool:
+            return [res for window_res in pool.map(fetch_window, windows)
+                    for res in window_res]
+
+    def _logs_filter(self, serial_number: str, start_date, finish_date,
+                     kind: str = None, skip: int = 0,
+                     take_count: int = DEFAULT_LOGS_TAKE_COUNT) -> dict:
+        """
+        Builds "Filter" of the logs request, see get_device_logs for the
+        args description
+        """
+        if serial_number not in self._device_by_serial:
+            raise NoAccessException(serial_number)
+        suffix = LOG_FILTERS[kind][1] if kind else ''
+        return {
+                'FilterType': 1,
+                'BeginTime': to_date(start_date, format='str'),
+                'EndTime': to_date(finish_date, format='str'),
+                'Skip': skip,
+                'Take': take_count,
+                'PacketSenderIds': PACKET_SENDER_IDS,
+                'FilterText': f"{serial_number}{suffix}",
+                }
+
+    @staticmethod
+    def _prep_logs(items: List[dict], kind: str = None) -> pd.DataFrame:
+        """
+        Formats "LogItems" of the logs response into a frame indexed by
+        date, messages not matching the pattern of the `kind` are dropped
+        """
+        df = pd.DataFrame.from_records(items,
+                                       columns=['TimeStamp', 'Message'])
+        df = df.rename(columns={'TimeStamp': 'date', 'Message': 'message'})
+        df['date'] = to_dates(df['date'])
+        df = df.set_index('date')
+        if kind is not None:
+            df = df[df['message'].str.contains(LOG_FILTERS[kind][0])]
+        return df
+
+    def get_checkinfos(self, serial_numbers: List[str] = None,
+                       start_date=None, finish_date=None,
+                       format: str = 'df', errors_only: bool = False,
+                       workers: int = DEFAULT_POOL_SIZE,
+                       take_count: int = DEFAULT_LOGS_TAKE_COUNT
+                       ) -> pd.DataFrame:
+        """
+        Provides CheckInfo health records of the devices modules parsed from
+        their logs, devices are requested concurrently and every page of
+        the logs is parsed as soon as it's received
+
+        Parameters
+        ----------
+        serial_numbers: list of str, default None
+            serial_numbers of the devices, all the main devices available
+            if not passed
+        start_date, finish_date: str or datetime.datetime
+            dates on which logs are queried, the last day by default
+        format: {'df', 'summary'}, default 'df'
+            * 'df' : returns pd.DataFrame indexed by serial_number and date
+                     with a row per record: module, has_error,
+                     errors_count, details
+            * 'summary' : returns pd.DataFrame indexed by serial_number and
+                          module: records count, records having errors,
+                          total errors_count, dates of the last record and
+                          of the last error
+        errors_only: bool, default False
+            whether to keep only the records having errors
+        workers: int, default {DEFAULT_POOL_SIZE}
+            number of devices requested at the same time
+        take_count: int, default {DEFAULT_LOGS_TAKE_COUNT}
+            count of messages in a page
+        -------"""
+        self._check_metadata()
+        _check_checkinfos_format(format)
+        serial_numbers = serial_numbers or self.get_devices()
+        self._device_by_serial
+        res = self._fetch_many(self._device_checkinfos, serial_numbers,
+                               workers, start_date=start_date,
+                               finish_date=finish_date,
+                               errors_only=errors_only,
+                               take_count=take_count)
+        return _format_checkinfos(res, format)
+
+    def _device_checkinfos(self, serial_number: str, start_date=None,
+                           finish_date=None, errors_only: bool = False,
+                           take_count: int = DEFAULT_LOGS_TAKE_COUNT,
+                           verbose: bool = False) -> pd.DataFrame:
+        """
+        CheckInfo records of the device, see get_checkinfos for the args
+        description, verbose is ignored
+        """
+        frames = self._fetch_logs(serial_number, start_date, finish_date,
+                                  on_page=partial(self._prep_checkinfos,
+                                                  errors_only=errors_only),
+                                  kind='checkinfo', full=True,
+                                  take_count=take_count)
+        return _concat_checkinfos(frames, serial_number)
+
+    @classmethod
+    def _prep_checkinfos(cls, items: List[dict],
+                         errors_only: bool = False) -> pd.DataFrame:
+        """
+        Parses CheckInfo records of the page of logs
+        """
+        df = parse_checkinfos(
+                cls._prep_logs(items, kind='checkinfo')['message'] + '\n')
+        return df[df['has_error']] if errors_only else df
+
+    def get_locations(self, refresh: bool = False) -> List[dict]:
+        """
+        Provides information on locations including stations and devices,
+        see get_devices on the metadata snapshot
+
+        Parameters
+        ----------
+        refresh: bool, default False
+            whether to request the metadata again, see invalidate_metadata
+        -------"""
+        self._check_metadata(refresh)
+        return self._prep_locations()
+
+    def _prep_locations(self) -> List[dict]:
+        """
+        Groups stations of the topology by locations
+        """
+        topology = self._topology
+        locations = []
+        for location in topology.locations:
+            stations = [{key: value
+                         for key, value in topology.stations[station_id]
+                        .items() if key != 'location'}
+                        for station_id in topology.stations_by_location.get(
+                            location.get('name'), [])
+                        if topology.has_main_device(station_id)]
+            locations.append(dict(location, stations=stations or None))
+        return locations
+
+    def nearest_stations(self, latitude: Coordinate, longitude: Coordinate,
+                         k: int = 1, refresh: bool = False) -> pd.DataFrame:
+        """
+        Looks up CityAir stations nearest to the points in the spatial index
+        of the metadata snapshot
+
+        Parameters
+        ----------
+        latitude, longitude: float or array-like of floats
+            coordinates of the point (points) in degrees
+        k: int, default 1
+            number of stations for every point
+        refresh: bool, default False
+            whether to request the metadata again, see invalidate_metadata
+
+        Returns
+        -------
+        pd.DataFrame with 'station_id' and 'distance' (km) columns indexed
+        by 'rank' (0 is the nearest station), additionally indexed by
+        'point' (position of the point) if arrays are passed
+        -------"""
+        self._check_metadata(refresh)
+        return self._topology.stations_index.nearest(
+                latitude, longitude, k).rename(columns={'id': 'station_id'})
+
+    def stations_in_bbox(self, min_latitude: Coordinate,
+                         min_longitude: Coordinate, max_latitude: Coordinate,
+                         max_longitude: Coordinate, refresh: bool = False
+                         ) -> Union[List[int], List[List[int]]]:
+        """
+        Looks up CityAir stations within the bounding box in the spatial
+        index of the metadata snapshot
+
+        Parameters
+        ----------
+        min_latitude, min_longitude, max_latitude, max_longitude:
+            float or array-like of floats
+            bounds of the box (boxes) in degrees, min_longitude greater than
+            max_longitude is the box crossing the antimeridian
+        refresh: bool, default False
+            whether to request the metadata again, see invalidate_metadata
+
+        Returns
+        -------
+        list of station ids, list of them for every box if arrays are passed
+        -------"""
+        self._check_metadata(refresh)
+        return self._topology.stations_index.in_bbox(
+                min_latitude, min_longitude, max_latitude, max_longitude)
+
+    def nearest_devices(self, latitude: Coordinate, longitude: Coordinate,
+                        k: int = 1, refresh: bool = False) -> pd.DataFrame:
+        """
+        Looks up main devices nearest to the points by their last known
+        coordinates, the result has 'serial_number' column instead of
+        'station_id', see nearest_stations for the args description
+        """
+        self._check_metadata(refresh)
+        return self._topology.devices_index.nearest(
+                latitude, longitude, k).rename(
+                columns={'id': 'serial_number'})
+
+    def devices_in_bbox(self, min_latitude: Coordinate,
+                        min_longitude: Coordinate, max_latitude: Coordinate,
+                        max_longitude: Coordinate, refresh: bool = False
+                        ) -> Union[List[str], List[List[str]]]:
+        """
+        Looks up serial_numbers of main devices within the bounding box by
+        their last known coordinates, see stations_in_bbox for the args
+        description
+        """
+        self._check_metadata(refresh)
+        return self._topology.devices_index.in_bbox(
+                min_latitude, min_longitude, max_latitude, max_longitude)
+
+
+def _logs_windows(start_date, finish_date, kind: str = None,
+                  workers: int = 1) -> Tuple[datetime,
+                                             List[Tuple[datetime, datetime]]]:
+    """
+    Checks the args of the logs request, see get_device_logs for their
+    description
+
+    :return: finish_date and `workers` windows of the logs range
+    """
+    finish_date = to_date(finish_date or datetime.utcnow())
+    start_date = to_date(start_date or finish_date - timedelta(days=1))
+    if kind is not None and kind not in LOG_FILTERS:
+        raise ValueError(f"Unknown kind of logs: {kind}. Available "
+                         f"kinds are: {', '.join(LOG_FILTERS)}")
+    return finish_date, split_dates(start_date, finish_date, max(workers, 1))
+
+
+def _clip_logs(items: List[dict], window: Tuple[datetime, datetime],
+               finish_date: datetime) -> List[dict]:
+    if window[1] < finish_date:
+        # messages of the windows boundary are passed once
+        items = [item for item in items
+                 if to_date(item['TimeStamp']) < window[1]]
+    return items
+
+
+def _check_checkinfos_format(format: str):
+    if format not in ('df', 'summary'):
+        raise ValueError(
+                f"Unknown option of format argument: {format}. Available "
+                f"formats are: 'df', 'summary'")
+
+
+def _concat_checkinfos(frames: List[pd.DataFrame],
+                       serial_number: str) -> pd.DataFrame:
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        raise EmptyDataException(item=serial_number)
+    return pd.concat(frames)[CHECKINFO_COLS]
+
+
+def _format_checkinfos(res: Dict[str, pd.DataFrame],
+                       format: str) -> pd.DataFrame:
+    """
+    Joins CheckInfo records of the devices, see get_checkinfos
+    """
+    df = pd.concat(res, names=['serial_number', 'date'])
+    # categories differ between devices, so they are lost by concat
+    for col in ('module', 'details'):
+        df[col] = df[col].astype('category')
+    if format == 'summary':
+        return _summarize_checkinfos(df)
+    return df
+
+
+def _summarize_checkinfos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per device and module table of get_checkinfos records
+    """
+    df = df.reset_index('date')
+    errors = df[df['has_error']]
+    by_module = ['serial_number', 'module']
+    res = df.groupby(by_module, observed=True).agg(
+            checks=('has_error', 'size'), errors=('has_error', 'sum'),
+            errors_count=('errors_count', 'sum'),
+            last_check_date=('date', 'max'))
+    res['last_error_date'] = errors.groupby(by_module,
+                                            observed=True)['date'].max()
+    return res
+
+
+def _format_resampled(resampler: Resampler,
+                      format_frame: Callable[[pd.DataFrame], Any]):
+    """
+    Formats the result of the resampler with `format_frame` separately for
+    every aggregation, joining the results into (column, aggregation)
+    columns if there are a few aggregations
+    """
+    res = resampler.result()
+    if isinstance(resampler.agg, str):
+        return format_frame(res)
+    formatted = {agg: format_frame(res.xs(agg, axis=1, level=1))
+                 for agg in resampler.agg}
+    first = next(iter(formatted.values()))
+    if isinstance(first, dict):
+        return {key: _join_aggs({agg: frames[key]
+                                 for agg, frames in formatted.items()
+                                 if key in frames})
+                for key in first}
+    return _join_aggs(formatted)
+
+
+def _join_aggs(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    res = pd.concat(frames, axis=1).swaplevel(axis=1)
+    columns = dict.fromkeys(col for col, _ in res.columns)
+    return res[[(col, agg) for col in columns for agg in frames
+                if (col, agg) in res.columns]]
+
+
+def _with_resume_info(data, packets: List[dict], format: str):
+    """
+    Adds info required to resume paging after `packets` to attrs of the
+    frames, converts 'df' into pyarrow.RecordBatch if format is 'arrow'
+    """
+    resume_info = {'next_start_date': last_packet_date(packets) + Pager.step}
+    if 'PacketId' in packets[-1]:
+        resume_info['last_packet_id'] = max(packet['PacketId']
+                                            for packet in packets)
+    frames = data.values() if isinstance(data, dict) else [data]
+    for df in frames:
+        df.attrs.update(resume_info)
+    if format == 'arrow':
+        if pa is None:
+            raise ImportError("pyarrow is required for 'arrow' format, "
+                              "install it with `pip install pyarrow`")
+        batch = pa.RecordBatch.from_pandas(data)
+        metadata = dict(batch.schema.metadata or {})
+        metadata.update({key: str(value)
+                         for key, value in resume_info.items()})
+        return batch.replace_schema_metadata(metadata)
+    return data
 
 
 CAR = CityAirRequest
@@ -1,3 +1,6 @@
+import os
+from datetime import timedelta
+
 TOKEN_VAR_NAME = 'CITYAIR_TOKEN'
 
 DEFAULT_HOST = "https://my.cityair.io/api/request.php?map="
@@ -8,6 +11,31 @@ STATIONS_PACKETS_URL = "MoApi2/GetMoPackets"
 LOGS_URL = "LoggerApi/GetLogItems"
 FULL_LOGS_URL = "LoggerApi/GetFullLogItems"
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_MAX_CONCURRENCY = 20  # for AsyncCityAirRequest
+DEFAULT_BACKOFF_FACTOR = 0.5  # seconds, doubled on every next attempt
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+REQUEST_METRICS_MAXLEN = 1000  # latest requests to keep metrics of
+DEFAULT_MEMO_SIZE = 128  # responses to keep if memo_ttl is passed
+
+# adaptive paging: pages grow while responses are faster and smaller than
+# the targets, and shrink when they are not or the request times out
+PAGE_MIN_TAKE_COUNT = 100
+PAGE_MAX_TAKE_COUNT = 10000
+PAGE_TARGET_SECONDS = 2.0
+PAGE_TARGET_BYTES = 5 * 2 ** 20
+PAGE_WINDOWS_PER_WORKER = 4  # date windows paged concurrently per worker
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'cityair_api')
+DEFAULT_CACHE_TTL = timedelta(days=30)
+DEFAULT_CACHE_MAX_PACKETS = 10 ** 7
+DEFAULT_METADATA_TTL = timedelta(hours=1)
+DEFAULT_WATCH_INTERVAL = timedelta(minutes=1)
+DEFAULT_WATCH_JITTER = 0.1  # fraction of the interval
+DEFAULT_REPORT_INTERVAL = timedelta(seconds=10)  # of cityair-export
+
 PACKET_SENDER_IDS = [{"AppId": 4, "SenderIds": [23]},
                      {"AppId": 2, "SenderIds": [7]}]  # for logs lookups
 
@@ -17,3 +45,11 @@ LOG_PACKET_FILTER_PATTERN = r"#PT#\d+"
 LOG_PACKET_ADDITIONAL_FILTER_SUFFIX = " PT"
 LOG_EXTRACT_PATTERN = r"#([^']*)##"
 CHECKINFO_PARSE_PATTERN = r"#CheckInfo#{([^'\n]*)}\n"
+# kind of the logs: (messages pattern, suffix of the server filter)
+LOG_FILTERS = {
+        'checkinfo': (LOG_CHECKINFO_FILTER_PATTERN,
+                      LOG_CHECKINFO_ADDITIONAL_FILTER_SUFFIX),
+        'packet': (LOG_PACKET_FILTER_PATTERN,
+                   LOG_PACKET_ADDITIONAL_FILTER_SUFFIX),
+        }
+DEFAULT_LOGS_TAKE_COUNT = 1000
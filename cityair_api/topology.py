@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+from cached_property import threaded_cached_property
+
+from .geo import SpatialIndex
+from .lazy import lazy_import
+from .utils import (
+    MAIN_STATION_PARAMS, RIGHT_PARAMS_NAMES, USELESS_COLS,
+    map_device_and_children_by_id, map_device_by_id, prep_df, prep_dicts,
+    prep_record,
+    )
+
+pd = lazy_import('pandas')
+
+
+class Topology:
+    """
+    Snapshot of the devices, stations and locations available, built once
+    from "Devices" of GetDevices and "Locations", "MoItems", "Devices" of
+    GetMoItems responses
+
+    Records are formatted as the ones of CityAirRequest.get_devices,
+    get_stations and get_locations, relations between them are kept in
+    hash indexes:
+
+    * children_by_parent, parent_by_child: serial_numbers of the devices
+    * devices_by_station, stations_by_device: station ids and serial_numbers
+      of the devices linked to them (automatically and manually)
+    * stations_by_location: location name and ids of its stations
+
+    Records are built without pandas, stations_frame (get_stations 'df'),
+    stations_index and devices_index (spatial indexes of the coordinates of
+    CityAir stations and main devices) are built on first use
+    """
+
+    def __init__(self, devices_data: List[dict], locations_data: List[dict],
+                 stations_data: List[dict],
+                 station_devices_data: List[dict] = ()):
+        self.devices: Dict[str, dict] = {}  # main devices only
+        self.children: Dict[str, dict] = {}
+        self.children_by_parent: Dict[str, List[str]] = {}
+        self.parent_by_child: Dict[str, str] = {}
+        self.device_coordinates: Dict[str, tuple] = {}
+        for device_data in devices_data:
+            device = prep_record(device_data)
+            geo = device_data.get('DeviceLastGeo') or {}
+            self.device_coordinates[device['serial_number']] = (
+                    geo.get('Latitude'), geo.get('Longitude'))
+            children = prep_dicts(device.get('children', []),
+                                  RIGHT_PARAMS_NAMES, USELESS_COLS)
+            device['children'] = [
+                    {key: value for key, value in child.items()
+                     if key != 'id'} for child in children]
+            serial = device['serial_number']
+            self.devices[serial] = device
+            self.children_by_parent[serial] = []
+            for child in children:
+                self.children[child['serial_number']] = child
+                self.children_by_parent[serial].append(
+                        child['serial_number'])
+                self.parent_by_child[child['serial_number']] = serial
+
+        device_by_id = map_device_by_id(devices_data)
+        device_by_id.update({data['DeviceId']: data['SerialNumber']
+                             for data in station_devices_data})
+        device_and_children_by_id = map_device_and_children_by_id(
+                devices_data)
+        location_names = {data.get('LocationId'): data.get('Name')
+                          for data in locations_data}
+        self.devices_by_station: Dict[int, List[str]] = {}
+        self.stations_by_device: Dict[str, List[int]] = {}
+        self.stations_by_location: Dict[str, List[int]] = {}
+        self.stations: Dict[int, dict] = {}
+        self.station_is_online: Dict[int, bool] = {}
+        self._stations_data = stations_data
+        self._location_by_station: Dict[int, Optional[str]] = {}
+        for station_data in sorted(stations_data,
+                                   key=lambda data: data.get('MoId')):
+            station_id = station_data.get('MoId')
+            link = station_data.get('DeviceLink')
+            serials = list(device_and_children_by_id.get(
+                    link.get('DeviceId'), [])) if link else []
+            serials += [device_by_id.get(link.get('DeviceId'))
+                        for link in station_data.get('ManualDeviceLinks')
+                        or []]
+            self.devices_by_station[station_id] = serials
+            for serial in dict.fromkeys(serials):
+                self.stations_by_device.setdefault(serial, []).append(
+                        station_id)
+            location = location_names.get(station_data.get('LocationId'))
+            self._location_by_station[station_id] = location
+            if location:
+                self.stations_by_location.setdefault(location, []).append(
+                        station_id)
+            station = prep_record(station_data, cols_to_drop=[],
+                                  dropna=False)
+            station.update(prep_record(station.pop('coordinates', None) or {},
+                                       cols_to_drop=[], dropna=False),
+                           devices=serials, location=location)
+            self.stations[station_id] = {param: station.get(param)
+                                         for param in MAIN_STATION_PARAMS}
+            self.station_is_online[station_id] = station.get('is_online',
+                                                             True)
+        self.locations = prep_dicts(locations_data, RIGHT_PARAMS_NAMES,
+                                    USELESS_COLS + ['LocationId'])
+
+    @threaded_cached_property
+    def stations_frame(self) -> pd.DataFrame:
+        """
+        get_stations 'df' of all the stations
+        """
+        df = prep_df(pd.DataFrame.from_records(self._stations_data),
+                     index_col='id', dropna=False,
+                     cols_to_unpack=['coordinates'])
+        df = df.drop(['devices_auto', 'devices_manual'], axis=1,
+                     errors='ignore')
+        df['devices'] = [self.devices_by_station.get(station_id, [])
+                         for station_id in df.index]
+        df['location'] = [self._location_by_station.get(station_id)
+                          for station_id in df.index]
+        return df
+
+    def has_main_device(self, station_id: int) -> bool:
+        """
+        Whether the station is linked to CityAir device, i.e. is not a 3rd
+        party source
+        """
+        return any(serial and serial.startswith("CA")
+                   for serial in self.devices_by_station.get(station_id, []))
+
+    def device_stations(self, serial_number: str) -> List[dict]:
+        """
+        Records of the stations the device is linked to, without "devices",
+        3rd party stations are skipped
+        """
+        return [{key: value for key, value in self.stations[station_id]
+                 .items() if key != 'devices'}
+                for station_id in self.stations_by_device.get(serial_number,
+                                                              [])
+                if station_id in self.stations
+                and self.has_main_device(station_id)]
+
+    @threaded_cached_property
+    def stations_index(self) -> SpatialIndex:
+        ids = [station_id for station_id in self.stations
+               if self.has_main_device(station_id)]
+        return SpatialIndex(ids, *_coordinates(
+                [(self.stations[station_id]['latitude'],
+                  self.stations[station_id]['longitude'])
+                 for station_id in ids]))
+
+    @threaded_cached_property
+    def devices_index(self) -> SpatialIndex:
+        return SpatialIndex(list(self.device_coordinates), *_coordinates(
+                self.device_coordinates.values()))
+
+
+def _coordinates(pairs) -> tuple:
+    """
+    Latitudes and longitudes of (latitude, longitude) pairs, None is nan
+    """
+    nan = float('nan')
+    pairs = [(nan if lat is None else lat, nan if lon is None else lon)
+             for lat, lon in pairs]
+    if not pairs:
+        return [], []
+    latitudes, longitudes = zip(*pairs)
+    return list(latitudes), list(longitudes)
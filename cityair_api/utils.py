@@ -1,22 +1,61 @@
+from __future__ import annotations
+
 import datetime
+import json
 import logging
 import re
-import sys
+import threading
 import time
-from collections import defaultdict
-from functools import wraps
-from typing import List, Optional, Union
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
+from operator import itemgetter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from cityair_api.settings import (
+    CHECKINFO_PARSE_PATTERN, DEFAULT_MEMO_SIZE, PAGE_MAX_TAKE_COUNT,
+    PAGE_MIN_TAKE_COUNT, PAGE_TARGET_BYTES, PAGE_TARGET_SECONDS,
+    PAGE_WINDOWS_PER_WORKER,
+    )
+from .exceptions import EmptyDataException, TimeoutException
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+progressbar = lazy_import('progressbar')
+pa = lazy_import('pyarrow', optional=True)
+orjson = lazy_import('orjson', optional=True)
+msgspec = lazy_import('msgspec', optional=True)
 
-import pandas as pd
-import progressbar
-import pytz
+logger = logging.getLogger(__name__)
 
-from cityair_api.settings import CHECKINFO_PARSE_PATTERN
-from .exceptions import EmptyDataException
+CHECKINFO_RE = re.compile(CHECKINFO_PARSE_PATTERN)
+CHECKINFO_COLS = ['module', 'has_error', 'errors_count', 'details']
 
-logger = logging.getLogger(__name__)
+
+def _loads_orjson(content: Union[bytes, str]):
+    return orjson.loads(content)
+
+
+def _loads_msgspec(content: Union[bytes, str]):
+    try:
+        return msgspec.json.decode(content)
+    except msgspec.DecodeError as e:
+        raise ValueError(str(e)) from e
+
+
+# installed json decoders, all of them accept bytes and str, their modules
+# are imported on the first decoding
+JSON_DECODERS = {'json': json.loads}
+if msgspec is not None:
+    JSON_DECODERS['msgspec'] = _loads_msgspec
+if orjson is not None:
+    JSON_DECODERS['orjson'] = _loads_orjson
+DEFAULT_JSON_DECODER = list(JSON_DECODERS)[-1]  # the fastest installed one
+JSON_DECODE_ERRORS = (ValueError,)  # orjson's error is ValueError too
 
 FATHER_PREFIXES = ["CA", "ROOFTOP", "LAB"]
+ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
 
 
 def is_main_device(serial):
@@ -85,70 +124,511 @@ MAIN_STATION_PARAMS = ['id', 'name', 'name_ru', 'location', 'gmt_offset',
                        'devices', 'latitude', 'longitude']
 
 
-def add_progress_bar(method):
+def map_device_by_serial(devices_data: List[dict]) -> Dict[str, int]:
+    return {data.get('SerialNumber'): data.get('DeviceId')
+            for data in devices_data}
+
+
+def map_device_packets_dates(devices_data: List[dict]
+                             ) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    first_date (see Pager) of the devices packets
     """
-    Decorator to display progress bar
+    return {data.get('SerialNumber'): {
+                    'first_date': data.get('DeviceFirstDate')}
+            for data in devices_data}
+
+
+def map_device_by_id(devices_data: List[dict]) -> Dict[int, str]:
+    device_by_id = {data.get('DeviceId'): data.get('SerialNumber')
+                    for data in devices_data}
+    for device in devices_data:
+        for child in device.get('ChildDevices', []):
+            device_by_id.update({child["DeviceId"]: child['SerialNumber']})
+    return device_by_id
+
+
+def map_device_and_children_by_id(devices_data: List[dict]) \
+        -> Dict[int, List[str]]:
+    res = {}
+    for data in devices_data:
+        key = data.get('DeviceId')
+        serials = [data.get('SerialNumber')]
+        for child_data in data.get('ChildDevices'):
+            serials.append(child_data.get('SerialNumber'))
+            res[child_data.get('Id')] = [child_data.get('SerialNumber')]
+        res[key] = serials
+    return res
+
+
+def map_value_types(value_types_data: List[dict],
+                    unique_names: bool = False) -> Dict[int, str]:
+    value_types = {data.get('ValueType'): data.get('TypeName')
+                   for data in value_types_data}
+    if unique_names:
+        # adding "_" to not unique value type names
+        name_counts = Counter(value_types.values())
+        for id, name in value_types.items():
+            current_count = name_counts[name]
+            if current_count > 1:
+                value_types[id] = name + (current_count - 1) * "_"
+                name_counts[name] = current_count - 1
+    return value_types
 
+
+def loads_json(content: Union[bytes, str], decoder: str = None):
     """
-    progress_scaler = 10 ** 6
-    default_take_count = 500
-
-    @wraps(method)
-    def progressed(*args, **kwargs):
-        start_date = to_date(kwargs.get('start_date'))
-        if not start_date:
-            return method(*args, **kwargs)
-        finish_date = to_date(
-                kwargs.get('finish_date', datetime.datetime.utcnow()))
-        kwargs.update(take_count=kwargs.get('take_count', default_take_count))
-        bar = progressbar.ProgressBar(max_value=(finish_date - start_date)
-                                      .total_seconds() / progress_scaler,
-                                      widgets=[
-                                              f"{args[1]}",
-                                              ': ',
-                                              progressbar.Percentage(),
-                                              '    ',
-                                              progressbar.Timer(),
-                                              progressbar.Bar(),
-                                              progressbar.ETA()
-                                              ],
-                                      max_error=False
-                                      )
-        if kwargs.get('format', 'df') == 'df':
-            res = pd.DataFrame()
+    Decodes json with orjson or msgspec if installed, falls back to the
+    standard json module, raises ValueError if it's invalid
+
+    :param decoder: name of the decoder in JSON_DECODERS, default
+        DEFAULT_JSON_DECODER
+    """
+    return JSON_DECODERS[decoder or DEFAULT_JSON_DECODER](content)
+
+
+def split_dates(start_date: datetime.datetime,
+                finish_date: datetime.datetime,
+                count: int) -> List[Tuple[datetime.datetime,
+                                          datetime.datetime]]:
+    """
+    Splits [start_date, finish_date] into `count` equal adjacent windows,
+    the finish of every window is the start of the next one
+    """
+    step = (finish_date - start_date) / count
+    bounds = [start_date + i * step for i in range(count)] + [finish_date]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def last_packet_date(packets: List[dict]) -> datetime.datetime:
+    # dates of packets are iso formatted, so could be compared as strings
+    return to_date(max(packet['SendDate'] for packet in packets))
+
+
+class SingleFlight:
+    """
+    Merges concurrent calls of the same key: the first caller runs the
+    function, the others wait for it and get the same result (or
+    exception). If `ttl` is passed, results are also kept for `ttl` after
+    the call, at most `maxsize` latest of them
+
+    The result object is shared by all the callers, so it must be treated
+    as read-only: CityAirRequest never modifies the parsed responses, its
+    frames and records are built from them, lists of packets are copied
+    before they are returned as 'json'
+    """
+
+    def __init__(self, ttl: datetime.timedelta = None,
+                 maxsize: int = DEFAULT_MEMO_SIZE):
+        self.ttl = ttl.total_seconds() if ttl else 0
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._calls: Dict[object, Future] = {}
+        self._memo = OrderedDict()  # key: (expiration time, result)
+
+    def do(self, key, func: Callable[[], object]):
+        with self._lock:
+            memo = self._memo.get(key)
+            if memo and memo[0] > time.monotonic():
+                self._memo.move_to_end(key)
+                return memo[1]
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._calls[key] = Future()
+        if not is_leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            with self._lock:
+                future.set_exception(e)
+                del self._calls[key]
+            raise
+        # the call is removed once its result is set (and memoized), so
+        # that the callers coming in between wait for it instead of
+        # calling the function again
+        with self._lock:
+            if self.ttl:
+                self._memo[key] = (time.monotonic() + self.ttl, result)
+                self._memo.move_to_end(key)
+                while len(self._memo) > self.maxsize:
+                    self._memo.popitem(last=False)
+            future.set_result(result)
+            del self._calls[key]
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+
+
+class Pager:
+    """
+    State of paging through [start_date, finish_date] (or half-open
+    [start_date, finish_date) window): every next page starts `step` after
+    the last fetched packet, pages are requested until the server returns
+    an empty page or the one reaching finish_date. Incomplete page is not
+    the last one, as the server may return fewer packets than take_count
+
+    Adaptive pager doubles take_count while pages are received faster and
+    are smaller than the targets (PAGE_TARGET_SECONDS, PAGE_TARGET_BYTES),
+    halves it when they are not or the request times out, keeping it in
+    [PAGE_MIN_TAKE_COUNT, PAGE_MAX_TAKE_COUNT] (extended to the initial
+    take_count)
+    """
+    step = datetime.timedelta(seconds=30)
+
+    def __init__(self, start_date, finish_date=None, take_count: int = 500,
+                 adaptive: bool = True, first_date=None,
+                 closed: bool = True):
+        """
+        :param first_date: date of the first packet known (i.e.
+            DeviceFirstDate of the device), paging starts from it
+        :param closed: whether packets of finish_date belong to the range,
+            windows of fetch_pages except the last one are half-open, so
+            that every packet belongs to exactly one window
+        """
+        self.start_date = to_date(start_date)
+        first_date = to_date(first_date)
+        if first_date and first_date > self.start_date:
+            self.start_date = first_date
+        self.finish_date = to_date(
+                finish_date or datetime.datetime.utcnow())
+        self.take_count = take_count
+        self.adaptive = adaptive
+        self.closed = closed
+        self.min_take_count = min(take_count, PAGE_MIN_TAKE_COUNT)
+        self.max_take_count = max(take_count, PAGE_MAX_TAKE_COUNT)
+        self.page_start_date = self.start_date
+        self.is_finished = self.start_date >= self.finish_date
+
+    @property
+    def kwargs(self) -> dict:
+        """
+        kwargs for requesting the next page
+        """
+        return dict(start_date=self.page_start_date,
+                    finish_date=self.finish_date, take_count=self.take_count)
+
+    def update(self, packets: List[dict], elapsed: float = None) -> float:
+        """
+        Moves to the next page after `packets` were fetched
+
+        :param packets: packets of the page, empty if there is no data
+        :param elapsed: seconds the page was being fetched, page size is
+            adapted to it if passed
+        :return: seconds of [start_date, finish_date] passed by the page
+        """
+        previous_start_date = self.page_start_date
+        if not packets:
+            self.is_finished = True
+            return max((self.finish_date - previous_start_date)
+                       .total_seconds(), 0)
+        last_date = last_packet_date(packets)
+        if self.adaptive and elapsed is not None:
+            self._adapt(packets, elapsed)
+        self.page_start_date = last_date + self.step
+        if self.closed:
+            self.is_finished = self.page_start_date > self.finish_date
         else:
-            res = defaultdict(pd.DataFrame)
-        while finish_date - start_date > datetime.timedelta(hours=1):
-            try:
-                data = method(*args, **kwargs)
-                if isinstance(res, pd.DataFrame):
-                    res = pd.concat([res, data], sort=False)
-                    start_date = res.index[-1]
+            self.is_finished = self.page_start_date >= self.finish_date
+        return (min(last_date, self.finish_date)
+                - previous_start_date).total_seconds()
+
+    def clip(self, packets: List[dict]) -> List[dict]:
+        """
+        Packets of the page within the range, the ones of finish_date are
+        dropped if the range is half-open
+        """
+        if self.closed or not packets \
+                or last_packet_date(packets) < self.finish_date:
+            return packets
+        return [packet for packet in packets
+                if to_date(packet['SendDate']) < self.finish_date]
+
+    def _adapt(self, packets: List[dict], elapsed: float):
+        # packets of a page are alike, so the first one is enough to
+        # estimate the size of the page
+        size = len(json.dumps(packets[0])) * len(packets)
+        if elapsed > PAGE_TARGET_SECONDS or size > PAGE_TARGET_BYTES:
+            self.shrink()
+        elif (len(packets) == self.take_count
+              and elapsed < PAGE_TARGET_SECONDS / 2
+              and size < PAGE_TARGET_BYTES / 2):
+            self.take_count = min(self.take_count * 2, self.max_take_count)
+
+    def shrink(self) -> bool:
+        """
+        Halves take_count, i.e. after the request timed out
+
+        :return: False if the pager is not adaptive or take_count is
+            minimal already
+        """
+        if not self.adaptive or self.take_count <= self.min_take_count:
+            return False
+        self.take_count = max(self.take_count // 2, self.min_take_count)
+        return True
+
+
+def iter_pages(fetch: Callable[..., List[dict]], pager: Pager,
+               on_progress: Callable[[float], None] = None
+               ) -> Iterator[List[dict]]:
+    """
+    Yields pages of raw packets, the page timed out is requested again
+    with smaller take_count if the pager is adaptive
+
+    :param fetch: function requesting packets by start_date, finish_date
+        and take_count kwargs, raising EmptyDataException if there are none
+    :param pager: Pager
+    :param on_progress: called with seconds passed by every page
+    """
+    while not pager.is_finished:
+        started = time.perf_counter()
+        try:
+            packets = fetch(**pager.kwargs)
+        except EmptyDataException:
+            packets = []
+        except TimeoutException:
+            if pager.shrink():
+                logger.info("page timed out, retrying with take_count %d",
+                            pager.take_count)
+                continue
+            raise
+        progress = pager.update(packets, time.perf_counter() - started)
+        if on_progress:
+            on_progress(progress)
+        packets = pager.clip(packets)
+        if packets:
+            yield packets
+
+
+def iter_pages_by_id(fetch: Callable[..., List[dict]],
+                     last_packet_id: int = 0, take_count: int = 500
+                     ) -> Iterator[List[dict]]:
+    """
+    Yields pages of raw packets having PacketId greater than
+    `last_packet_id`, until the server returns an empty page. Incomplete
+    page is not the last one, as the server may return fewer packets than
+    take_count
+
+    :param fetch: function requesting packets by last_packet_id and
+        take_count kwargs, raising EmptyDataException if there are none
+    """
+    while True:
+        try:
+            packets = fetch(last_packet_id=last_packet_id,
+                            take_count=take_count)
+        except EmptyDataException:
+            return
+        if not packets:
+            return
+        yield packets
+        last_packet_id = max(packet['PacketId'] for packet in packets)
+
+
+def progress_updater(start_date: datetime.datetime,
+                     finish_date: datetime.datetime, verbose: bool = True,
+                     label: str = '') -> Callable[[float], None]:
+    """
+    Displays progress bar of paging through [start_date, finish_date]
+
+    :return: thread safe function adding seconds passed by a page
+    """
+    progress_scaler = 10 ** 6
+    bar_class = progressbar.ProgressBar if verbose else progressbar.NullBar
+    bar = bar_class(max_value=max((finish_date - start_date)
+                                  .total_seconds() / progress_scaler, 0),
+                    widgets=[
+                            f"{label}",
+                            ': ',
+                            progressbar.Percentage(),
+                            '    ',
+                            progressbar.Timer(),
+                            progressbar.Bar(),
+                            progressbar.ETA()
+                            ],
+                    max_error=False
+                    )
+    bar_lock = threading.Lock()
+
+    def update_bar(seconds):
+        with bar_lock:
+            bar.update(min(bar.value + seconds / progress_scaler,
+                           bar.max_value))
+
+    return update_bar
+
+
+def fetch_pages(fetch: Callable[..., List[dict]], start_date,
+                finish_date=None, take_count: int = 500, workers: int = 1,
+                verbose: bool = True, label: str = '',
+                on_page: Callable[[List[dict]], None] = None,
+                first_date=None) -> Optional[List[dict]]:
+    """
+    Requests all the packets of [start_date, finish_date] page by page,
+    displaying progress bar
+
+    If `workers` is more than 1, the range is split into windows which are
+    requested concurrently by the pool of `workers` threads and then
+    joined, all the windows but the last one are half-open, so the packets
+    are the same as the ones requested by a single worker
+
+    :param fetch: see iter_pages
+    :param label: label of the progress bar
+    :param on_page: if passed, it's called with every page instead of
+        accumulating packets, pages of different windows come in any order
+        (from different threads)
+    :param first_date: see Pager
+    :return: packets or None if `on_page` is passed
+    """
+    start_date = max(filter(None, [to_date(start_date), to_date(first_date)]))
+    finish_date = to_date(finish_date or datetime.datetime.utcnow())
+    update_bar = progress_updater(start_date, finish_date, verbose, label)
+
+    def fetch_window(window):
+        pager = Pager(*window, take_count=take_count,
+                      closed=window[1] >= finish_date)
+        pages = iter_pages(fetch, pager, update_bar)
+        if on_page is None:
+            return list(chain.from_iterable(pages))
+        count = 0
+        for packets in pages:
+            on_page(packets)
+            count += len(packets)
+        return count
+
+    if workers > 1:
+        windows = split_dates(start_date, finish_date,
+                              workers * PAGE_WINDOWS_PER_WORKER)
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(fetch_window, windows))
+    else:
+        results = [fetch_window((start_date, finish_date))]
+    if on_page is None:
+        packets = list(chain.from_iterable(results))
+        count = len(packets)
+    else:
+        packets = None
+        count = sum(results)
+    logger.info(f'finished acquiring {label} data of size {count}')
+    if not count:
+        raise EmptyDataException(item=label)
+    return packets
+
+
+class Resampler:
+    """
+    Streaming downsampling of frames indexed by date into windows of
+    `period`: every frame is reduced to count, sum, min and max of its
+    numeric columns per window, which are merged with the ones of the
+    previous frames, so that only aggregates are kept in memory and frames
+    could come in any order, i.e. from different threads
+    """
+    AGGREGATIONS = ('mean', 'min', 'max', 'count', 'sum')
+    _compact_every = 32
+
+    def __init__(self, period: datetime.timedelta,
+                 agg: Union[str, List[str]] = 'mean'):
+        """
+        :param period: length of the windows, they are aligned to the unix
+            epoch (so to midnight only if period divides a day) not to
+            depend on the order of the frames, windows having no data are
+            skipped
+        :param agg: one or a list of {AGGREGATIONS}, if a list is passed,
+            columns of the result are (column, aggregation) MultiIndex
+        """
+        aggs = [agg] if isinstance(agg, str) else list(agg)
+        unknown = set(aggs) - set(self.AGGREGATIONS)
+        if unknown:
+            raise ValueError(f"Unknown aggregations: {unknown}. Available "
+                             f"aggregations are: {self.AGGREGATIONS}")
+        self.freq = pd.Timedelta(period)
+        self.agg = agg
+        self._aggs = aggs
+        self._partials = []
+        self._lock = threading.Lock()
+
+    def update(self, df: pd.DataFrame):
+        df = df.select_dtypes(include='number')
+        windows = df.index.floor(self.freq)
+        partial = df.groupby(windows).agg(['count', 'sum', 'min', 'max'])
+        with self._lock:
+            self._partials.append(partial)
+            if len(self._partials) >= self._compact_every:
+                self._partials = [self._merge(self._partials)]
+
+    @staticmethod
+    def _merge(partials: List[pd.DataFrame]) -> pd.DataFrame:
+        merged = pd.concat(partials, sort=False)
+        stats = merged.columns.get_level_values(1)
+        return merged.groupby(level=0).agg(
+                dict(zip(merged.columns,
+                         ['sum' if stat in ('count', 'sum') else stat
+                          for stat in stats])))
+
+    def result(self) -> pd.DataFrame:
+        """
+        Aggregated values of all the frames passed to update
+        """
+        with self._lock:
+            if not self._partials:
+                return pd.DataFrame()
+            merged = self._merge(self._partials)
+        columns = dict.fromkeys(merged.columns.get_level_values(0))
+        res = {}
+        for col in columns:
+            count = merged[(col, 'count')]
+            for agg in self._aggs:
+                if agg == 'mean':
+                    res[(col, agg)] = merged[(col, 'sum')] / count.where(
+                            count > 0)
                 else:
-                    for serial, df in data.items():
-                        res[serial] = pd.concat([res[serial], df], sort=False)
-                    start_date = max([res[key].index[-1] for key in res])
-            except EmptyDataException:
-                start_date += datetime.timedelta(days=2)
-            kwargs.update(
-                    start_date=start_date + datetime.timedelta(seconds=30))
-            fetched_seconds = (finish_date.replace(tzinfo=pytz.utc)
-                               - start_date.replace(
-                            tzinfo=pytz.utc)).total_seconds()
-            bar.update(bar.max_value - (fetched_seconds / progress_scaler))
-        size = len(res) if isinstance(res, pd.DataFrame) else max(
-                map(len, res.values()))
-        logger.info(f'finished acquiring {args[1]} data of size {size}')
-        if size == 0:
-            raise EmptyDataException(request_args=kwargs)
+                    res[(col, agg)] = merged[(col, agg)]
+        res = pd.DataFrame(res, index=merged.index)
+        res.index.name = 'date'
+        if isinstance(self.agg, str):
+            res.columns = res.columns.droplevel(1)
         return res
 
-    return progressed
+
+def decode_values(data: List[List[dict]], keys: Tuple[str, ...] = ('D', 'VT')
+                  ) -> Tuple[np.ndarray, List[tuple]]:
+    """
+    Decodes "Data" arrays of packets, i.e. [{"D": 1, "VT": 2, "V": 3.0}],
+    into a 2d array having a row per packet and a column per unique
+    combination of `keys` values
+
+    :param data: "Data" array of every packet
+    :param keys: names of integer fields identifying the value
+    :return: array of values (nan if the packet has no value) and list of
+        `keys` values tuples of the columns in order of first appearance
+    """
+    lengths = np.fromiter(map(len, data), dtype=np.int64, count=len(data))
+    items = list(chain.from_iterable(data))
+    packet_idx = np.repeat(np.arange(len(data)), lengths)
+    values = np.array(list(map(itemgetter('V'), items)), dtype=float)
+    key_arrays = [np.fromiter(map(itemgetter(key), items), dtype=np.int64,
+                              count=len(items)) for key in keys]
+    codes = key_arrays[0]
+    for key_array in key_arrays[1:]:
+        codes = codes * (key_array.max(initial=0) + 1) + key_array
+    codes, uniques = pd.factorize(codes)
+    _, first_positions = np.unique(codes, return_index=True)
+    columns = list(zip(*[key_array[first_positions].tolist()
+                         for key_array in key_arrays]))
+    res = np.full((len(data), len(uniques)), np.nan)
+    # the latest value wins if packet has a few values of the same column
+    res[packet_idx, codes] = values
+    return res, columns
 
 
 def unpack_cols(df, cols_to_unpack, right_params_names=RIGHT_PARAMS_NAMES):
     for col in cols_to_unpack:
-        df = df.assign(**df[col].apply(pd.Series)).drop(col, 1)
+        unpacked = pd.DataFrame.from_records(
+                [value if isinstance(value, dict) else {}
+                 for value in df[col]], index=df.index)
+        df = df.assign(**unpacked).drop(col, axis=1)
     df.rename(right_params_names, axis=1, inplace=True)
     return df
 
@@ -173,10 +653,35 @@ def prep_dicts(dicts, newkeys, keys_to_drop, dropna=True):
     return res
 
 
+def prep_record(record: dict, right_param_names: dict = RIGHT_PARAMS_NAMES,
+                cols_to_drop: List[str] = USELESS_COLS,
+                dropna: bool = True) -> dict:
+    """
+    Single record counterpart of prep_df: renames keys, drops useless and
+    empty ones, parses dates and replaces is_offline with is_online
+    """
+    res = {}
+    is_offline = None
+    for key, value in record.items():
+        if dropna and value is None:
+            continue
+        key = right_param_names.get(key, key)
+        if key in cols_to_drop:
+            continue
+        if key == 'is_offline':
+            is_offline = value
+            continue
+        if 'date' in key.lower():
+            value = to_date(value)
+        res[key] = value
+    if is_offline is not None:
+        res['is_online'] = not is_offline
+    return res
+
+
 def parse_checkinfo(msg: str) -> List[dict]:
     parsed_checkinfo = []
-    parse_re = re.compile(CHECKINFO_PARSE_PATTERN)
-    infos = parse_re.findall(msg.replace(", ", ","))
+    infos = CHECKINFO_RE.findall(msg.replace(", ", ","))
     if not infos:
         raise ValueError("checkinfo data should be in the format"
                          f" of \"{CHECKINFO_PARSE_PATTERN}\"")
@@ -190,6 +695,32 @@ def parse_checkinfo(msg: str) -> List[dict]:
     return parsed_checkinfo
 
 
+def parse_checkinfos(messages: pd.Series) -> pd.DataFrame:
+    """
+    Vectorized parse_checkinfo: a row per CheckInfo record of the messages
+    indexed by the index of the message, messages without records are
+    skipped, module and details are categorical
+    """
+    infos = messages.str.replace(", ", ",", regex=False) \
+        .str.extractall(CHECKINFO_RE)[0]
+    if infos.empty:
+        return pd.DataFrame(columns=CHECKINFO_COLS,
+                            index=messages.index[:0])
+    infos.index = infos.index.droplevel('match')
+    fields = infos.str.split(',', n=3, expand=True) \
+        .reindex(columns=range(4))
+    errors_count = pd.to_numeric(fields[2], errors='coerce') \
+        .fillna(0).astype(np.int32)
+    details = fields[3].str.replace('"', '', regex=False) \
+        .astype('category')
+    return pd.DataFrame({
+            'module': fields[0].astype('category'),
+            'has_error': fields[1] != 'ok',
+            'errors_count': errors_count,
+            'details': details},
+            index=fields.index)
+
+
 def to_date(date: Union[datetime.datetime, str, None],
             format: str = 'date') -> Optional[Union[str, datetime.datetime]]:
     """
@@ -204,7 +735,14 @@ def to_date(date: Union[datetime.datetime, str, None],
     if isinstance(date, datetime.datetime):
         pass
     elif isinstance(date, str):
-        date = pd.to_datetime(date, dayfirst=True)
+        # day can't go first in iso dates, which are parsed way faster
+        if ISO_DATE_RE.match(date):
+            try:
+                date = datetime.datetime.fromisoformat(date)
+            except ValueError:
+                date = pd.Timestamp(date)
+        else:
+            date = pd.to_datetime(date, dayfirst=True)
     else:
         raise ValueError(f"date should be 'str' or 'datetime', "
                          f"got {type(date)} instead")
@@ -218,6 +756,63 @@ def to_date(date: Union[datetime.datetime, str, None],
                          f"got {format} instead")
 
 
+def to_timedelta(period: Union[datetime.timedelta, str]
+                 ) -> datetime.timedelta:
+    """
+    :param period: timedelta or pandas offset alias, i.e. '15min', '1h'
+    """
+    if isinstance(period, datetime.timedelta):
+        return period
+    if isinstance(period, str):
+        return pd.Timedelta(period).to_pytimedelta()
+    raise ValueError(f"period should be 'str' or 'timedelta', "
+                     f"got {type(period)} instead")
+
+
+def to_dates(dates: pd.Series) -> pd.Series:
+    """
+    Column counterpart of to_date: parses all the dates at once and drops
+    timezones keeping local time, empty values become NaT. Falls back to
+    to_date of every value if the column can't be parsed at once, i.e. has
+    dates with different timezones. Dates are datetime64[ns] as the ones
+    written by export.ArrowExporter, whatever unit pandas parses them to
+    """
+    res = _parse_dates(dates)
+    if pd.api.types.is_datetime64_dtype(res):
+        try:
+            return res.astype('datetime64[ns]')
+        except (pd.errors.OutOfBoundsDatetime, OverflowError):
+            pass
+    return res
+
+
+def _parse_dates(dates: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return _drop_tz(dates)
+    if not (pd.api.types.is_object_dtype(dates)
+            or pd.api.types.is_string_dtype(dates)):
+        return dates.apply(to_date)
+    dates = dates.where(dates.astype(bool))
+    is_valid = dates.notna().to_numpy()
+    if not is_valid.any():
+        return pd.to_datetime(dates)
+    first = dates.iat[is_valid.argmax()]
+    is_iso = isinstance(first, str) and bool(ISO_DATE_RE.match(first))
+    try:
+        res = pd.to_datetime(dates, dayfirst=not is_iso)
+    except (ValueError, TypeError):
+        return dates.apply(to_date)
+    if not pd.api.types.is_datetime64_any_dtype(res):
+        return dates.apply(to_date)
+    return _drop_tz(res)
+
+
+def _drop_tz(dates: pd.Series) -> pd.Series:
+    if dates.dt.tz is None:
+        return dates
+    return dates.dt.tz_localize(None)
+
+
 def prep_df(df: pd.DataFrame, right_param_names: dict = RIGHT_PARAMS_NAMES,
             cols_to_drop: List[str] = USELESS_COLS,
             dicts_cols: List[str] = [], dropna: bool = True,
@@ -238,7 +833,7 @@ def prep_df(df: pd.DataFrame, right_param_names: dict = RIGHT_PARAMS_NAMES,
         res.dropna(how='all', axis=1, inplace=True)
     for col in res:
         if 'date' in col.lower():
-            res[col] = res[col].apply(to_date)
+            res[col] = to_dates(res[col])
     try:
         res['is_online'] = ~ res['is_offline']
         res.drop('is_offline', axis=1, inplace=True)
@@ -252,22 +847,50 @@ def prep_df(df: pd.DataFrame, right_param_names: dict = RIGHT_PARAMS_NAMES,
     return res
 
 
-def timeit(method):
-    """
-    Decorator to print time elapsed
-
+def compact_df(df: pd.DataFrame, compact: Union[bool, str] = True
+               ) -> pd.DataFrame:
     """
-
-    @wraps(method)
-    def timed(*args, **kwargs):
-        ts = time.time()
-        result = method(*args, **kwargs)
-        te = time.time()
-
-        logger.debug(
-                f"{te - ts:.2f} seconds took to {method.__name__} of size"
-                f"{sys.getsizeof(result) / 1000: .2f} KB\nargs were"
-                f" {', '.join(map(str, args[1:]))}\nkwargs were: {kwargs}")
-        return result
-
-    return timed
+    Shrinks memory taken by the frame: floats are stored as float32,
+    integers as the smallest integer type fitting them, repeated strings
+    as categories and dates index as datetime64[ns]
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        frame to shrink, it's not modified
+    compact: {False, True, 'numpy', 'pyarrow'}, default True
+        * False : returns df as it is
+        * True, 'numpy' : numpy dtypes
+        * 'pyarrow' : additionally backs the columns with pyarrow arrays
+    -------"""
+    if not compact:
+        return df
+    if compact not in (True, 'numpy', 'pyarrow'):
+        raise ValueError(f"Unknown option of compact argument: {compact}. "
+                         f"Available options are: True, 'numpy', 'pyarrow'")
+    columns = []
+    for _, col in df.items():
+        if pd.api.types.is_float_dtype(col):
+            col = col.astype('float32')
+        elif pd.api.types.is_integer_dtype(col):
+            col = pd.to_numeric(col, downcast='integer')
+        elif (pd.api.types.is_string_dtype(col)
+              and pd.api.types.infer_dtype(col, skipna=True) == 'string'
+              and col.nunique() < len(col) / 2):
+            col = col.astype('category')
+        columns.append(col)
+    res = pd.concat(columns, axis=1) if columns else df.copy()
+    if not isinstance(res.index, pd.MultiIndex) \
+            and (isinstance(res.index, pd.DatetimeIndex)
+                 or res.index.name == 'date'):
+        # pandas 2+ keeps the unit of the parsed dates (i.e. 'us')
+        res.index = pd.to_datetime(res.index).astype('datetime64[ns]')
+    if compact == 'pyarrow':
+        if pa is None:
+            raise ImportError("pyarrow is required for compact='pyarrow', "
+                              "install it with `pip install pyarrow`")
+        index = res.index
+        res = pa.Table.from_pandas(res).to_pandas(types_mapper=pd.ArrowDtype)
+        res.index = index
+    res.attrs.update(df.attrs)
+    return res
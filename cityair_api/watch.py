@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import (
+    AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union,
+    )
+
+from .cache import DEVICE, STATION
+from .exceptions import EmptyDataException
+from .lazy import lazy_import
+from .request import CityAirRequest, Period
+from .settings import (
+    DEFAULT_POOL_SIZE, DEFAULT_WATCH_INTERVAL, DEFAULT_WATCH_JITTER,
+    )
+from .utils import Pager, iter_pages, iter_pages_by_id, last_packet_date
+
+pd = lazy_import('pandas')
+
+Feed = Tuple[str, Union[str, int]]  # (DEVICE, serial) or (STATION, id)
+
+
+class FeedWatcher:
+    """
+    Polls devices and stations for new packets, keeping a cursor per feed:
+    the last PacketId for devices and the date after the last packet for
+    stations, so that every poll downloads only the packets which were not
+    received before
+
+    Every feed is polled every `interval` (randomly shifted by `jitter` not
+    to request all of them at the same moment), at most `workers` feeds
+    are requested at once. New rows are pushed to a callback, or iterated
+    synchronously or asynchronously::
+
+        watcher = FeedWatcher(CityAirRequest(token), serial_numbers)
+        watcher.watch(lambda feed, df: print(feed, df))  # blocks
+        for (source, key), df in watcher:
+            ...
+        async for (source, key), df in watcher:
+            ...
+
+    watcher.stop() (e.g. from the callback) finishes any of them.
+    """
+
+    def __init__(self, request: CityAirRequest,
+                 serial_numbers: List[str] = None,
+                 station_ids: List[int] = None,
+                 interval: timedelta = DEFAULT_WATCH_INTERVAL,
+                 jitter: float = DEFAULT_WATCH_JITTER,
+                 workers: int = DEFAULT_POOL_SIZE, backfill: int = 1,
+                 period: Period = Period.FIVE_MINS, take_count: int = 500,
+                 all_cols=False, compact: Union[bool, str] = False):
+        """
+        Parameters
+        ----------
+        request: CityAirRequest
+            used to request packets from the server
+        serial_numbers: list of str, default None
+            devices to watch
+        station_ids: list of int, default None
+            stations to watch
+        interval: datetime.timedelta, default {DEFAULT_WATCH_INTERVAL}
+            time between polls of the same feed
+        jitter: float, default {DEFAULT_WATCH_JITTER}
+            every delay between polls is randomly changed by up to this
+            fraction of the interval
+        workers: int, default {DEFAULT_POOL_SIZE}
+            max number of feeds requested at the same time
+        backfill: int, default 1
+            number of the latest packets (station periods) pushed on the
+            first poll of the feed, 0 to push only the ones received later
+        period: Period (enum), default cityair_api.Period.FIVE_MINS
+            period of the stations data
+        take_count: int, default 500
+            page size, new packets are paged through if there are more
+        all_cols, compact:
+            see CityAirRequest.get_device_data
+        """
+        if not serial_numbers and not station_ids:
+            raise ValueError("either serial_numbers or station_ids should "
+                             "be passed")
+        self.request = request
+        self.interval = interval
+        self.jitter = jitter
+        self.workers = workers
+        self.backfill = backfill
+        self.period = period
+        self.take_count = take_count
+        self.all_cols = all_cols
+        self.compact = compact
+        self.cursors: Dict[Feed, Union[int, datetime, None]] = {
+                **{(DEVICE, serial): None
+                   for serial in serial_numbers or []},
+                **{(STATION, station_id): None
+                   for station_id in station_ids or []}}
+        self._due = dict.fromkeys(self.cursors, 0.)
+        self._stopped = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def stop(self):
+        """
+        Finishes watch and iteration after the current poll
+        """
+        self._stopped.set()
+
+    def poll(self, force: bool = False) -> List[Tuple[Feed, pd.DataFrame]]:
+        """
+        Requests the feeds which are due (all of them if `force`) and
+        returns their new rows, feeds failed are logged and requested
+        again on the next poll
+        """
+        now = time.monotonic()
+        due = [feed for feed, at in self._due.items() if force or at <= now]
+        if not due:
+            return []
+        # warming up cached lookups not to request them from every thread
+        self.request._check_metadata()
+        if any(source == DEVICE for source, _ in due):
+            self.request._device_by_serial, self.request._device_value_types
+        if any(source == STATION for source, _ in due):
+            self.request._stations_value_types
+        with ThreadPoolExecutor(min(self.workers, len(due))) as pool:
+            results = list(pool.map(self._poll_feed, due))
+        for feed in due:
+            self._due[feed] = time.monotonic() + self._delay()
+        return [(feed, df) for feed, df in zip(due, results)
+                if df is not None]
+
+    def _delay(self) -> float:
+        return self.interval.total_seconds() * (
+                1 + random.uniform(-self.jitter, self.jitter))
+
+    def _wait_time(self) -> float:
+        return max(0., min(self._due.values()) - time.monotonic())
+
+    def _poll_feed(self, feed: Feed) -> Optional[pd.DataFrame]:
+        source, key = feed
+        try:
+            if source == DEVICE:
+                return self._poll_device(key)
+            return self._poll_station(key)
+        except Exception:
+            self.logger.exception("Failed to poll %s %s", source, key)
+            return None
+
+    def _poll_device(self, serial_number: str) -> Optional[pd.DataFrame]:
+        feed = (DEVICE, serial_number)
+        fetch = partial(self.request._get_device_packets, serial_number)
+        last_packet_id = self.cursors[feed]
+        if last_packet_id is None:
+            # the latest packets set the cursor
+            try:
+                packets = fetch(take_count=max(self.backfill, 1))
+            except EmptyDataException:
+                packets = []
+            if packets:
+                self.cursors[feed] = max(packet['PacketId']
+                                         for packet in packets)
+            packets = packets[len(packets) - self.backfill:]
+        else:
+            packets = [packet for page in iter_pages_by_id(
+                    fetch, last_packet_id, take_count=self.take_count)
+                       for packet in page]
+            if packets:
+                self.cursors[feed] = max(packet['PacketId']
+                                         for packet in packets)
+        if not packets:
+            return None
+        return self.request._prep_device_data(
+                packets, serial_number, all_cols=self.all_cols,
+                compact=self.compact)
+
+    def _poll_station(self, station_id: int) -> Optional[pd.DataFrame]:
+        feed = (STATION, station_id)
+        start_date = self.cursors[feed]
+        is_first = start_date is None
+        if is_first:
+            start_date = (datetime.utcnow()
+                          - self.period.interval * max(self.backfill, 1))
+        fetch = partial(self.request._get_station_packets, station_id,
+                        period=self.period)
+        packets = [packet for page in iter_pages(
+                fetch, Pager(start_date, take_count=self.take_count,
+                             adaptive=False))
+                   for packet in page]
+        if not packets:
+            return None
+        self.cursors[feed] = last_packet_date(packets) + Pager.step
+        if is_first and not self.backfill:
+            return None
+        return self.request._prep_station_data(packets,
+                                               compact=self.compact)
+
+    def watch(self, callback: Callable[[Feed, pd.DataFrame], None],
+              rounds: int = None):
+        """
+        Polls the feeds until stop() is called, passing every feed new rows
+        to the callback
+
+        :param rounds: max number of polls, unlimited by default
+        """
+        for _ in self._rounds(rounds):
+            for feed, df in self.poll():
+                callback(feed, df)
+
+    def _rounds(self, rounds: int = None) -> Iterator[int]:
+        self._stopped.clear()
+        count = 0
+        while not self._stopped.is_set() and (rounds is None
+                                              or count < rounds):
+            if count:
+                self._stopped.wait(self._wait_time())
+                if self._stopped.is_set():
+                    return
+            yield count
+            count += 1
+
+    def __iter__(self) -> Iterator[Tuple[Feed, pd.DataFrame]]:
+        for _ in self._rounds():
+            yield from self.poll()
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[Feed, pd.DataFrame]]:
+        loop = asyncio.get_running_loop()
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            for update in await loop.run_in_executor(None, self.poll):
+                yield update
+            await asyncio.sleep(self._wait_time())
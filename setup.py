@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(
         name='cityair-api',
@@ -15,4 +15,7 @@ setup(
         install_requires=[
                 'pandas', 'requests', 'progressbar2==3.50.1',
                 'cached-property'],
+        entry_points={
+                'console_scripts': ['cityair-export = cityair_api.cli:main'],
+                },
         )
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from cityair_api import AsyncCityAirRequest  # noqa: E402
+from mock_server import MOCK_TOKEN  # noqa: E402
+
+
+@pytest.fixture()
+def AR(mock_R, mock_server):
+    return AsyncCityAirRequest(MOCK_TOKEN, host_url=mock_server.url)
+
+
+def test_get_devices(AR, mock_R):
+    devices = asyncio.run(AR.get_devices())
+    assert devices == mock_R.get_devices()
+
+
+def test_get_device_data_concurrently(AR, mock_R):
+    async def fetch(serials):
+        return await asyncio.gather(*[AR.get_device_data(serial,
+                                                         take_count=5)
+                                      for serial in serials])
+
+    dfs = asyncio.run(fetch(mock_R.get_devices()[:5]))
+    for df in dfs:
+        assert isinstance(df, pd.DataFrame)
+        assert len(df) == 5
+
+
+def test_get_device_data_workers(AR, mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    kwargs = dict(start_date=mock_server.finish_date - timedelta(days=2),
+                  finish_date=mock_server.finish_date, take_count=100,
+                  verbose=False)
+    expected = mock_R.get_device_data(serial, **kwargs)
+    df = asyncio.run(AR.get_device_data(serial, workers=3, **kwargs))
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_get_station_data(AR, mock_R, mock_server):
+    station_id = mock_R.get_stations()[0]
+    kwargs = dict(start_date=mock_server.finish_date - timedelta(days=2),
+                  finish_date=mock_server.finish_date, take_count=50,
+                  verbose=False)
+    expected = mock_R.get_station_data(station_id, **kwargs)
+    df = asyncio.run(AR.get_station_data(station_id, workers=3, **kwargs))
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_loop_change(AR):
+    """
+    the object is reused in another asyncio.run, the session of the closed
+    loop is replaced and closed
+    """
+    serial = asyncio.run(AR.get_devices())[0]
+    client = AR._client
+    df = asyncio.run(AR.get_device_data(serial, take_count=5))
+    assert len(df) == 5
+    assert client.closed
+    assert AR._client is not client and not AR._client.closed
+    asyncio.run(AR.aclose())
+    assert AR._client.closed
+
+
+def test_metadata_expires(mock_R, mock_server):
+    AR = AsyncCityAirRequest(MOCK_TOKEN, host_url=mock_server.url,
+                             metadata_ttl=timedelta(seconds=1))
+    AR.invalidate_metadata()
+
+    async def get_devices_twice():
+        await AR.get_devices()
+        count = len(AR.request_metrics)
+        await AR.get_devices()
+        assert len(AR.request_metrics) == count
+        await asyncio.sleep(1.5)
+        await AR.get_devices()
+        assert len(AR.request_metrics) == 2 * count
+        await AR.aclose()
+
+    asyncio.run(get_devices_twice())
+
+
+def test_get_devices_data(AR, mock_R, mock_server):
+    serials = mock_R.get_devices()[:3]
+    kwargs = dict(start_date=mock_server.finish_date - timedelta(hours=6),
+                  finish_date=mock_server.finish_date, take_count=50)
+    expected = mock_R.get_devices_data(serials, **kwargs)
+    df = asyncio.run(AR.get_devices_data(serials, workers=2, **kwargs))
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_get_stations_data(AR, mock_R, mock_server):
+    station_ids = mock_R.get_stations()[:3]
+    kwargs = dict(start_date=mock_server.finish_date - timedelta(days=1),
+                  finish_date=mock_server.finish_date)
+    expected = mock_R.get_stations_data(station_ids, **kwargs)
+    df = asyncio.run(AR.get_stations_data(station_ids, **kwargs))
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_get_device_logs(AR, mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    kwargs = dict(start_date=mock_server.finish_date - timedelta(hours=10),
+                  finish_date=mock_server.finish_date, take_count=7,
+                  workers=2)
+    expected = mock_R.get_device_logs(serial, **kwargs)
+    logs = asyncio.run(AR.get_device_logs(serial, **kwargs))
+    pd.testing.assert_frame_equal(logs, expected)
+
+
+def test_get_checkinfos(AR, mock_R, mock_server):
+    serials = mock_R.get_devices()[:3]
+    kwargs = dict(start_date=mock_server.finish_date - timedelta(days=1),
+                  finish_date=mock_server.finish_date, format='summary')
+    expected = mock_R.get_checkinfos(serials, **kwargs)
+    df = asyncio.run(AR.get_checkinfos(serials, **kwargs))
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_iter_device_data(AR, mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    kwargs = dict(start_date=mock_server.finish_date - timedelta(hours=6),
+                  finish_date=mock_server.finish_date, take_count=20)
+
+    async def collect(**kwargs):
+        return [df async for df in AR.iter_device_data(serial, **kwargs)]
+
+    pages = asyncio.run(collect(**kwargs))
+    expected = list(mock_R.iter_device_data(serial, **kwargs))
+    assert len(pages) == len(expected) > 1
+    for df, expected_df in zip(pages, expected):
+        pd.testing.assert_frame_equal(df, expected_df)
+        assert df.attrs == expected_df.attrs
+    by_id = asyncio.run(collect(last_packet_id=0, take_count=20))
+    assert by_id[0].attrs['last_packet_id'] > 0
+
+
+def test_iter_station_data(AR, mock_R, mock_server):
+    station_id = mock_R.get_stations()[0]
+    kwargs = dict(start_date=mock_server.finish_date - timedelta(days=2),
+                  finish_date=mock_server.finish_date, take_count=50)
+
+    async def collect():
+        return [df async for df in AR.iter_station_data(station_id,
+                                                        **kwargs)]
+
+    pages = asyncio.run(collect())
+    expected = list(mock_R.iter_station_data(station_id, **kwargs))
+    assert len(pages) == len(expected) > 1
+    pd.testing.assert_frame_equal(pd.concat(pages), pd.concat(expected))
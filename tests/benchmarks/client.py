@@ -0,0 +1,109 @@
+"""
+Client methods against the local mock server: wall time is measured by
+pytest-benchmark, peak memory (tracemalloc) and number of requests of a
+separate run are saved to extra_info of the benchmark
+"""
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from cityair_api import CAR
+from mock_server import MOCK_TOKEN, MockCityAirServer
+
+pytest.importorskip("pytest_benchmark")
+
+ROUNDS = 5
+LARGE_FLEET_SIZE = 10000
+
+
+def run(benchmark, server, method, *args, **kwargs):
+    result = benchmark.pedantic(method, args, kwargs, rounds=ROUNDS,
+                                iterations=1, warmup_rounds=1)
+    # tracemalloc slows the code down, so memory is measured separately
+    server.requests_count.clear()
+    tracemalloc.start()
+    method(*args, **kwargs)
+    benchmark.extra_info['peak_memory_mb'] = \
+        tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    benchmark.extra_info['requests'] = sum(server.requests_count.values())
+    return result
+
+
+@pytest.mark.benchmark(group="get_devices")
+@pytest.mark.parametrize("format", ['list', 'df', 'dicts'])
+def test_get_devices(benchmark, mock_server, mock_R, format):
+    devices = run(benchmark, mock_server, mock_R.get_devices, format=format)
+    assert len(devices) == mock_server.n_devices
+
+
+@pytest.fixture(scope="module")
+def large_mock_server():
+    with MockCityAirServer(n_devices=LARGE_FLEET_SIZE) as server:
+        yield server
+
+
+@pytest.mark.benchmark(group="get_devices_large_fleet")
+@pytest.mark.parametrize("format", ['list', 'df', 'dicts'])
+@pytest.mark.parametrize("include_children", [False, True])
+def test_get_devices_large_fleet(benchmark, large_mock_server, format,
+                                 include_children):
+    with CAR(MOCK_TOKEN, host_url=large_mock_server.url) as R:
+        R._topology  # not to measure metadata requests
+        devices = run(benchmark, large_mock_server, R.get_devices,
+                      format=format, include_children=include_children)
+    children_count = LARGE_FLEET_SIZE * large_mock_server.n_children
+    assert len(devices) == LARGE_FLEET_SIZE + include_children * \
+        children_count
+
+
+@pytest.mark.benchmark(group="get_device_data")
+@pytest.mark.parametrize("format", ['df', 'dict'])
+def test_get_device_data(benchmark, mock_server, mock_R, format):
+    data = run(benchmark, mock_server, mock_R.get_device_data, 'CA010000',
+               start_date=mock_server.start_date,
+               finish_date=mock_server.finish_date, format=format,
+               verbose=False)
+    df = data if format == 'df' else data['CA010000']
+    assert len(df) == mock_server.packets_count
+
+
+@pytest.mark.benchmark(group="get_device_data_compact")
+@pytest.mark.parametrize("compact", [False, True, 'pyarrow'])
+def test_get_device_data_compact(benchmark, mock_server, mock_R, compact):
+    if compact == 'pyarrow':
+        pytest.importorskip("pyarrow")
+    df = run(benchmark, mock_server, mock_R.get_device_data, 'CA010000',
+             start_date=mock_server.start_date,
+             finish_date=mock_server.finish_date, all_cols=True,
+             verbose=False, compact=compact)
+    benchmark.extra_info['frame_memory_mb'] = \
+        df.memory_usage(deep=True).sum() / 2 ** 20
+
+
+@pytest.mark.benchmark(group="get_stations")
+@pytest.mark.parametrize("format", ['list', 'df', 'dicts'])
+def test_get_stations(benchmark, mock_server, mock_R, format):
+    stations = run(benchmark, mock_server, mock_R.get_stations, format=format)
+    assert len(stations) == mock_server.n_devices
+
+
+@pytest.mark.benchmark(group="get_station_data")
+def test_get_station_data(benchmark, mock_server, mock_R):
+    df = run(benchmark, mock_server, mock_R.get_station_data, 1,
+             start_date=mock_server.start_date,
+             finish_date=mock_server.finish_date, verbose=False)
+    assert isinstance(df, pd.DataFrame) and not df.empty
+
+
+@pytest.mark.benchmark(group="nearest_stations_large_fleet")
+def test_nearest_stations_large_fleet(benchmark, large_mock_server):
+    points_count = 10000
+    latitudes = [54.0 + i * 0.0003 for i in range(points_count)]
+    longitudes = [82.0 + i * 0.0003 for i in range(points_count)]
+    with CAR(MOCK_TOKEN, host_url=large_mock_server.url) as R:
+        R._topology.stations_index  # not to measure building the index
+        df = run(benchmark, large_mock_server, R.nearest_stations,
+                 latitudes, longitudes, k=3)
+    assert len(df) == points_count * 3
@@ -0,0 +1,43 @@
+"""
+Parsing of dates column: utils.to_date applied to every value vs
+vectorized utils.to_dates
+"""
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from cityair_api.utils import to_date, to_dates
+
+pytest.importorskip("pytest_benchmark")
+
+DATES_COUNT = 100000
+
+
+@pytest.fixture(scope="module")
+def dates():
+    start = datetime(2020, 1, 1)
+    return pd.Series([(start + timedelta(minutes=5 * i)).isoformat()
+                      for i in range(DATES_COUNT)])
+
+
+def test_same_result(dates):
+    pd.testing.assert_series_equal(
+            to_dates(dates[:1000]),
+            dates[:1000].apply(to_date).astype('datetime64[ns]'))
+
+
+@pytest.mark.benchmark(group="dates_column")
+def test_to_date_per_value(benchmark, dates):
+    benchmark(dates.apply, to_date)
+
+
+@pytest.mark.benchmark(group="dates_column")
+def test_to_dates(benchmark, dates):
+    benchmark(to_dates, dates)
+
+
+@pytest.mark.benchmark(group="date_scalar")
+@pytest.mark.parametrize("date", ['2020-01-02T03:04:05', '02.01.2020 03:04'])
+def test_to_date(benchmark, date):
+    benchmark(to_date, date)
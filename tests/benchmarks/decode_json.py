@@ -0,0 +1,46 @@
+"""
+Decoding of the device packets response: standard json module vs orjson
+and msgspec (those which are installed), see utils.loads_json
+"""
+import json
+import random
+
+import pytest
+
+from cityair_api.utils import JSON_DECODERS, loads_json
+
+pytest.importorskip("pytest_benchmark")
+
+PACKETS_COUNT = 20000
+VALUES_IDS = [(100, 3), (100, 4), (100, 5),  # main device
+              (101, 1), (101, 2), (102, 1), (102, 2)]  # children
+
+
+def make_response_content(count):
+    rnd = random.Random(0)
+    packets = [{"PacketId": i,
+                "SendDate": f"2020-01-01T00:{i % 60:02}:00",
+                "ServiceData": {"Battery": rnd.randint(0, 100)},
+                "Data": [{"D": device_id, "VT": value_id,
+                          "V": round(rnd.random(), 2)}
+                         for device_id, value_id in VALUES_IDS]}
+               for i in range(count)]
+    return json.dumps({"IsError": False,
+                       "Result": {"Packets": packets}}).encode()
+
+
+@pytest.fixture(scope="module")
+def content():
+    return make_response_content(PACKETS_COUNT)
+
+
+@pytest.mark.parametrize("decoder", JSON_DECODERS)
+def test_same_result(content, decoder):
+    assert loads_json(content, decoder) == json.loads(content)
+
+
+@pytest.mark.benchmark(group="decode_json")
+@pytest.mark.parametrize("decoder", JSON_DECODERS)
+def test_decode_json(benchmark, content, decoder):
+    benchmark.extra_info['size'] = len(content)
+    benchmark(loads_json, content, decoder)
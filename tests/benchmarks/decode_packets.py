@@ -0,0 +1,58 @@
+"""
+Decoding of "Data" arrays of device packets: dict built per packet vs
+columnar utils.decode_values
+"""
+import random
+
+import pandas as pd
+import pytest
+
+from cityair_api.utils import decode_values
+
+pytest.importorskip("pytest_benchmark")
+
+PACKETS_COUNT = 100000
+VALUES_IDS = [(100, 3), (100, 4), (100, 5),  # main device
+              (101, 1), (101, 2), (102, 1), (102, 2)]  # children
+
+
+def make_packets_data(count):
+    rnd = random.Random(0)
+    return [[{"D": device_id, "VT": value_id, "V": round(rnd.random(), 2)}
+             for device_id, value_id in VALUES_IDS] for _ in range(count)]
+
+
+def decode_by_dicts(data):
+    records = []
+    for packets in data:
+        records.append(dict(zip(
+                [f"value {packet['D']} {packet['VT']}" for packet in
+                 packets],
+                [packet['V'] for packet in packets])))
+    return pd.DataFrame.from_records(records)
+
+
+def decode_by_columns(data):
+    values, columns = decode_values(data)
+    return pd.DataFrame(values, columns=[f"value {device_id} {value_id}"
+                                         for device_id, value_id in columns])
+
+
+@pytest.fixture(scope="module")
+def packets_data():
+    return make_packets_data(PACKETS_COUNT)
+
+
+def test_same_result(packets_data):
+    pd.testing.assert_frame_equal(decode_by_dicts(packets_data[:1000]),
+                                  decode_by_columns(packets_data[:1000]))
+
+
+@pytest.mark.benchmark(group="decode_values")
+def test_decode_by_dicts(benchmark, packets_data):
+    benchmark(decode_by_dicts, packets_data)
+
+
+@pytest.mark.benchmark(group="decode_values")
+def test_decode_by_columns(benchmark, packets_data):
+    benchmark(decode_by_columns, packets_data)
@@ -0,0 +1,41 @@
+"""
+Cold start: `import cityair_api` and CityAirRequest in a fresh interpreter,
+heavy dependencies (pandas, numpy, pyarrow) are imported only by the calls
+using them, see cityair_api.lazy
+"""
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+# wall time of the fresh interpreter importing the client, seconds
+IMPORT_BUDGET = 0.5
+
+
+def import_client():
+    subprocess.run([sys.executable, '-c',
+                    'from cityair_api import CityAirRequest'], check=True)
+
+
+def import_pandas():
+    subprocess.run([sys.executable, '-c', 'import pandas'], check=True)
+
+
+@pytest.mark.benchmark(group="import_time")
+def test_import_client(benchmark):
+    benchmark.pedantic(import_client, rounds=5, iterations=1,
+                       warmup_rounds=1)
+    # separate run, so that the budget is checked with --benchmark-disable
+    started = time.perf_counter()
+    import_client()
+    assert time.perf_counter() - started < IMPORT_BUDGET
+
+
+@pytest.mark.benchmark(group="import_time")
+def test_import_pandas(benchmark):
+    # the reference: what every cold start took before
+    benchmark.pedantic(import_pandas, rounds=5, iterations=1,
+                       warmup_rounds=1)
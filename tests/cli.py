@@ -0,0 +1,42 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+import pyarrow.csv  # noqa: E402
+
+from cityair_api.cli import main  # noqa: E402
+from mock_server import MOCK_TOKEN  # noqa: E402
+
+
+def export_args(mock_server, tmp_path, *args):
+    return ['--token', MOCK_TOKEN, '--host', mock_server.url,
+            '--start', mock_server.start_date.isoformat(),
+            '--finish', mock_server.finish_date.isoformat(),
+            '--output', str(tmp_path), '--report-interval', '0', *args]
+
+
+def test_export_csv(mock_server, tmp_path, capsys):
+    serials = ['CA010000', 'CA010001']
+    code = main(export_args(mock_server, tmp_path, '--devices', *serials,
+                            '--stations', '1', '--format', 'csv',
+                            '--workers', '2'))
+    assert code == 0
+    for serial in serials:
+        files = sorted((tmp_path / 'devices' / f"serial_number={serial}")
+                       .glob('day=*/part-*.csv'))
+        assert sum(pyarrow.csv.read_csv(path).num_rows
+                   for path in files) == mock_server.packets_count
+    assert list((tmp_path / 'stations' / 'station_id=1').glob('day=*'))
+    assert 'packets/s' in capsys.readouterr().err
+
+
+def test_no_data(mock_server, tmp_path):
+    args = export_args(mock_server, tmp_path, '--devices', 'CA010000')
+    args[args.index('--start') + 1] = '2001-01-01'
+    args[args.index('--finish') + 1] = '2001-01-02'
+    assert main(args) == 1
+
+
+def test_devices_or_stations_required(mock_server, tmp_path):
+    with pytest.raises(SystemExit):
+        main(export_args(mock_server, tmp_path))
@@ -0,0 +1,20 @@
+import pytest
+
+from cityair_api import CAR
+from cityair_api.metadata import MetadataCache
+from mock_server import MOCK_TOKEN, MockCityAirServer
+
+collect_ignore = ["mock_server.py"]
+
+
+@pytest.fixture(scope="module")
+def mock_server():
+    with MockCityAirServer(n_devices=20) as server:
+        yield server
+
+
+@pytest.fixture()
+def mock_R(mock_server):
+    MetadataCache._memory.clear()
+    with CAR(MOCK_TOKEN, host_url=mock_server.url) as R:
+        yield R
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from cityair_api import ArrowExporter  # noqa: E402
+
+
+@pytest.fixture()
+def exporter(mock_R):
+    return ArrowExporter(mock_R)
+
+
+def test_device_batches(exporter, mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    finish = mock_server.finish_date - timedelta(hours=1)
+    start = finish - timedelta(hours=6)
+    batches = list(exporter.device_batches(serial, start_date=start,
+                                           finish_date=finish))
+    df = mock_R.get_device_data(serial, start_date=start,
+                                finish_date=finish, verbose=False)
+    table = pa.Table.from_batches(batches).to_pandas().set_index('date')
+    pd.testing.assert_frame_equal(table[df.columns], df, check_names=False)
+
+
+def test_export_device(exporter, mock_R, mock_server, tmp_path):
+    serial = mock_R.get_devices()[0]
+    finish = mock_server.finish_date
+    rows_count = exporter.export_device(serial, str(tmp_path),
+                                        start_date=finish - timedelta(days=2),
+                                        finish_date=finish)
+    device_path = tmp_path / f"serial_number={serial}"
+    days = sorted(path.name for path in device_path.iterdir())
+    assert days[-1] == f"day={finish:%Y-%m-%d}"
+    assert len(days) == 3
+    table = pa.parquet.read_table(device_path)
+    assert table.num_rows == rows_count
+
+
+def test_days_closed(exporter, mock_R, mock_server, tmp_path, monkeypatch):
+    from cityair_api import export
+
+    open_writers = set()
+    max_open = []
+
+    class PartWriter(export._PartWriter):
+        def __init__(self, path, *args):
+            super().__init__(path, *args)
+            open_writers.add(self)
+            max_open.append(len(open_writers))
+
+        def close(self):
+            super().close()
+            open_writers.discard(self)
+
+    monkeypatch.setattr(export, '_PartWriter', PartWriter)
+    serial = mock_R.get_devices()[0]
+    finish = mock_server.finish_date
+    batches = list(exporter.device_batches(
+            serial, start_date=finish - timedelta(days=3),
+            finish_date=finish, take_count=100))
+    # a day coming again is written to a new part of it
+    batches.append(batches[0])
+    rows_count = export._write_partitions(iter(batches), str(tmp_path))
+    assert max(max_open[:-1]) <= 2  # the last one is of the repeated day
+    assert not open_writers
+    table = pa.parquet.read_table(tmp_path)
+    assert table.num_rows == rows_count
+    assert rows_count == sum(len(batch) for batch in batches)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from cityair_api import geo
+from cityair_api.geo import SpatialIndex
+
+
+def test_nearest_stations(mock_R):
+    df = mock_R.nearest_stations(55.001, 83.001, k=2)
+    assert list(df['station_id']) == [1, 2]
+    assert df['distance'].iloc[0] < 0.2 < df['distance'].iloc[1]
+
+
+def test_nearest_stations_batched(mock_R):
+    df = mock_R.nearest_stations([55.0, 55.05], [83.0, 83.05], k=3)
+    assert df.index.names == ['point', 'rank']
+    assert list(df.loc[1, 'station_id'])[0] == 6
+    assert all(df.loc[point, 'distance'].is_monotonic_increasing
+               for point in (0, 1))
+
+
+def test_stations_in_bbox(mock_R):
+    assert mock_R.stations_in_bbox(54.995, 82.995, 55.025, 83.025) == \
+        [1, 2, 3]
+    assert mock_R.stations_in_bbox([54.995, 60], [82.995, 0],
+                                   [55.005, 61], [83.005, 1]) == [[1], []]
+
+
+def test_devices_index(mock_R):
+    assert mock_R.nearest_devices(55.0, 83.0)['serial_number'].iloc[0] == \
+        'CA010000'
+    assert mock_R.devices_in_bbox(55.015, 83.015, 55.025, 83.025) == \
+        ['CA010002']
+
+
+@pytest.mark.parametrize("use_scipy", [False, True])
+def test_index_matches_brute_force(monkeypatch, use_scipy):
+    if use_scipy:
+        pytest.importorskip("scipy")
+    else:
+        monkeypatch.setattr(geo, 'spatial', None)
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)
+    index = SpatialIndex(range(500), lat, lon)
+    points_lat, points_lon = rng.uniform(-90, 90, 50), rng.uniform(-180,
+                                                                   180, 50)
+    df = index.nearest(points_lat, points_lon, k=5)
+    for point in range(50):
+        distances = geo.chord_to_km(np.linalg.norm(
+                index.vectors - geo.to_unit_vectors(points_lat[point],
+                                                    points_lon[point]),
+                axis=1))
+        assert list(df.loc[point, 'id']) == list(np.argsort(distances)[:5])
+
+
+def test_bbox_crossing_antimeridian():
+    index = SpatialIndex(['a', 'b', 'c'], [0, 0, 0], [179.5, -179.5, 0])
+    assert index.in_bbox(-1, 179, 1, -179) == ['a', 'b']
@@ -1,6 +1,9 @@
 from datetime import datetime, timedelta
 
-from cityair_api.utils import USELESS_COLS
+import pandas as pd
+import pytest
+
+from cityair_api.utils import USELESS_COLS, compact_df
 
 
 def test_last_packet(R, online_serial_number):
@@ -22,3 +25,82 @@ def test_useless_columns(R, random_serial_number):
                            last_packet_id=0)
     columns = set(df.columns)
     assert not columns.intersection(USELESS_COLS)
+
+
+@pytest.mark.parametrize('offset', [timedelta(0), timedelta(minutes=7)])
+def test_concurrent_windows(mock_R, mock_server, offset):
+    serial = mock_R.get_devices()[0]
+    finish = mock_server.finish_date - offset
+    start = finish - timedelta(days=2)
+    df = mock_R.get_device_data(serial, start_date=start, finish_date=finish,
+                                take_count=100, verbose=False)
+    df_concurrent = mock_R.get_device_data(
+            serial, start_date=start, finish_date=finish, take_count=100,
+            verbose=False, workers=4)
+    pd.testing.assert_frame_equal(df_concurrent, df)
+    first, last = mock_server._indexes(start, finish)
+    assert len(df) == last - first + 1
+
+
+def test_devices_data(mock_R):
+    serials = mock_R.get_devices()[:3]
+    df = mock_R.get_devices_data(serials, take_count=5)
+    assert df.index.names == ['serial_number', 'date']
+    assert set(serials).issubset(df.index.get_level_values('serial_number'))
+    assert all(len(df.loc[serial]) == 5 for serial in serials)
+
+
+def test_iter_device_data(mock_R):
+    serial = mock_R.get_devices()[0]
+    pages = iter(mock_R.iter_device_data(serial, last_packet_id=0,
+                                         take_count=5))
+    first, second = next(pages), next(pages)
+    assert len(first) == len(second) == 5
+    assert first.attrs['last_packet_id'] == 5
+    resumed = next(mock_R.iter_device_data(
+            serial, last_packet_id=first.attrs['last_packet_id'],
+            take_count=5))
+    pd.testing.assert_frame_equal(resumed, second)
+
+
+def test_compact(mock_R):
+    serial = mock_R.get_devices()[0]
+    df = mock_R.get_device_data(serial, take_count=50, last_packet_id=0)
+    compact = mock_R.get_device_data(serial, take_count=50,
+                                     last_packet_id=0, compact=True)
+    assert str(compact.index.dtype) == 'datetime64[ns]'
+    assert all(dtype != 'float64' for dtype in compact.dtypes)
+    assert compact.memory_usage(deep=True).sum() < \
+        df.memory_usage(deep=True).sum()
+    pd.testing.assert_frame_equal(compact, df, check_dtype=False,
+                                  check_index_type=False, rtol=1e-5)
+
+
+def test_compact_strings():
+    df = pd.DataFrame({'status': ['ok', 'ok', 'error', 'ok', 'ok'],
+                       'message': ['a', 'b', 'c', 'd', 'e']})
+    compact = compact_df(df)
+    assert isinstance(compact['status'].dtype, pd.CategoricalDtype)
+    assert not isinstance(compact['message'].dtype, pd.CategoricalDtype)
+    assert compact['status'].tolist() == df['status'].tolist()
+
+
+def test_resample(mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    finish = mock_server.finish_date
+    start = finish - timedelta(days=2)
+    df = mock_R.get_device_data(serial, start_date=start,
+                                finish_date=finish, verbose=False)
+    resampled = mock_R.get_device_data(serial, start_date=start,
+                                       finish_date=finish, period='1h',
+                                       take_count=100, workers=2,
+                                       verbose=False)
+    expected = df.select_dtypes('number').resample('1h').mean()
+    pd.testing.assert_frame_equal(
+            resampled, expected.dropna(how='all')[resampled.columns],
+            check_freq=False, check_names=False)
+    stats = mock_R.get_device_data(serial, start_date=start,
+                                   finish_date=finish, period='1h',
+                                   agg=['min', 'max'], verbose=False)
+    assert (stats.xs('min', axis=1, level=1) <=
+            stats.xs('max', axis=1, level=1)).all().all()
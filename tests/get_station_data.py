@@ -1,5 +1,9 @@
 from datetime import datetime, timedelta
 
+import pandas as pd
+
+from cityair_api import Period
+
 
 def test_last_day(online_station_id, R):
     finish = datetime.now()
@@ -8,3 +12,36 @@ def test_last_day(online_station_id, R):
     df = R.get_station_data(online_station_id, start_date=start,
                             finish_date=finish)
     assert not df.empty
+
+
+def test_stations_data(mock_R, mock_server):
+    station_ids = mock_R.get_stations()[:3]
+    finish = mock_server.finish_date
+    start = finish - timedelta(days=1)
+
+    df = mock_R.get_stations_data(station_ids, start_date=start,
+                                  finish_date=finish)
+    assert df.index.names == ['station_id', 'date']
+    assert set(df.index.get_level_values('station_id')) == set(station_ids)
+    expected = mock_R.get_station_data(station_ids[0], start_date=start,
+                                       finish_date=finish, verbose=False)
+    pd.testing.assert_frame_equal(df.loc[station_ids[0]], expected)
+
+
+def test_resample(mock_R, mock_server):
+    station_id = mock_R.get_stations()[0]
+    finish = mock_server.finish_date
+    start = finish - timedelta(days=2)
+
+    hourly = mock_R.get_station_data(station_id, start_date=start,
+                                     finish_date=finish, period=Period.HOUR,
+                                     verbose=False)
+    df = mock_R.get_station_data(station_id, start_date=start,
+                                 finish_date=finish, period='6h',
+                                 verbose=False)
+    assert not df.empty
+    assert (df.index == df.index.floor('6h')).all()
+    assert df.index.isin(hourly.index.floor('6h')).all()
+    expected = hourly.select_dtypes('number').resample('6h').mean()
+    pd.testing.assert_frame_equal(df, expected[df.columns], rtol=1e-5,
+                                  check_freq=False, check_names=False)
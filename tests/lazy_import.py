@@ -0,0 +1,57 @@
+import json
+import subprocess
+import sys
+
+from mock_server import MOCK_TOKEN
+
+HEAVY_MODULES = ['pandas', 'numpy', 'progressbar', 'pyarrow', 'scipy',
+                 'orjson', 'msgspec', 'aiohttp']
+
+RAW_CALLS = """
+import json, sys
+from cityair_api import CAR
+R = CAR({token!r}, host_url={url!r})
+serial = R.get_devices()[0]
+R.get_stations(format='json')
+R.get_device_data(serial, start_date={start!r}, finish_date={finish!r},
+                  format='json', verbose=False)
+R.get_station_data(1, start_date={start!r}, finish_date={finish!r},
+                   format='json', verbose=False)
+print(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+"""
+
+
+def imported_heavy_modules(code):
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_import_is_lightweight():
+    code = (f"import json, sys\n"
+            f"import cityair_api\n"
+            f"from cityair_api import (ArrowExporter, AsyncCityAirRequest, "
+            f"CityAirRequest, FeedWatcher, PacketsCache, Period)\n"
+            f"print(json.dumps([name for name in {HEAVY_MODULES!r} "
+            f"if name in sys.modules]))")
+    assert imported_heavy_modules(code) == []
+
+
+def test_raw_calls_do_not_import_pandas(mock_server):
+    code = RAW_CALLS.format(
+            token=MOCK_TOKEN, url=mock_server.url,
+            start=mock_server.start_date.isoformat(),
+            finish=(mock_server.start_date + mock_server.step * 100)
+            .isoformat(), heavy=['pandas', 'numpy'])
+    assert imported_heavy_modules(code) == []
+
+
+def test_json_format(mock_R, mock_server):
+    packets = mock_R.get_device_data('CA010000',
+                                     start_date=mock_server.start_date,
+                                     finish_date=mock_server.finish_date,
+                                     format='json', verbose=False)
+    assert len(packets) == mock_server.packets_count
+    assert isinstance(packets[0], dict)
+    assert mock_R.get_devices(format='json')[0]['SerialNumber'] == \
+        'CA010000'
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+import pandas as pd
+
+from cityair_api.utils import parse_checkinfo, parse_checkinfos
+
+
+def test_parse_checkinfos_as_parse_checkinfo():
+    messages = pd.Series(['#CheckInfo#{pm, ok, 0, ""}\n'
+                          '#CheckInfo#{gsm, error, 2, "no, signal"}\n##',
+                          'no records'], index=[10, 20])
+    df = parse_checkinfos(messages)
+    assert list(df.index) == [10, 10]
+    expected = parse_checkinfo('#CheckInfo#{pm, ok, 0, ""}\n'
+                               '#CheckInfo#{gsm, error, 2, "no signal"}\n')
+    assert df['module'].tolist() == [info['module'] for info in expected]
+    assert df['has_error'].tolist() == [False, True]
+    assert df['errors_count'].tolist() == [0, 2]
+
+
+def test_device_logs(mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    finish = mock_server.finish_date
+    logs = mock_R.get_device_logs(serial, start_date=finish - timedelta(
+            hours=10), finish_date=finish, take_count=7, workers=2)
+    assert len(logs) == 22
+    assert logs.index.is_monotonic_increasing
+    packet_logs = mock_R.get_device_logs(
+            serial, start_date=finish - timedelta(hours=10),
+            finish_date=finish, kind='packet')
+    assert len(packet_logs) == 11
+
+
+def test_checkinfos(mock_R, mock_server):
+    serials = mock_R.get_devices()[:4]
+    finish = mock_server.finish_date
+    df = mock_R.get_checkinfos(serials, finish - timedelta(days=1), finish,
+                               take_count=10)
+    assert df.index.names == ['serial_number', 'date']
+    assert set(df.index.unique('serial_number')) == set(serials)
+    assert df['module'].dtype == 'category'
+    summary = mock_R.get_checkinfos(serials, finish - timedelta(days=1),
+                                    finish, format='summary')
+    assert summary.loc[(serials[0], 'gsm'), 'errors'] == 0
+    assert summary.loc[(serials[1], 'gsm'), 'errors'] > 0
+    assert summary.loc[(serials[1], 'pm'), 'checks'] == 25
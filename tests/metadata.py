@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from cityair_api import CAR
+from cityair_api.metadata import MetadataCache
+from mock_server import MOCK_TOKEN
+
+
+def test_metadata_shared_between_processes(mock_R, tmp_path):
+    first = CAR(mock_R.token, host_url=mock_R.host_url,
+                metadata_cache_dir=tmp_path)
+    first._device_by_serial
+    MetadataCache._memory.clear()  # as if it was another process
+    second = CAR(mock_R.token, host_url=mock_R.host_url,
+                 metadata_cache_dir=tmp_path)
+    second._device_by_serial
+    assert len(second.request_metrics) == 0
+    assert second._device_by_serial == first._device_by_serial
+
+
+def test_invalidate_metadata(mock_R):
+    mock_R._device_value_types
+    requests_count = len(mock_R.request_metrics)
+    mock_R.invalidate_metadata()
+    mock_R._device_by_id, mock_R._device_value_types
+    assert len(mock_R.request_metrics) == requests_count + 1
+
+
+def test_metadata_expires(mock_server):
+    R = CAR(MOCK_TOKEN, host_url=mock_server.url,
+            metadata_ttl=timedelta(seconds=1))
+    R.invalidate_metadata()
+    R.get_devices()
+    count = len(R.request_metrics)
+    R.get_devices()
+    assert len(R.request_metrics) == count
+    time.sleep(1.5)
+    R.get_devices()
+    assert len(R.request_metrics) == 2 * count
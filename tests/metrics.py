@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from cityair_api import MetricsAggregator
+
+
+def test_request_and_frame_spans(mock_R, mock_server):
+    metrics = MetricsAggregator()
+    mock_R.hooks.append(metrics)
+    serial = mock_R.get_devices()[0]
+    df = mock_R.get_device_data(
+            serial, start_date=mock_server.finish_date - timedelta(days=1),
+            finish_date=mock_server.finish_date, verbose=False)
+    requests = [span for span in metrics.spans if span['name'] == 'request']
+    packets = [span for span in requests if span.get('packets')]
+    assert packets and all(span['size'] > 0 and span['filter_type'] == 1
+                           for span in packets)
+    frames = [span for span in metrics.spans if span['name'] == 'frame']
+    assert frames[0]['packets'] >= len(df) > 0
+    summary = metrics.summary()
+    assert summary.loc[('request', 'DevicesApi2/GetPackets'), 'packets'] \
+        == frames[0]['packets']
+    assert 'GetPackets' in str(metrics)
+
+
+def test_failing_hook(mock_R, mock_server, caplog):
+    def hook(record):
+        raise RuntimeError("broken hook")
+
+    metrics = MetricsAggregator()
+    mock_R.hooks.extend([hook, metrics])
+    assert mock_R.get_devices()
+    assert metrics.spans
+    assert "broken hook" in caplog.text
@@ -0,0 +1,298 @@
+"""
+Local stand-in for the CityAir backend.
+
+Serves a synthetic fleet over http so that the client can be exercised and
+benchmarked without access to my.cityair.io
+"""
+import gzip
+import json
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MOCK_TOKEN = "00000000-0000-0000-0000-000000000000"
+
+DEVICE_VALUE_TYPES = {1: 'PM2.5', 2: 'PM10', 3: 'Temperature', 4: 'Humidity',
+                      5: 'Pressure', 6: 'CO', 7: 'NO2'}
+STATION_VALUE_TYPES = {1: 'PM2.5', 2: 'PM10', 3: 'T', 4: 'RH', 5: 'P'}
+INTERVALS = {1: timedelta(minutes=5), 2: timedelta(minutes=20),
+             3: timedelta(hours=1), 4: timedelta(days=1)}
+LOCATIONS = ['Novosibirsk', 'Moscow', 'Yekaterinburg']
+
+
+def _format_date(date):
+    return date.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _parse_date(date):
+    return datetime.fromisoformat(date).replace(tzinfo=None)
+
+
+def _value(*seed):
+    return round(50 + 30 * math.sin(hash(seed) % 1000), 2)
+
+
+class MockCityAirServer:
+    """
+    Synthetic CityAir backend
+
+    Every main device "CA01xxxx" has `n_children` child devices and sends a
+    packet every `step` from `start` till `finish`. Every main device is
+    linked to its own station. If `max_take` is passed, pages of packets
+    are capped at it whatever Take is requested.
+    """
+
+    def __init__(self, n_devices=5, n_children=2, start=datetime(2020, 1, 1),
+                 finish=datetime(2020, 1, 15), step=timedelta(minutes=5),
+                 latency=0.0, token=MOCK_TOKEN, max_take=None):
+        self.n_devices = n_devices
+        self.n_children = n_children
+        self.start_date = start
+        self.finish_date = finish
+        self.step = step
+        self.log_step = timedelta(hours=1)
+        self.latency = latency
+        self.token = token
+        self.max_take = max_take
+        self.requests_count = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.devices = self._build_devices()
+
+    @property
+    def packets_count(self):
+        return int((self.finish_date - self.start_date) / self.step) + 1
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/request.php?map="
+
+    def _build_devices(self):
+        devices = []
+        for i in range(self.n_devices):
+            device_id = (i + 1) * 100
+            children = [{"Id": device_id + j + 1,
+                         "DeviceId": device_id + j + 1,
+                         "SerialNumber": f"G{j + 1}{i:06d}",
+                         "SoftwareVersion": "1.0",
+                         "Description": None}
+                        for j in range(self.n_children)]
+            devices.append({
+                    "DeviceId": device_id,
+                    "SerialNumber": f"CA01{i:04d}",
+                    "DeviceName": f"device {i}",
+                    "SoftwareVersion": "2.1",
+                    "IsOffline": i % 4 == 3,
+                    "DeviceFirstDate": _format_date(self.start_date),
+                    "DeviceLastDate": _format_date(self.finish_date),
+                    "DeviceLastGeo": {"Latitude": 55.0 + i * 0.01,
+                                      "Longitude": 83.0 + i * 0.01},
+                    "DataDeliveryPeriodSec": int(self.step.total_seconds()),
+                    "DeviceCheckInfos": [],
+                    "TagIds": [],
+                    "SourceType": 1,
+                    "ChildDevices": children,
+                    })
+        return devices
+
+    # requests handling
+
+    def devices_handler(self, body):
+        return {"Devices": self.devices,
+                "PacketsValueTypes": [
+                        {"ValueType": vt, "TypeName": name}
+                        for vt, name in DEVICE_VALUE_TYPES.items()]}
+
+    def _packet(self, device, i):
+        date = self.start_date + i * self.step
+        data = [{"D": device["DeviceId"], "VT": vt,
+                 "V": _value(device["DeviceId"], vt, i)} for vt in (3, 4, 5)]
+        for child in device["ChildDevices"]:
+            data += [{"D": child["DeviceId"], "VT": vt,
+                      "V": _value(child["DeviceId"], vt, i)} for vt in (1, 2)]
+        return {"PacketId": i + 1, "SendDate": _format_date(date),
+                "RecvDate": _format_date(date + timedelta(seconds=5)),
+                "ServiceData": {"GsmRssi": -70, "BatLow": False,
+                                "Ps220": True,
+                                "Geo": {"Latitude": 55.0,
+                                        "Longitude": 83.0}},
+                "Data": data, "DataJson": None}
+
+    def _indexes(self, begin, end):
+        first = max(0, math.ceil((begin - self.start_date) / self.step))
+        last = min(self.packets_count - 1,
+                   math.floor((end - self.start_date) / self.step))
+        return first, last
+
+    def packets_handler(self, body):
+        filter_ = body["Filter"]
+        device = next((d for d in self.devices
+                       if d["DeviceId"] == filter_["DeviceId"]), None)
+        if device is None:
+            return None
+        take = min(filter_.get("Take", 500), self.max_take or math.inf)
+        if filter_["FilterType"] == 1:
+            first, last = self._indexes(_parse_date(filter_["TimeBegin"]),
+                                        _parse_date(filter_["TimeEnd"]))
+            indexes = range(first, min(last + 1, first + take))
+        elif filter_["FilterType"] == 2:
+            first = filter_["LastPacketId"]
+            indexes = range(first, min(self.packets_count, first + take))
+        else:
+            last = self.packets_count - filter_.get("Skip", 0)
+            indexes = range(max(0, last - take), last)
+        return {"Packets": [self._packet(device, i) for i in indexes]}
+
+    def stations_handler(self, body):
+        return {
+                "Locations": [{"LocationId": i + 1, "Name": name,
+                               "NameRu": name, "GmtOffset": 0}
+                              for i, name in enumerate(LOCATIONS)],
+                "MoItems": [{"MoId": i + 1,
+                             "Name": f"station {i}",
+                             "PublishName": f"station {i}",
+                             "PublishNameRu": f"станция {i}",
+                             "LocationId": i % len(LOCATIONS) + 1,
+                             "GmtOffset": 0,
+                             "IsOffline": device["IsOffline"],
+                             "DotItem": {"Latitude": 55.0 + i * 0.01,
+                                         "Longitude": 83.0 + i * 0.01},
+                             "DeviceLink": {"DeviceId": device["DeviceId"]},
+                             "ManualDeviceLinks": []}
+                            for i, device in enumerate(self.devices)],
+                "Devices": [{"DeviceId": device["DeviceId"],
+                             "SerialNumber": device["SerialNumber"]}
+                            for device in self.devices],
+                "PacketValueTypes": [
+                        {"ValueType": vt, "TypeName": name}
+                        for vt, name in STATION_VALUE_TYPES.items()]}
+
+    def station_packets_handler(self, body):
+        filter_ = body["Filter"]
+        station_id = filter_["MoId"]
+        if not 0 < station_id <= self.n_devices:
+            return None
+        step = INTERVALS[filter_.get("IntervalType", 2)]
+        begin = _parse_date(filter_["BeginTime"])
+        end = min(_parse_date(filter_["EndTime"]), self.finish_date)
+        offset = (begin - self.start_date) % step
+        date = max(begin if not offset else begin - offset + step,
+                   self.start_date)
+        packets = []
+        while date <= end and len(packets) < filter_.get("TakeCount", 1000):
+            i = int((date - self.start_date) / step)
+            packets.append({"SendDate": _format_date(date),
+                            "Data": [{"VT": vt, "V": _value(station_id, vt,
+                                                            i, step)}
+                                     for vt in STATION_VALUE_TYPES]})
+            date += step
+        return {"Packets": packets}
+
+    def _log_items(self, serial, begin, end):
+        """
+        Every hour a device logs CheckInfo of its modules (gsm module of
+        every other device has errors) and a packet message
+        """
+        i = int(serial[4:])
+        date = max(begin, self.start_date)
+        date += (self.start_date - date) % self.log_step
+        while date <= min(end, self.finish_date):
+            hour = int((date - self.start_date) / self.log_step)
+            errors = hour % 3 if i % 2 else 0
+            status = "error" if errors else "ok"
+            yield {"LogItemId": hour * 2, "TimeStamp": _format_date(date),
+                   "Message": f"{serial} CheckInfo #CheckInfo#{{pm, ok, 0, "
+                              f"\"\"}}\n#CheckInfo#{{gsm, {status}, "
+                              f"{errors}, \"no signal\"}}\n##"}
+            yield {"LogItemId": hour * 2 + 1, "TimeStamp": _format_date(date),
+                   "Message": f"{serial} PT #PT#{hour}##"}
+            date += self.log_step
+
+    def logs_handler(self, body):
+        filter_ = body["Filter"]
+        serial, _, suffix = filter_["FilterText"].partition(" ")
+        if not any(d["SerialNumber"] == serial for d in self.devices):
+            return None
+        items = [item for item in self._log_items(
+                serial, _parse_date(filter_["BeginTime"]),
+                _parse_date(filter_["EndTime"]))
+                 if not suffix or f" {suffix} " in item["Message"]]
+        skip = filter_.get("Skip", 0)
+        return {"LogItems": items[skip:skip + filter_.get("Take", 1000)]}
+
+    HANDLERS = {
+            "DevicesApi2/GetDevices": "devices_handler",
+            "DevicesApi2/GetPackets": "packets_handler",
+            "MoApi2/GetMoItems": "stations_handler",
+            "MoApi2/GetMoPackets": "station_packets_handler",
+            "LoggerApi/GetLogItems": "logs_handler",
+            "LoggerApi/GetFullLogItems": "logs_handler",
+            }
+
+    def handle(self, method, body):
+        with self._lock:
+            self.requests_count[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if body.get("Token") != self.token:
+            return {"IsError": True,
+                    "ErrorMessage": f"Token={body.get('Token')} is not found"}
+        handler = self.HANDLERS.get(method)
+        if handler is None:
+            return {"IsError": True, "ErrorMessage": f"Unknown map {method}"}
+        result = getattr(self, handler)(body)
+        if result is None:
+            return {"IsError": True, "ErrorMessage": "Access denied"}
+        return {"IsError": False, "Result": result}
+
+    # server lifecycle
+
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                method = parse_qs(urlparse(self.path).query)["map"][0]
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                content = json.dumps(
+                        mock.handle(method.strip("/"), body)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    content = gzip.compress(content, compresslevel=1)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+                with mock._lock:
+                    mock.bytes_sent += len(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from cityair_api import CAR, PacketsCache
+
+
+@pytest.fixture()
+def cache(mock_R, tmp_path):
+    return PacketsCache(mock_R, cache_dir=str(tmp_path))
+
+
+def test_incremental_sync(cache, mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    start = mock_server.finish_date - timedelta(hours=6)
+    assert cache.sync_device(serial, start_date=start) > 0
+    last_packet_id, _ = cache._bounds('device', serial)
+    assert last_packet_id == mock_server.packets_count
+    assert cache.sync_device(serial) == 0
+
+
+def test_device_data_from_cache(cache, mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    finish = mock_server.finish_date - timedelta(hours=1)
+    start = finish - timedelta(hours=6)
+    df = cache.get_device_data(serial, start_date=start, finish_date=finish)
+    pd.testing.assert_frame_equal(df, mock_R.get_device_data(
+            serial, start_date=start, finish_date=finish, verbose=False))
+
+
+def test_token_databases(cache, mock_R, tmp_path):
+    with CAR('another token', host_url=mock_R.host_url) as R:
+        assert PacketsCache(R, cache_dir=str(tmp_path)).path != cache.path
+
+
+def test_evict_on_read(cache, mock_R, mock_server):
+    serials = mock_R.get_devices()[:2]
+    start = mock_server.finish_date - timedelta(hours=6)
+    counts = [cache.sync_device(serial, start_date=start)
+              for serial in serials]
+    cache.max_packets = counts[1]
+    cache.get_device_data(serials[1], start_date=start, sync=False)
+    assert cache._bounds('device', serials[0]) == (None, None)
+    assert cache._bounds('device', serials[1])[0] is not None
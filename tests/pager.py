@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+import pytest
+
+from cityair_api import CAR
+from cityair_api.exceptions import EmptyDataException, TimeoutException
+from cityair_api.utils import Pager, iter_pages, iter_pages_by_id
+from mock_server import MOCK_TOKEN, MockCityAirServer
+
+
+def test_adaptive_take_count(mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    pager = Pager(mock_server.start_date, mock_server.finish_date,
+                  take_count=100)
+    pages = list(iter_pages(
+            lambda **kwargs: mock_R._get_device_packets(serial, **kwargs),
+            pager))
+    assert len(pages[-2]) > len(pages[0]) == 100
+
+
+def test_shrink_on_timeout(mock_server):
+    def fetch(take_count, **kwargs):
+        if take_count > 200:
+            raise TimeoutException('url', 1)
+        return []
+
+    pager = Pager(mock_server.start_date, mock_server.finish_date,
+                  take_count=800)
+    assert list(iter_pages(fetch, pager)) == []
+    assert pager.take_count == 200
+    with pytest.raises(TimeoutException):
+        list(iter_pages(fetch, Pager(mock_server.start_date,
+                                     take_count=800, adaptive=False)))
+
+
+def test_empty_first_page_stops_paging(mock_R, mock_server):
+    serial = mock_R.get_devices()[0]
+    requests_count = len(mock_R.request_metrics)
+    start = mock_server.finish_date + timedelta(days=1)
+    with pytest.raises(EmptyDataException):
+        mock_R.get_device_data(serial, start_date=start,
+                               finish_date=start + timedelta(days=365),
+                               verbose=False)
+    assert len(mock_R.request_metrics) == requests_count + 1
+
+
+def test_server_capped_take_count():
+    with MockCityAirServer(n_devices=1, max_take=300) as server, \
+            CAR(MOCK_TOKEN, host_url=server.url) as R:
+        serial = R.get_devices()[0]
+        pager = Pager(server.start_date, server.finish_date,
+                      take_count=100)
+        pages = list(iter_pages(
+                lambda **kwargs: R._get_device_packets(serial, **kwargs),
+                pager))
+    assert pager.take_count > server.max_take
+    assert sum(map(len, pages)) == server.packets_count
+
+
+def test_server_capped_pages_by_id():
+    with MockCityAirServer(n_devices=1, max_take=300) as server, \
+            CAR(MOCK_TOKEN, host_url=server.url) as R:
+        serial = R.get_devices()[0]
+        pages = list(iter_pages_by_id(
+                lambda **kwargs: R._get_device_packets(serial, **kwargs),
+                take_count=500))
+    assert len(pages[0]) == server.max_take
+    assert sum(map(len, pages)) == server.packets_count
@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from cityair_api import CAR
+from cityair_api.utils import SingleFlight
+from mock_server import MOCK_TOKEN
+
+
+def test_concurrent_calls_merged():
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return [1, 2, 3]
+
+    flight = SingleFlight()
+    with ThreadPoolExecutor(5) as pool:
+        leader = pool.submit(flight.do, 'key', slow)
+        started.wait()
+        followers = [pool.submit(flight.do, 'key', slow) for _ in range(4)]
+        results = [leader.result()] + [f.result() for f in followers]
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    flight.do('key', slow)  # not memoized without ttl
+    assert len(calls) == 2
+
+
+def test_exception_shared():
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("failed")
+
+    flight = SingleFlight()
+    with ThreadPoolExecutor(3) as pool:
+        leader = pool.submit(flight.do, 'key', failing)
+        started.wait()
+        followers = [pool.submit(flight.do, 'key', failing)
+                     for _ in range(2)]
+        for future in [leader] + followers:
+            assert isinstance(future.exception(), ValueError)
+    assert not flight._calls
+    assert flight.do('key', lambda: 1) == 1
+
+
+def test_memo_size():
+    flight = SingleFlight(ttl=timedelta(minutes=1), maxsize=2)
+    for key in 'abc':
+        flight.do(key, lambda: key)
+    assert flight.do('c', lambda: None) == 'c'
+    assert flight.do('a', lambda: None) is None  # evicted
+
+
+def test_memoized_requests(mock_server):
+    with CAR(MOCK_TOKEN, host_url=mock_server.url,
+             memo_ttl=timedelta(minutes=1)) as R:
+        serial = R.get_devices()[0]
+        count = len(R.request_metrics)
+        first = R.get_device_data(serial, take_count=5)
+        second = R.get_device_data(serial, take_count=5)
+        assert len(R.request_metrics) == count + 1
+        assert first.equals(second)
+
+
+def test_memoized_json_copied(mock_server):
+    with CAR(MOCK_TOKEN, host_url=mock_server.url,
+             memo_ttl=timedelta(minutes=1)) as R:
+        serial = R.get_devices()[0]
+        first = R.get_device_data(serial, take_count=5, format='json')
+        first.clear()
+        second = R.get_device_data(serial, take_count=5, format='json')
+        assert len(second) == 5
+
+
+def test_invalidate_metadata_drops_memo(mock_server):
+    with CAR(MOCK_TOKEN, host_url=mock_server.url,
+             memo_ttl=timedelta(minutes=1)) as R:
+        R.invalidate_metadata()
+        R.get_devices()
+        count = len(R.request_metrics)
+        assert count
+        R.get_devices(refresh=True)
+        assert len(R.request_metrics) == 2 * count
+        R.invalidate_metadata()
+        R.get_devices()
+        assert len(R.request_metrics) == 3 * count
@@ -0,0 +1,30 @@
+def test_listings_share_one_snapshot(mock_R, mock_server):
+    mock_server.requests_count.clear()
+    devices = mock_R.get_devices(format='dicts')
+    stations = mock_R.get_stations(format='dicts')
+    locations = mock_R.get_locations()
+    assert mock_server.requests_count == {'DevicesApi2/GetDevices': 1,
+                                          'MoApi2/GetMoItems': 1}
+    assert len(devices) == len(stations) == mock_server.n_devices
+    assert all(device['stations'] for device in devices)
+    assert sum(len(location['stations'] or [])
+               for location in locations) == len(stations)
+
+
+def test_topology_indexes(mock_R):
+    topology = mock_R._topology
+    parent = mock_R.get_devices()[0]
+    children = topology.children_by_parent[parent]
+    assert children and all(topology.parent_by_child[child] == parent
+                            for child in children)
+    station_id = topology.stations_by_device[parent][0]
+    assert topology.devices_by_station[station_id] == [parent] + children
+    assert station_id in topology.stations_by_location[
+        topology.stations[station_id]['location']]
+
+
+def test_refresh(mock_R, mock_server):
+    mock_R.get_devices()
+    mock_server.requests_count.clear()
+    mock_R.get_devices(refresh=True)
+    assert mock_server.requests_count['DevicesApi2/GetDevices'] == 1
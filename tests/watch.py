@@ -0,0 +1,22 @@
+from cityair_api import FeedWatcher
+
+
+def test_poll_new_packets_only(mock_R, mock_server):
+    serials = mock_R.get_devices()[:3]
+    watcher = FeedWatcher(mock_R, serial_numbers=serials, backfill=2)
+    first = watcher.poll()
+    assert [feed for feed, _ in first] == [('device', serial)
+                                           for serial in serials]
+    assert all(len(df) == 2 for _, df in first)
+    assert watcher.poll() == []  # not due yet
+    assert watcher.poll(force=True) == []  # no new packets
+
+    finish_date = mock_server.finish_date
+    mock_server.finish_date += 3 * mock_server.step
+    try:
+        updates = watcher.poll(force=True)
+    finally:
+        mock_server.finish_date = finish_date
+    assert all(len(df) == 3 and df.index.min() > first_df.index.max()
+               for (_, df), (_, first_df) in zip(updates, first))
+    assert len(updates) == len(serials)